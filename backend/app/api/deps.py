@@ -0,0 +1,33 @@
+"""
+Dependencias compartidas por los routers de la API.
+"""
+from fastapi import Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.db.session import get_db
+from app import crud
+from app.models.mood import Usuario
+
+
+def valid_usuario(usuario_id: int, db: Session = Depends(get_db)) -> Usuario:
+    """
+    Resuelve el usuario del path o responde 404.
+
+    Usa crud.get_usuario, que ya está cacheado en memoria (usuario_cache),
+    así que las requests repetidas sobre el mismo usuario no tocan la BD.
+    """
+    usuario = crud.get_usuario(db, usuario_id=usuario_id)
+    if usuario is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    return usuario
+
+
+def require_usuario(usuario_id: int, db: Session = Depends(get_db)) -> None:
+    """
+    Responde 404 si el usuario del path no existe.
+
+    Para endpoints que solo necesitan validar existencia: consulta el id
+    sin cargar la fila completa.
+    """
+    if not crud.usuario_exists(db, usuario_id=usuario_id):
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
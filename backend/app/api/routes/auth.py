@@ -228,7 +228,12 @@ async def get_current_user(
         )
 
     # Obtener estados de ánimo del usuario
-    estados_animo = crud.get_estados_animo_by_usuario(db, usuario_id=usuario_id, limit=100)
+    estados_animo = crud.get_estados_animo_by_usuario(
+        db,
+        usuario_id=usuario_id,
+        limit=100,
+        fields=[EstadoAnimo.timestamp, EstadoAnimo.nivel, EstadoAnimo.notas_texto],
+    )
     moods = [
         {
             "timestamp": estado.timestamp.isoformat() if estado.timestamp else None,
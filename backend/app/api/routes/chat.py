@@ -3,6 +3,8 @@ Endpoints para simular conversaciones con Loki.
 Útil para testing sin necesidad de WhatsApp.
 """
 
+from datetime import datetime
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
@@ -285,21 +287,37 @@ async def reset_conversation(
 
 
 @router.get("/history/{usuario_id}")
-async def get_chat_history(usuario_id: int, limit: int = 20, db: Session = Depends(get_db)):
+async def get_chat_history(
+    usuario_id: int,
+    limit: int = 20,
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
     """
     Obtiene el historial de conversaciones de un usuario.
+    
+    Pagina por keyset: ``next_before`` y ``next_before_id`` son el cursor
+    (before, before_id) para pedir la página siguiente (None si no hay más).
     """
+    if (before is None) != (before_id is None):
+        raise HTTPException(status_code=422, detail="before y before_id van juntos")
+    
     usuario = crud.get_usuario(db, usuario_id=usuario_id)
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
     conversaciones = crud.get_conversaciones_by_usuario(
-        db, usuario_id=usuario_id, limit=limit
+        db, usuario_id=usuario_id, limit=limit,
+        before=(before, before_id) if before is not None else None
     )
+    last = conversaciones[-1] if len(conversaciones) == limit else None
     
     return {
         "usuario": usuario.nombre,
         "total_conversaciones": len(conversaciones),
+        "next_before": last.timestamp if last else None,
+        "next_before_id": last.id if last else None,
         "conversaciones": [
             {
                 "timestamp": conv.timestamp,
@@ -4,16 +4,26 @@ Sistema de mejora continua de Loki basado en feedback del usuario.
 """
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from datetime import datetime
+import re
+import orjson
 
+from app.core.logging_config import get_logger
 from app.db.session import get_db
+from app.api.deps import valid_usuario, require_usuario
 from app import crud
-from app.models.mood import FeedbackRespuesta, RespuestaExitosa, ConversacionContexto
+from app.models.mood import Usuario, FeedbackRespuesta, RespuestaExitosa, ConversacionContexto
 from app.services.nlp_service import nlp_service
+from app.core.caching import (
+    respuestas_exitosas_cache, invalidate_respuestas_exitosas_cache, stats
+)
 
-router = APIRouter()
+logger = get_logger(__name__)
+router = APIRouter(default_response_class=ORJSONResponse)
 
 
 class FeedbackSubmission(BaseModel):
@@ -30,20 +40,43 @@ class RespuestaExitosaCreate(BaseModel):
     respuesta_efectiva: str
 
 
+# Palabras clave de patrones (el orden define la prioridad)
+PATTERN_KEYWORDS = {
+    'ansiedad': ['ansiedad', 'ansioso', 'nervioso'],
+    'tristeza': ['triste', 'deprimido', 'depresión'],
+    'trabajo': ['trabajo', 'laboral', 'jefe'],
+    'relaciones': ['pareja', 'familia', 'amigos'],
+    'estrés': ['estrés', 'presión', 'agobiado'],
+    'sueño': ['dormir', 'sueño', 'cansado'],
+    'motivación': ['motivación', 'apatía', 'ganas'],
+    'autoestima': ['autoestima', 'confianza', 'capaz'],
+}
+
+_PATTERN_NAMES = list(PATTERN_KEYWORDS)
+_KEYWORD_PRIORITY = {
+    keyword: priority
+    for priority, keywords in enumerate(PATTERN_KEYWORDS.values())
+    for keyword in keywords
+}
+# Lookahead para detectar coincidencias solapadas en un único escaneo
+_PATTERN_KEYWORDS_RE = re.compile(
+    '(?=(' + '|'.join(
+        re.escape(keyword) for keyword in sorted(_KEYWORD_PRIORITY, key=len, reverse=True)
+    ) + '))'
+)
+
+
 @router.post("/api/v1/feedback/submit")
 async def submit_feedback(
     usuario_id: int,
     feedback: FeedbackSubmission,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    usuario: Usuario = Depends(valid_usuario)
 ):
     """
     Registra feedback sobre una respuesta de Loki.
     Usa el feedback para mejorar respuestas futuras.
     """
-    usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
     try:
         # Crear registro de feedback
         new_feedback = FeedbackRespuesta(
@@ -92,15 +125,18 @@ async def submit_feedback(
 
         db.commit()
 
+        # Las respuestas exitosas pueden haber cambiado
+        invalidate_respuestas_exitosas_cache(usuario_id)
+
         return {
             'status': 'success',
             'mensaje': 'Feedback registrado correctamente',
             'feedback_id': new_feedback.id
         }
 
-    except Exception as e:
+    except Exception:
         db.rollback()
-        print(f"⚠️ Error registrando feedback: {e}")
+        logger.exception("Error registrando feedback (usuario_id=%s)", usuario_id)
         raise HTTPException(
             status_code=500,
             detail="Error al registrar feedback"
@@ -110,22 +146,28 @@ async def submit_feedback(
 @router.get("/api/v1/feedback/{usuario_id}/respuestas-exitosas")
 async def get_respuestas_exitosas(
     usuario_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    usuario: Usuario = Depends(valid_usuario)
 ):
     """
     Obtiene las respuestas exitosas aprendidas para este usuario.
     Útil para mejorar prompting futuro.
     """
-    usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    # Servir desde cache si la respuesta ya fue construida
+    try:
+        cached = respuestas_exitosas_cache[usuario_id]
+    except KeyError:
+        stats['respuestas_exitosas'].miss()
+    else:
+        stats['respuestas_exitosas'].hit()
+        return ORJSONResponse(cached)
 
     try:
         respuestas = db.query(RespuestaExitosa).filter(
             RespuestaExitosa.usuario_id == usuario_id
         ).order_by(RespuestaExitosa.utilidad_promedio.desc()).all()
 
-        return {
+        response = {
             'usuario': usuario.nombre,
             'respuestas_exitosas': [
                 {
@@ -140,8 +182,10 @@ async def get_respuestas_exitosas(
             ],
             'total': len(respuestas)
         }
-    except Exception as e:
-        print(f"⚠️ Error obteniendo respuestas exitosas: {e}")
+        respuestas_exitosas_cache[usuario_id] = response
+        return ORJSONResponse(response)
+    except Exception:
+        logger.exception("Error obteniendo respuestas exitosas (usuario_id=%s)", usuario_id)
         raise HTTPException(
             status_code=500,
             detail="Error al obtener respuestas exitosas"
@@ -152,58 +196,69 @@ async def get_respuestas_exitosas(
 async def get_feedback_history(
     usuario_id: int,
     limit: int = 20,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    usuario: Usuario = Depends(valid_usuario)
 ):
     """
     Obtiene el historial de feedback del usuario.
     """
-    usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
     try:
         feedbacks = db.query(FeedbackRespuesta).filter(
             FeedbackRespuesta.usuario_id == usuario_id
         ).order_by(FeedbackRespuesta.timestamp.desc()).limit(limit).all()
 
-        return {
+        return ORJSONResponse({
             'usuario': usuario.nombre,
-            'feedbacks': [
-                {
-                    'id': f.id,
-                    'mensaje': f.mensaje_usuario,
-                    'respuesta': f.respuesta_loki,
-                    'rating': f.utilidad_rating,
-                    'ayudo': f.ayudo,
-                    'notas': f.notas_feedback,
-                    'timestamp': f.timestamp
-                }
-                for f in feedbacks
-            ],
+            'feedbacks': [_feedback_to_dict(f) for f in feedbacks],
             'total': len(feedbacks),
             'promedio_utilidad': _calculate_avg_rating(feedbacks)
-        }
-    except Exception as e:
-        print(f"⚠️ Error obteniendo historial: {e}")
+        })
+    except Exception:
+        logger.exception("Error obteniendo historial (usuario_id=%s)", usuario_id)
         raise HTTPException(
             status_code=500,
             detail="Error al obtener historial de feedback"
         )
 
 
+@router.get(
+    "/api/v1/feedback/{usuario_id}/export",
+    dependencies=[Depends(require_usuario)],
+)
+async def export_feedback_history(usuario_id: int, db: Session = Depends(get_db)):
+    """
+    Exporta el historial completo de feedback como NDJSON (una fila por línea).
+    Las filas se leen de la BD por lotes, sin cargar todo el historial en memoria.
+    """
+    # La sesión del request se cierra antes de enviar el body, así que el
+    # stream abre una propia sobre el mismo engine
+    bind = db.get_bind()
+
+    def generate():
+        stream_db = Session(bind=bind, autoflush=False)
+        try:
+            stmt = select(FeedbackRespuesta).where(
+                FeedbackRespuesta.usuario_id == usuario_id
+            ).order_by(FeedbackRespuesta.timestamp.desc()).execution_options(yield_per=500)
+
+            for f in stream_db.execute(stmt).scalars():
+                yield orjson.dumps(_feedback_to_dict(f)) + b"\n"
+        finally:
+            stream_db.close()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
 @router.get("/api/v1/feedback/{usuario_id}/estadisticas")
 async def get_feedback_statistics(
     usuario_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    usuario: Usuario = Depends(valid_usuario)
 ):
     """
     Obtiene estadísticas de feedback del usuario.
     Helpful para entender qué funciona bien.
     """
-    usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
     try:
         feedbacks = db.query(FeedbackRespuesta).filter(
             FeedbackRespuesta.usuario_id == usuario_id
@@ -233,8 +288,8 @@ async def get_feedback_statistics(
                 RespuestaExitosa.usuario_id == usuario_id
             ).count()
         }
-    except Exception as e:
-        print(f"⚠️ Error calculando estadísticas: {e}")
+    except Exception:
+        logger.exception("Error calculando estadísticas (usuario_id=%s)", usuario_id)
         raise HTTPException(
             status_code=500,
             detail="Error al calcular estadísticas"
@@ -246,25 +301,31 @@ def _extract_question_pattern(mensaje: str) -> str:
     Extrae un patrón simplificado de la pregunta/mensaje.
     Ej: "¿Cómo puedo manejar la ansiedad?" -> "ansiedad"
     """
-    # Palabras clave de patrones
-    pattern_keywords = {
-        'ansiedad': ['ansiedad', 'ansioso', 'nervioso'],
-        'tristeza': ['triste', 'deprimido', 'depresión'],
-        'trabajo': ['trabajo', 'laboral', 'jefe'],
-        'relaciones': ['pareja', 'familia', 'amigos'],
-        'estrés': ['estrés', 'presión', 'agobiado'],
-        'sueño': ['dormir', 'sueño', 'cansado'],
-        'motivación': ['motivación', 'apatía', 'ganas'],
-        'autoestima': ['autoestima', 'confianza', 'capaz'],
-    }
-
     mensaje_lower = mensaje.lower()
 
-    for pattern, keywords in pattern_keywords.items():
-        if any(keyword in mensaje_lower for keyword in keywords):
-            return pattern
-
-    return 'general'
+    # Una sola pasada sobre el mensaje; gana el patrón declarado primero
+    best = None
+    for match in _PATTERN_KEYWORDS_RE.finditer(mensaje_lower):
+        priority = _KEYWORD_PRIORITY[match.group(1)]
+        if best is None or priority < best:
+            best = priority
+            if best == 0:
+                break
+
+    return _PATTERN_NAMES[best] if best is not None else 'general'
+
+
+def _feedback_to_dict(f: FeedbackRespuesta) -> dict:
+    """Serializa un feedback para las respuestas de historial/export."""
+    return {
+        'id': f.id,
+        'mensaje': f.mensaje_usuario,
+        'respuesta': f.respuesta_loki,
+        'rating': f.utilidad_rating,
+        'ayudo': f.ayudo,
+        'notas': f.notas_feedback,
+        'timestamp': f.timestamp
+    }
 
 
 def _calculate_avg_rating(feedbacks: list) -> float:
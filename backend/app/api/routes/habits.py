@@ -3,27 +3,30 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
+from app.api.deps import require_usuario
 from app import crud, schemas
 
 router = APIRouter()
 
 
 # ===== Endpoints para Hábitos =====
-@router.post("/usuarios/{usuario_id}/habitos/", response_model=schemas.Habito)
+@router.post(
+    "/usuarios/{usuario_id}/habitos/",
+    response_model=schemas.Habito,
+    dependencies=[Depends(require_usuario)],
+)
 def create_habito_for_usuario(
     usuario_id: int, habito: schemas.HabitoCreate, db: Session = Depends(get_db)
 ):
-    db_usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if db_usuario is None:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return crud.create_habito(db=db, habito=habito, usuario_id=usuario_id)
 
 
-@router.get("/usuarios/{usuario_id}/habitos/", response_model=List[schemas.Habito])
+@router.get(
+    "/usuarios/{usuario_id}/habitos/",
+    response_model=List[schemas.Habito],
+    dependencies=[Depends(require_usuario)],
+)
 def read_habitos(usuario_id: int, activo: bool = None, db: Session = Depends(get_db)):
-    db_usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if db_usuario is None:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
     habitos = crud.get_habitos_by_usuario(db=db, usuario_id=usuario_id, activo=activo)
     return habitos
 
@@ -53,14 +56,14 @@ def delete_habito(habito_id: int, db: Session = Depends(get_db)):
 
 
 # ===== Endpoints para Registros de Hábitos =====
-@router.post("/usuarios/{usuario_id}/registros_habitos/", response_model=schemas.RegistroHabito)
+@router.post(
+    "/usuarios/{usuario_id}/registros_habitos/",
+    response_model=schemas.RegistroHabito,
+    dependencies=[Depends(require_usuario)],
+)
 def create_registro_habito_for_usuario(
     usuario_id: int, registro: schemas.RegistroHabitoCreate, db: Session = Depends(get_db)
 ):
-    db_usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if db_usuario is None:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    
     # Verificar que el hábito existe y pertenece al usuario
     db_habito = crud.get_habito(db, habito_id=registro.habito_id)
     if db_habito is None:
@@ -71,13 +74,14 @@ def create_registro_habito_for_usuario(
     return crud.create_registro_habito(db=db, registro=registro, usuario_id=usuario_id)
 
 
-@router.get("/usuarios/{usuario_id}/registros_habitos/", response_model=List[schemas.RegistroHabito])
+@router.get(
+    "/usuarios/{usuario_id}/registros_habitos/",
+    response_model=List[schemas.RegistroHabito],
+    dependencies=[Depends(require_usuario)],
+)
 def read_registros_habito_by_usuario(
     usuario_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)
 ):
-    db_usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if db_usuario is None:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
     registros = crud.get_registros_habito_by_usuario(db=db, usuario_id=usuario_id, skip=skip, limit=limit)
     return registros
 
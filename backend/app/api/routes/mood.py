@@ -1,9 +1,12 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
+from app.api.deps import valid_usuario, require_usuario
 from app import crud, schemas
+from app.models.mood import Usuario
 
 router = APIRouter()
 
@@ -23,27 +26,35 @@ def read_usuarios(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)
 
 
 @router.get("/usuarios/{usuario_id}", response_model=schemas.Usuario)
-def read_usuario(usuario_id: int, db: Session = Depends(get_db)):
-    db_usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if db_usuario is None:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+def read_usuario(db_usuario: Usuario = Depends(valid_usuario)):
     return db_usuario
 
 
-@router.post("/usuarios/{usuario_id}/estados_animo/", response_model=schemas.EstadoAnimo)
+@router.post(
+    "/usuarios/{usuario_id}/estados_animo/",
+    response_model=schemas.EstadoAnimo,
+    dependencies=[Depends(require_usuario)],
+)
 def create_estado_animo_for_usuario(
     usuario_id: int, estado_animo: schemas.EstadoAnimoCreate, db: Session = Depends(get_db)
 ):
-    db_usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if db_usuario is None:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return crud.create_estado_animo(db=db, estado_animo=estado_animo, usuario_id=usuario_id)
 
 
-@router.get("/usuarios/{usuario_id}/estados_animo/", response_model=List[schemas.EstadoAnimo])
-def read_estados_animo(usuario_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    db_usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if db_usuario is None:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    estados_animo = crud.get_estados_animo_by_usuario(db=db, usuario_id=usuario_id, skip=skip, limit=limit)
+@router.get(
+    "/usuarios/{usuario_id}/estados_animo/",
+    response_model=List[schemas.EstadoAnimo],
+    dependencies=[Depends(require_usuario)],
+)
+def read_estados_animo(
+    usuario_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    before: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+):
+    # before: timestamp del último estado de la página anterior (keyset)
+    estados_animo = crud.get_estados_animo_by_usuario(
+        db=db, usuario_id=usuario_id, skip=skip, limit=limit, before=before
+    )
     return estados_animo
\ No newline at end of file
@@ -3,31 +3,31 @@ Endpoints para análisis de patrones y correlaciones personales.
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from typing import Optional
 
 from app.db.session import get_db
+from app.api.deps import valid_usuario
 from app import crud
+from app.models.mood import Usuario
 from app.services.pattern_analysis import pattern_service
+from app.core.caching import correlaciones_cache, stats
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 
 @router.get("/analyze/{usuario_id}")
 async def analyze_user_patterns(
     usuario_id: int,
     days: int = Query(default=30, ge=7, le=90, description="Días hacia atrás para analizar"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    usuario: Usuario = Depends(valid_usuario)
 ):
     """
     Analiza patrones del usuario en los últimos N días.
     Retorna correlaciones entre hábitos y ánimo, patrones temporales, etc.
     """
-    # Verificar que el usuario existe
-    usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    
     # Realizar análisis
     analysis = pattern_service.analyze_user_patterns(db, usuario_id, days_lookback=days)
     
@@ -42,25 +42,18 @@ async def analyze_user_patterns(
 async def get_user_insights(
     usuario_id: int,
     current_mood: Optional[int] = Query(default=None, ge=1, le=10),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    usuario: Usuario = Depends(valid_usuario)
 ):
     """
     Obtiene insights relevantes para el usuario actual.
     Si se proporciona current_mood, personaliza las recomendaciones.
     """
-    # Verificar que el usuario existe
-    usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    
-    # Obtener insight conversacional
-    insight = pattern_service.get_relevant_insights_for_conversation(
-        db, usuario_id, current_mood=current_mood
+    # Análisis completo + insight conversacional en una sola pasada
+    full_analysis, insight = pattern_service.analyze_with_conversation_insight(
+        db, usuario_id, current_mood=current_mood, days_lookback=30
     )
     
-    # Obtener análisis completo
-    full_analysis = pattern_service.analyze_user_patterns(db, usuario_id, days_lookback=30)
-    
     return {
         "usuario": usuario.nombre,
         "insight_conversacional": insight,
@@ -71,24 +64,22 @@ async def get_user_insights(
 
 
 @router.get("/correlations/{usuario_id}")
-async def get_saved_correlations(usuario_id: int, db: Session = Depends(get_db)):
+async def get_saved_correlations(
+    usuario_id: int,
+    db: Session = Depends(get_db),
+    usuario: Usuario = Depends(valid_usuario)
+):
     """
     Obtiene las correlaciones guardadas en la base de datos.
+    La lista serializada se cachea por usuario (se recalcula cada 50
+    lecturas o 30 minutos, o al guardar correlaciones nuevas).
     """
-    # Verificar que el usuario existe
-    usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    
-    # Obtener correlaciones de la BD
-    correlaciones = db.query(crud.Correlacion).filter(
-        crud.Correlacion.usuario_id == usuario_id
-    ).order_by(crud.Correlacion.impacto_animo.desc()).all()
-    
-    return {
-        "usuario": usuario.nombre,
-        "total_correlaciones": len(correlaciones),
-        "correlaciones": [
+    try:
+        correlaciones = correlaciones_cache[usuario_id]
+    except KeyError:
+        stats['correlaciones'].miss()
+        # Obtener correlaciones de la BD
+        correlaciones = [
             {
                 "factor": corr.factor,
                 "impacto": round(corr.impacto_animo, 3),
@@ -96,6 +87,16 @@ async def get_saved_correlations(usuario_id: int, db: Session = Depends(get_db))
                 "num_datos": corr.num_datos,
                 "fecha_calculo": corr.fecha_calculo
             }
-            for corr in correlaciones
+            for corr in db.query(crud.Correlacion).filter(
+                crud.Correlacion.usuario_id == usuario_id
+            ).order_by(crud.Correlacion.impacto_animo.desc()).all()
         ]
-    }
+        correlaciones_cache[usuario_id] = correlaciones
+    else:
+        stats['correlaciones'].hit()
+    
+    return ORJSONResponse({
+        "usuario": usuario.nombre,
+        "total_correlaciones": len(correlaciones),
+        "correlaciones": correlaciones
+    })
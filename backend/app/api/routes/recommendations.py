@@ -2,45 +2,73 @@
 Endpoints para obtener recomendaciones proactivas e inteligentes.
 """
 
+import asyncio
+
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
+from app.core.logging_config import get_logger
 from app.db.session import get_db
+from app.api.deps import valid_usuario
 from app import crud
+from app.models.mood import Usuario
 from app.services.recommendation_service import recommendation_service
 from app.services.emotion_analysis_service import emotion_service
 
-router = APIRouter()
+logger = get_logger(__name__)
+router = APIRouter(default_response_class=ORJSONResponse)
+
+
+def _call_with_own_session(bind, func, *args, **kwargs):
+    """
+    Ejecuta un método del servicio con su propia sesión de BD.
+    Una Session no es thread-safe, así que cada llamada concurrente usa la suya,
+    sobre el mismo engine que la sesión del request (respeta overrides de get_db).
+    """
+    db = Session(bind=bind, autoflush=False)
+    try:
+        return func(db, *args, **kwargs)
+    finally:
+        db.close()
 
 
 @router.get("/api/v1/recommendations/{usuario_id}")
 async def get_personalized_recommendations(
     usuario_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    usuario: Usuario = Depends(valid_usuario)
 ):
     """
     Obtiene recomendaciones proactivas personalizadas para el usuario.
     Incluye: hábitos preventivos, desafíos, micro-hábitos y próxima acción recomendada.
     """
-    usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
     # Obtener ánimo actual (el más reciente)
-    recent_mood = db.query(EstadoAnimo).filter(
-        EstadoAnimo.usuario_id == usuario_id
-    ).order_by(EstadoAnimo.timestamp.desc()).first()
+    recent_mood = crud.get_latest_estado_animo(db, usuario_id=usuario_id)
 
     current_mood = recent_mood.nivel if recent_mood else None
 
+    bind = db.get_bind()
+
     try:
-        # Generar todas las recomendaciones
-        preventivas = recommendation_service.suggest_preventive_activities(db, usuario_id)
-        desafios = recommendation_service.generate_personalized_challenges(
-            db, usuario_id, difficulty='moderate'
+        # Generar las recomendaciones que tocan la BD en paralelo
+        preventivas, desafios, next_action = await asyncio.gather(
+            run_in_threadpool(
+                _call_with_own_session, bind,
+                recommendation_service.suggest_preventive_activities, usuario_id
+            ),
+            run_in_threadpool(
+                _call_with_own_session, bind,
+                recommendation_service.generate_personalized_challenges, usuario_id,
+                difficulty='moderate'
+            ),
+            run_in_threadpool(
+                _call_with_own_session, bind,
+                recommendation_service.get_next_recommended_action, usuario_id, current_mood
+            ),
         )
         micro_habitos = recommendation_service.suggest_micro_habits(current_mood)
-        next_action = recommendation_service.get_next_recommended_action(db, usuario_id, current_mood)
 
         return {
             'usuario': usuario.nombre,
@@ -51,10 +79,10 @@ async def get_personalized_recommendations(
                 'micro_habitos': micro_habitos,
                 'proxima_accion': next_action
             },
-            'fecha_generacion': datetime.utcnow().isoformat()
+            'fecha_generacion': datetime.utcnow()
         }
-    except Exception as e:
-        print(f"⚠️ Error generando recomendaciones: {e}")
+    except Exception:
+        logger.exception("Error generando recomendaciones (usuario_id=%s)", usuario_id)
         raise HTTPException(
             status_code=500,
             detail="Error al generar recomendaciones"
@@ -65,16 +93,13 @@ async def get_personalized_recommendations(
 async def get_emotional_cycles(
     usuario_id: int,
     days_lookback: int = 90,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    usuario: Usuario = Depends(valid_usuario)
 ):
     """
     Obtiene análisis de ciclos emocionales del usuario.
     Detecta patrones diarios, semanales y mensuales.
     """
-    usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
     try:
         cycles = emotion_service.detect_emotional_cycles(
             db, usuario_id, days_lookback=days_lookback
@@ -90,8 +115,8 @@ async def get_emotional_cycles(
             'usuario': usuario.nombre,
             'ciclos_emocionales': cycles
         }
-    except Exception as e:
-        print(f"⚠️ Error analizando ciclos: {e}")
+    except Exception:
+        logger.exception("Error analizando ciclos (usuario_id=%s)", usuario_id)
         raise HTTPException(
             status_code=500,
             detail="Error al analizar ciclos emocionales"
@@ -102,7 +127,8 @@ async def get_emotional_cycles(
 async def get_challenges(
     usuario_id: int,
     difficulty: str = 'moderate',
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    usuario: Usuario = Depends(valid_usuario)
 ):
     """
     Obtiene desafíos personalizados del usuario.
@@ -110,10 +136,6 @@ async def get_challenges(
     Parámetros:
         difficulty: 'easy'|'moderate'|'hard'
     """
-    usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
     if difficulty not in ['easy', 'moderate', 'hard']:
         difficulty = 'moderate'
 
@@ -127,8 +149,8 @@ async def get_challenges(
             'dificultad': difficulty,
             'desafios': challenges
         }
-    except Exception as e:
-        print(f"⚠️ Error generando desafíos: {e}")
+    except Exception:
+        logger.exception("Error generando desafíos (usuario_id=%s)", usuario_id)
         raise HTTPException(
             status_code=500,
             detail="Error al generar desafíos"
@@ -138,22 +160,16 @@ async def get_challenges(
 @router.get("/api/v1/recommendations/{usuario_id}/micro-habits")
 async def get_micro_habits(
     usuario_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    usuario: Usuario = Depends(valid_usuario)
 ):
     """
     Obtiene micro-hábitos recomendados (acciones de 1-5 minutos).
     Se adaptan al ánimo actual del usuario.
     """
-    usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
     try:
         # Obtener ánimo actual
-        from app.models.mood import EstadoAnimo
-        recent_mood = db.query(EstadoAnimo).filter(
-            EstadoAnimo.usuario_id == usuario_id
-        ).order_by(EstadoAnimo.timestamp.desc()).first()
+        recent_mood = crud.get_latest_estado_animo(db, usuario_id=usuario_id)
 
         current_mood = recent_mood.nivel if recent_mood else None
 
@@ -164,8 +180,8 @@ async def get_micro_habits(
             'ánimo_actual': current_mood,
             'micro_habitos': micro_habitos
         }
-    except Exception as e:
-        print(f"⚠️ Error obteniendo micro-hábitos: {e}")
+    except Exception:
+        logger.exception("Error obteniendo micro-hábitos (usuario_id=%s)", usuario_id)
         raise HTTPException(
             status_code=500,
             detail="Error al obtener micro-hábitos"
@@ -175,21 +191,15 @@ async def get_micro_habits(
 @router.get("/api/v1/recommendations/{usuario_id}/next-action")
 async def get_next_action(
     usuario_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    usuario: Usuario = Depends(valid_usuario)
 ):
     """
     Obtiene la próxima acción más relevante recomendada.
     La acción más apropiada según el contexto actual.
     """
-    usuario = crud.get_usuario(db, usuario_id=usuario_id)
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
     try:
-        from app.models.mood import EstadoAnimo
-        recent_mood = db.query(EstadoAnimo).filter(
-            EstadoAnimo.usuario_id == usuario_id
-        ).order_by(EstadoAnimo.timestamp.desc()).first()
+        recent_mood = crud.get_latest_estado_animo(db, usuario_id=usuario_id)
 
         current_mood = recent_mood.nivel if recent_mood else None
 
@@ -207,10 +217,10 @@ async def get_next_action(
         return {
             'usuario': usuario.nombre,
             'próxima_acción': next_action,
-            'fecha': datetime.utcnow().isoformat()
+            'fecha': datetime.utcnow()
         }
-    except Exception as e:
-        print(f"⚠️ Error obteniendo próxima acción: {e}")
+    except Exception:
+        logger.exception("Error obteniendo próxima acción (usuario_id=%s)", usuario_id)
         raise HTTPException(
             status_code=500,
             detail="Error al obtener próxima acción"
@@ -219,4 +229,3 @@ async def get_next_action(
 
 # Imports que faltaban
 from datetime import datetime
-from app.models.mood import EstadoAnimo
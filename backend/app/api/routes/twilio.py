@@ -3,17 +3,22 @@ Endpoints para el webhook de Twilio WhatsApp.
 Recibe mensajes entrantes y responde con la IA de Loki.
 """
 
-from fastapi import APIRouter, Request, Form, Depends
+import asyncio
+
+from fastapi import APIRouter, Request, Form, Depends, BackgroundTasks
 from sqlalchemy.orm import Session
 from slowapi import Limiter
 from slowapi.util import get_remote_address
-import json
+from starlette.concurrency import run_in_threadpool
 
 from app.db.session import get_db
 from app import crud, schemas
 from app.services.twilio_service import twilio_service
 from app.services.ai_service import loki_service
+from app.services.webhook_persistence import save_webhook_exchange
 from app.core.logger import setup_logger
+from app.core.idempotency import mark_message, unmark_message
+from app.core.caching import invalidate_usuario_cache, invalidate_usuario_telefono_cache
 
 logger = setup_logger(__name__)
 router = APIRouter()
@@ -24,6 +29,7 @@ limiter = Limiter(key_func=get_remote_address)
 @limiter.limit("100/minute")  # Máximo 100 requests por minuto por IP
 async def receive_twilio_webhook(
     request: Request,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     Body: str = Form(None),
     From: str = Form(None),
@@ -34,6 +40,8 @@ async def receive_twilio_webhook(
     Procesa el mensaje con Loki AI y responde al usuario.
     
     Twilio envía datos como form-data, no JSON.
+    La persistencia y el envío de la respuesta se ejecutan en background,
+    después de responder 200 OK a Twilio.
     """
     
     # Verificar que Twilio service esté disponible
@@ -41,6 +49,7 @@ async def receive_twilio_webhook(
         logger.error("Twilio service not available - twilio package not installed")
         return {"status": "error", "message": "Twilio service not configured"}
 
+    message_id = None
     try:
         # Construir body dict desde form data
         body = {
@@ -50,57 +59,36 @@ async def receive_twilio_webhook(
         }
 
         logger.info(f"Webhook de Twilio recibido desde {From}")
-        logger.debug(f"Mensaje: {Body}")
-        logger.debug(f"SID: {MessageSid}")
+        logger.debug("Mensaje: %s", Body)
+        logger.debug("SID: %s", MessageSid)
         
         # Parsear el mensaje
         parsed_message = twilio_service.parse_webhook_message(body)
         
         if not parsed_message:
             # No es un mensaje de texto válido, ignorar
-            print("⚠️ No es un mensaje de texto válido, ignorando")
+            logger.info("⚠️ No es un mensaje de texto válido, ignorando")
             return {"status": "ok"}
         
         phone_number = parsed_message['phone_number']
         message_text = parsed_message['message_text']
         message_id = parsed_message['message_id']
         
-        print(f"📱 Mensaje parseado:")
-        print(f"   Número: {phone_number}")
-        print(f"   Texto: {message_text}")
-        print(f"   ID: {message_id}")
+        # Reintento de un mensaje ya recibido: no volver a procesarlo
+        if not mark_message(message_id):
+            return {"status": "ok", "message": "duplicate"}
         
-        # Buscar o crear usuario basado en el número de teléfono (con manejo robusto de race conditions)
-        usuario_data = schemas.UsuarioCreate(
-            nombre=f"Usuario {phone_number[-4:]}",  # Nombre temporal
-            telefono=phone_number
+        logger.debug(
+            "📱 Mensaje parseado: número=%s texto=%s id=%s",
+            phone_number, message_text, message_id
         )
-        usuario = crud.get_or_create_usuario(db, usuario=usuario_data)
-        logger.info(f"✅ Usuario obtenido/creado: {usuario.id}")
-        
-        # 🆕 DETECCIÓN Y ACTUALIZACIÓN DE NOMBRE
-        # Verificar si el mensaje contiene el nombre del usuario
-        nombre_detectado = loki_service._extract_name_from_message(message_text)
         
-        # Actualizar si:
-        # 1. No tiene nombre (None)
-        # 2. Tiene nombre temporal ("Usuario XXXX")
-        # 3. El nombre detectado es diferente al actual (corrección de errores como "Diego Recuerdalo")
-        debe_actualizar = (
-            nombre_detectado and (
-                not usuario.nombre or 
-                usuario.nombre.startswith("Usuario ") or
-                (usuario.nombre and nombre_detectado.lower() != usuario.nombre.lower())
-            )
+        # Las consultas a la BD son bloqueantes: corren en el threadpool
+        # para no frenar el event loop (y los demás webhooks) mientras tanto
+        usuario_id, usuario_nombre, es_usuario_nuevo, contexto_reciente = await run_in_threadpool(
+            _prepare_usuario, db, phone_number, message_text
         )
         
-        if debe_actualizar:
-            nombre_anterior = usuario.nombre
-            usuario.nombre = nombre_detectado
-            db.commit()
-            db.refresh(usuario)
-            logger.info(f"✅ Nombre actualizado de '{nombre_anterior}' a '{nombre_detectado}' para usuario {usuario.id}")
-        
         # COMANDO ESPECIAL: Dashboard
         message_lower = message_text.lower().strip()
         dashboard_keywords = ['dashboard', 'ver mi progreso', 'estadisticas', 'mis datos', 'mi dashboard']
@@ -109,8 +97,8 @@ async def receive_twilio_webhook(
             # Generar link al dashboard
             from app.services.auth_service import auth_service
             dashboard_link = auth_service.generate_dashboard_link(
-                usuario_id=usuario.id,
-                telefono=usuario.telefono
+                usuario_id=usuario_id,
+                telefono=phone_number
             )
             
             dashboard_message = f"""🎯 *Aquí está tu dashboard personal*
@@ -132,97 +120,140 @@ El link es válido por 24 horas."""
                 message=dashboard_message
             )
             
-            print(f"📊 Dashboard link enviado a {phone_number}")
+            logger.info("📊 Dashboard link enviado a %s", phone_number)
             return {"status": "ok", "message": "dashboard_sent"}
         
-        # Obtener conversaciones recientes para contexto
-        conversaciones_recientes = crud.get_conversaciones_by_usuario(
-            db, usuario_id=usuario.id, limit=5
-        )
-        
-        # 🎯 ONBOARDING: Detectar si es usuario nuevo (primera interacción)
-        es_usuario_nuevo = len(conversaciones_recientes) == 0
-        
-        contexto_reciente = [
-            {
-                'mensaje_usuario': conv.mensaje_usuario,
-                'respuesta_loki': conv.respuesta_loki,
-                'entidades_extraidas': conv.entidades_extraidas
-            }
-            for conv in conversaciones_recientes
-        ]
-        
         # Si es usuario nuevo, enviar onboarding
         if es_usuario_nuevo:
-            logger.info(f"🎉 Nuevo usuario detectado: {usuario.id} - Enviando onboarding")
-            ai_response = loki_service.generate_onboarding_message(usuario.nombre)
+            logger.info(f"🎉 Nuevo usuario detectado: {usuario_id} - Enviando onboarding")
+            ai_response = loki_service.generate_onboarding_message(usuario_nombre)
         else:
             # Generar respuesta con Loki AI
             ai_response = await loki_service.generate_response(
                 mensaje_usuario=message_text,
-                usuario_nombre=usuario.nombre,
-                contexto_reciente=contexto_reciente
-            )
-        
-        # Guardar la conversación
-        conversacion_data = schemas.ConversacionContextoCreate(
-            mensaje_usuario=message_text,
-            respuesta_loki=ai_response['respuesta'],
-            entidades_extraidas=json.dumps(ai_response['context_extracted'], ensure_ascii=False),
-            categorias_detectadas=json.dumps(ai_response['context_extracted'].get('habits_mentioned', []))
-        )
-        crud.create_conversacion(db, conversacion=conversacion_data, usuario_id=usuario.id)
-        
-        # Si se detectó un nivel de ánimo, registrarlo
-        mood_level = ai_response['context_extracted'].get('mood_level')
-        if mood_level:
-            estado_animo_data = schemas.EstadoAnimoCreate(
-                nivel=mood_level,
-                notas_texto=message_text,
-                contexto_extraido=json.dumps(ai_response['context_extracted'], ensure_ascii=False),
-                disparadores_detectados=json.dumps(
-                    ai_response['context_extracted'].get('emotional_triggers', [])
-                )
+                usuario_nombre=usuario_nombre,
+                contexto_reciente=contexto_reciente,
+                usuario_id=usuario_id
             )
-            crud.create_estado_animo(db, estado_animo=estado_animo_data, usuario_id=usuario.id)
         
-        # Si se detectaron hábitos, registrarlos automáticamente
-        habits_mentioned = ai_response['context_extracted'].get('habits_mentioned', [])
-        if habits_mentioned:
-            from app.services.habit_automation import create_or_update_habits_from_mentions, get_habit_summary
-            
-            try:
-                habits_result = await create_or_update_habits_from_mentions(
-                    db=db,
-                    usuario_id=usuario.id,
-                    habits_mentioned=habits_mentioned
-                )
-                
-                # Log del resultado
-                summary = get_habit_summary(habits_result)
-                if summary:
-                    logger.info(f"Hábitos auto-gestionados para {phone_number}: {summary}")
-                    
-            except Exception as e:
-                logger.error(f"Error auto-gestionando hábitos: {e}")
-                # No fallar el flujo principal si hay error en hábitos
-        
-        # Enviar respuesta por WhatsApp usando Twilio
-        result = await twilio_service.send_message(
+        # Guardar y responder después de enviar el ACK a Twilio
+        background_tasks.add_task(
+            _finalize_twilio_webhook,
+            bind=db.get_bind(),
+            usuario_id=usuario_id,
             phone_number=phone_number,
-            message=ai_response['respuesta']
+            message_text=message_text,
+            ai_response=ai_response
         )
         
-        if result.get('success'):
-            print(f"✅ Mensaje enviado a {phone_number}: {ai_response['respuesta']}")
-        else:
-            print(f"❌ Error enviando mensaje: {result.get('error')}")
-        
         return {"status": "ok", "message": "processed"}
         
     except Exception as e:
-        print(f"❌ Error processing Twilio webhook: {e}")
-        import traceback
-        traceback.print_exc()
+        unmark_message(message_id)
+        logger.error("❌ Error processing Twilio webhook: %s", e, exc_info=True)
         # Twilio espera un 200 OK incluso si hay errores
         return {"status": "error", "message": str(e)}
+
+
+def _prepare_usuario(db: Session, phone_number: str, message_text: str):
+    """
+    Busca o crea el usuario del mensaje, actualiza su nombre si el mensaje
+    lo contiene y arma el contexto de conversaciones recientes.
+
+    Es síncrona (se ejecuta con run_in_threadpool) y devuelve valores planos,
+    no la instancia ORM, que queda expirada tras el commit.
+
+    Returns:
+        (usuario_id, usuario_nombre, es_usuario_nuevo, contexto_reciente)
+    """
+    # Buscar el usuario junto con sus conversaciones recientes para contexto
+    usuario, conversaciones_recientes = crud.get_usuario_with_recent_conversaciones(
+        db, telefono=phone_number, limit=5
+    )
+    if usuario is None:
+        # Crear usuario (con manejo robusto de race conditions)
+        usuario_data = schemas.UsuarioCreate(
+            nombre=f"Usuario {phone_number[-4:]}",  # Nombre temporal
+            telefono=phone_number
+        )
+        usuario = crud.get_or_create_usuario(db, usuario=usuario_data)
+    logger.info(f"✅ Usuario obtenido/creado: {usuario.id}")
+    
+    # 🎯 ONBOARDING: Detectar si es usuario nuevo (primera interacción)
+    es_usuario_nuevo = len(conversaciones_recientes) == 0
+    
+    # Armar el contexto antes de cualquier commit, que expira las conversaciones cargadas
+    contexto_reciente = [
+        {
+            'mensaje_usuario': conv.mensaje_usuario,
+            'respuesta_loki': conv.respuesta_loki,
+            'entidades_extraidas': conv.entidades_extraidas
+        }
+        for conv in conversaciones_recientes
+    ]
+    
+    # 🆕 DETECCIÓN Y ACTUALIZACIÓN DE NOMBRE
+    # Verificar si el mensaje contiene el nombre del usuario
+    nombre_detectado = loki_service._extract_name_from_message(message_text)
+    
+    # Actualizar si:
+    # 1. No tiene nombre (None)
+    # 2. Tiene nombre temporal ("Usuario XXXX")
+    # 3. El nombre detectado es diferente al actual (corrección de errores como "Diego Recuerdalo")
+    debe_actualizar = (
+        nombre_detectado and (
+            not usuario.nombre or 
+            usuario.nombre.startswith("Usuario ") or
+            (usuario.nombre and nombre_detectado.lower() != usuario.nombre.lower())
+        )
+    )
+    
+    # Leer id y nombre antes del commit: la sesión expira la instancia al
+    # commitear y leerlos después dispararía un SELECT para recargar la fila
+    usuario_id, usuario_nombre = usuario.id, usuario.nombre
+    
+    if debe_actualizar:
+        nombre_anterior = usuario_nombre
+        usuario.nombre = usuario_nombre = nombre_detectado
+        db.commit()
+        invalidate_usuario_cache(usuario_id)
+        invalidate_usuario_telefono_cache(phone_number)
+        logger.info(f"✅ Nombre actualizado de '{nombre_anterior}' a '{nombre_detectado}' para usuario {usuario_id}")
+    
+    return usuario_id, usuario_nombre, es_usuario_nuevo, contexto_reciente
+
+
+async def _finalize_twilio_webhook(
+    bind,
+    usuario_id: int,
+    phone_number: str,
+    message_text: str,
+    ai_response: dict
+):
+    """
+    Persiste el intercambio y envía la respuesta por WhatsApp usando Twilio.
+    Corre como background task.
+
+    Guardar y enviar no dependen entre sí: la escritura en BD corre en el
+    threadpool mientras el envío espera a Twilio.
+    """
+    _, result = await asyncio.gather(
+        run_in_threadpool(
+            save_webhook_exchange,
+            bind=bind,
+            usuario_id=usuario_id,
+            phone_number=phone_number,
+            message_text=message_text,
+            ai_response=ai_response
+        ),
+        twilio_service.send_message(
+            phone_number=phone_number,
+            message=ai_response['respuesta']
+        )
+    )
+    
+    if result.get('success'):
+        logger.info("✅ Mensaje enviado a %s", phone_number)
+        logger.debug("Respuesta: %.100s...", ai_response['respuesta'])
+    else:
+        logger.error("❌ Error enviando mensaje: %s", result.get('error'))
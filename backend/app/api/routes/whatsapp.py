@@ -3,18 +3,28 @@ Endpoints para el webhook de WhatsApp.
 Recibe mensajes entrantes y responde con la IA de Loki.
 """
 
-from fastapi import APIRouter, Request, HTTPException, Depends, Query
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Request, HTTPException, Depends, Query, BackgroundTasks
 from sqlalchemy.orm import Session
 from slowapi import Limiter
 from slowapi.util import get_remote_address
-import json
+from starlette.concurrency import run_in_threadpool
+import logging
+import orjson
 
 from app.db.session import get_db
 from app import crud, schemas
 from app.services.whatsapp_service import whatsapp_service
 from app.services.ai_service import loki_service
 from app.services.trust_level_service import trust_service
+from app.services.webhook_persistence import save_webhook_exchange
 from app.core.logger import setup_logger, log_security_event
+from app.core.idempotency import mark_message, unmark_message
+from app.core.caching import (
+    invalidate_usuario_cache, invalidate_usuario_telefono_cache, invalidate_trust_level_cache
+)
 
 logger = setup_logger(__name__)
 router = APIRouter()
@@ -41,20 +51,27 @@ async def verify_webhook(
 
 @router.post("/webhook")
 @limiter.limit("100/minute")  # Máximo 100 requests por minuto por IP
-async def receive_webhook(request: Request, db: Session = Depends(get_db)):
+async def receive_webhook(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
     """
     Endpoint para recibir mensajes entrantes de WhatsApp.
     Procesa el mensaje con Loki AI y responde al usuario.
+
+    La persistencia y el envío de la respuesta se ejecutan en background,
+    después de responder 200 OK a WhatsApp.
     """
+    message_id = None
     try:
         # Verificar firma del webhook (seguridad)
         signature = request.headers.get("X-Hub-Signature-256")
         body_bytes = await request.body()
-        body_str = body_bytes.decode()
 
         # Validar firma si está configurada
         if signature:
-            is_valid = whatsapp_service.verify_webhook_signature(body_str, signature)
+            is_valid = whatsapp_service.verify_webhook_signature(body_bytes, signature)
             if not is_valid:
                 log_security_event(
                     logger,
@@ -67,10 +84,11 @@ async def receive_webhook(request: Request, db: Session = Depends(get_db)):
             logger.warning("Webhook recibido sin firma X-Hub-Signature-256")
 
         # Parsear JSON del body
-        body = json.loads(body_str)
+        body = orjson.loads(body_bytes)
 
         logger.info("Webhook recibido de WhatsApp")
-        logger.debug(f"Body: {json.dumps(body, indent=2, ensure_ascii=False)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Body: %s", orjson.dumps(body, option=orjson.OPT_INDENT_2).decode())
         
         # Parsear el mensaje
         parsed_message = whatsapp_service.parse_webhook_message(body)
@@ -86,137 +104,158 @@ async def receive_webhook(request: Request, db: Session = Depends(get_db)):
         message_id = parsed_message['message_id']
         profile_name = parsed_message.get('profile_name')
 
+        # Reintento de un mensaje ya recibido: no volver a procesarlo
+        if not mark_message(message_id):
+            return {"status": "ok", "message": "duplicate"}
+
         logger.info(f"Mensaje recibido de {phone_number} (ID: {message_id})")
-        logger.debug(f"Contenido: {message_text}")
+        logger.debug("Contenido: %s", message_text)
         if profile_name:
-            logger.debug(f"Nombre del perfil: {profile_name}")
-
-        # Buscar o crear usuario basado en el número de teléfono
-        usuario = crud.get_usuario_by_telefono(db, telefono=phone_number)
-
-        if not usuario:
-            # Crear nuevo usuario si es la primera vez que escribe
-            # Usar nombre del perfil de WhatsApp si está disponible
-            nombre_usuario = profile_name if profile_name else "Usuario de WhatsApp"
-
-            usuario_data = schemas.UsuarioCreate(
-                nombre=nombre_usuario,
-                telefono=phone_number
-            )
-            usuario = crud.create_usuario(db, usuario=usuario_data)
-            logger.info(f"Nuevo usuario creado: {nombre_usuario} ({phone_number})")
-        elif profile_name and usuario.nombre != profile_name and usuario.nombre.startswith("Usuario"):
-            # Actualizar nombre si tenemos el nombre del perfil y el actual es temporal
-            usuario.nombre = profile_name
-            db.commit()
-            db.refresh(usuario)
-            logger.info(f"Nombre de usuario actualizado a: {profile_name}")
-        
-        # 🔍 DEBUG: Log del nombre actual del usuario
-        logger.info(f"📝 Usuario cargado: ID={usuario.id}, Nombre='{usuario.nombre}', Teléfono={phone_number}")
-        
-        # Obtener conversaciones recientes para contexto
-        conversaciones_recientes = crud.get_conversaciones_by_usuario(
-            db, usuario_id=usuario.id, limit=5
+            logger.debug("Nombre del perfil: %s", profile_name)
+
+        # Las consultas a la BD son bloqueantes: corren en el threadpool
+        # para no frenar el event loop (y los demás webhooks) mientras tanto
+        usuario_id, usuario_nombre, contexto_reciente = await run_in_threadpool(
+            _prepare_usuario, db, phone_number, profile_name
         )
-        
-        contexto_reciente = [
-            {
-                'mensaje_usuario': conv.mensaje_usuario,
-                'respuesta_loki': conv.respuesta_loki
-            }
-            for conv in conversaciones_recientes
-        ]
-
-        # Actualizar nivel de confianza (incrementa contador de interacciones)
-        trust_update = trust_service.update_trust_level(db, usuario.id)
-        if trust_update.get('nivel_cambio'):
-            logger.info(f"Nivel de confianza aumentó para usuario {usuario.id}: {trust_update['nivel_info']['name']}")
 
         # Generar respuesta con Loki AI
         ai_response = await loki_service.generate_response(
             mensaje_usuario=message_text,
-            usuario_nombre=usuario.nombre,
+            usuario_nombre=usuario_nombre,
             contexto_reciente=contexto_reciente,
             db_session=db,
-            usuario_id=usuario.id
+            usuario_id=usuario_id
         )
         
-        # 🆕 Si se detectó un nombre, actualizarlo en la BD
-        nombre_detectado = ai_response.get('nombre_detectado')
-        if nombre_detectado:
-            usuario.nombre = nombre_detectado
-            db.commit()
-            db.refresh(usuario)
-            logger.info(f"✅ Nombre actualizado a: {nombre_detectado} para usuario {usuario.id}")
-            
-            # 🔧 IMPORTANTE: La respuesta ya tiene el nombre correcto porque
-            # generate_response() la genera con el nombre detectado
-        
-        # Guardar la conversación
-        conversacion_data = schemas.ConversacionContextoCreate(
-            mensaje_usuario=message_text,
-            respuesta_loki=ai_response['respuesta'],
-            entidades_extraidas=json.dumps(ai_response['context_extracted'], ensure_ascii=False),
-            categorias_detectadas=json.dumps(ai_response['context_extracted'].get('habits_mentioned', []))
-        )
-        crud.create_conversacion(db, conversacion=conversacion_data, usuario_id=usuario.id)
+        # 🆕 Si se detectó un nombre, se actualiza en la BD junto con la conversación
+        # 🔧 IMPORTANTE: La respuesta ya tiene el nombre correcto porque
+        # generate_response() la genera con el nombre detectado
         
-        # Si se detectó un nivel de ánimo, registrarlo
-        mood_level = ai_response['context_extracted'].get('mood_level')
-        if mood_level:
-            estado_animo_data = schemas.EstadoAnimoCreate(
-                nivel=mood_level,
-                notas_texto=message_text,
-                contexto_extraido=json.dumps(ai_response['context_extracted'], ensure_ascii=False),
-                disparadores_detectados=json.dumps(
-                    ai_response['context_extracted'].get('emotional_triggers', [])
-                )
-            )
-            crud.create_estado_animo(db, estado_animo=estado_animo_data, usuario_id=usuario.id)
-        
-        # Si se detectaron hábitos, registrarlos automáticamente
-        habits_mentioned = ai_response['context_extracted'].get('habits_mentioned', [])
-        if habits_mentioned:
-            from app.services.habit_automation import create_or_update_habits_from_mentions, get_habit_summary
-            
-            try:
-                habits_result = await create_or_update_habits_from_mentions(
-                    db=db,
-                    usuario_id=usuario.id,
-                    habits_mentioned=habits_mentioned
-                )
-                
-                # Log del resultado
-                summary = get_habit_summary(habits_result)
-                if summary:
-                    logger.info(f"Hábitos auto-gestionados para {phone_number}: {summary}")
-                    
-            except Exception as e:
-                logger.error(f"Error auto-gestionando hábitos: {e}")
-                # No fallar el flujo principal si hay error en hábitos
-        
-        # Enviar respuesta por WhatsApp
-        await whatsapp_service.send_message(
+        # Guardar y responder después de enviar el ACK a WhatsApp
+        background_tasks.add_task(
+            _finalize_webhook,
+            bind=db.get_bind(),
+            usuario_id=usuario_id,
             phone_number=phone_number,
-            message=ai_response['respuesta'],
-            phone_number_id=whatsapp_service.phone_number_id
+            message_text=message_text,
+            ai_response=ai_response
         )
 
-        logger.info(f"Respuesta enviada a {phone_number}")
-        logger.debug(f"Respuesta: {ai_response['respuesta'][:100]}...")
-
         return {"status": "ok", "message": "processed"}
 
     except HTTPException:
         # Re-raise HTTPException para validación de firma
         raise
     except Exception as e:
+        unmark_message(message_id)
         logger.error(f"Error processing webhook: {e}", exc_info=True)
         # WhatsApp espera un 200 OK incluso si hay errores
         return {"status": "error", "message": str(e)}
 
 
+def _prepare_usuario(db: Session, phone_number: str, profile_name: Optional[str]):
+    """
+    Busca o crea el usuario del mensaje, actualiza su nombre de perfil y su
+    nivel de confianza, y arma el contexto de conversaciones recientes.
+
+    Es síncrona (se ejecuta con run_in_threadpool) y devuelve valores planos,
+    no la instancia ORM, que queda expirada tras el commit.
+
+    Returns:
+        (usuario_id, usuario_nombre, contexto_reciente)
+    """
+    # Buscar o crear usuario basado en el número de teléfono,
+    # junto con sus conversaciones recientes para contexto
+    usuario, conversaciones_recientes = crud.get_usuario_with_recent_conversaciones(
+        db, telefono=phone_number, limit=5
+    )
+    nombre_actualizado = False
+
+    if not usuario:
+        # Crear nuevo usuario si es la primera vez que escribe
+        # Usar nombre del perfil de WhatsApp si está disponible
+        nombre_usuario = profile_name if profile_name else "Usuario de WhatsApp"
+
+        usuario_data = schemas.UsuarioCreate(
+            nombre=nombre_usuario,
+            telefono=phone_number
+        )
+        usuario = crud.create_usuario(db, usuario=usuario_data, commit=False)
+        logger.info(f"Nuevo usuario creado: {nombre_usuario} ({phone_number})")
+    elif profile_name and usuario.nombre != profile_name and usuario.nombre.startswith("Usuario"):
+        # Actualizar nombre si tenemos el nombre del perfil y el actual es temporal
+        usuario.nombre = profile_name
+        db.flush()
+        nombre_actualizado = True
+        logger.info(f"Nombre de usuario actualizado a: {profile_name}")
+    
+    # 🔍 DEBUG: Log del nombre actual del usuario
+    logger.info(f"📝 Usuario cargado: ID={usuario.id}, Nombre='{usuario.nombre}', Teléfono={phone_number}")
+    
+    contexto_reciente = [
+        {
+            'mensaje_usuario': conv.mensaje_usuario,
+            'respuesta_loki': conv.respuesta_loki
+        }
+        for conv in conversaciones_recientes
+    ]
+
+    # Actualizar nivel de confianza (incrementa contador de interacciones)
+    trust_update = trust_service.update_trust_level(db, usuario.id, commit=False)
+    if trust_update.get('nivel_cambio'):
+        logger.info(f"Nivel de confianza aumentó para usuario {usuario.id}: {trust_update['nivel_info']['name']}")
+
+    # Leer id y nombre antes del commit: la sesión expira la instancia al
+    # commitear y leerlos después dispararía un SELECT para recargar la fila
+    usuario_id, usuario_nombre = usuario.id, usuario.nombre
+
+    # Un solo commit para el alta/nombre/confianza, antes de la llamada a la IA
+    # para no mantener la transacción de escritura abierta mientras responde
+    db.commit()
+    invalidate_trust_level_cache(usuario_id)
+    if nombre_actualizado:
+        invalidate_usuario_cache(usuario_id)
+        invalidate_usuario_telefono_cache(phone_number)
+
+    return usuario_id, usuario_nombre, contexto_reciente
+
+
+async def _finalize_webhook(
+    bind,
+    usuario_id: int,
+    phone_number: str,
+    message_text: str,
+    ai_response: dict
+):
+    """
+    Persiste el intercambio (incluido el nombre detectado por la IA)
+    y envía la respuesta por WhatsApp. Corre como background task.
+
+    Guardar y enviar no dependen entre sí: la escritura en BD corre en el
+    threadpool mientras el envío espera a la API de WhatsApp.
+    """
+    await asyncio.gather(
+        run_in_threadpool(
+            save_webhook_exchange,
+            bind=bind,
+            usuario_id=usuario_id,
+            phone_number=phone_number,
+            message_text=message_text,
+            ai_response=ai_response,
+            nombre_detectado=ai_response.get('nombre_detectado')
+        ),
+        whatsapp_service.send_message(
+            phone_number=phone_number,
+            message=ai_response['respuesta'],
+            phone_number_id=whatsapp_service.phone_number_id
+        )
+    )
+
+    logger.info(f"Respuesta enviada a {phone_number}")
+    logger.debug("Respuesta: %.100s...", ai_response['respuesta'])
+
+
 @router.post("/send-test-message")
 async def send_test_message(
     phone_number: str,
@@ -5,34 +5,258 @@ Este módulo provee caching inteligente con Time-To-Live (TTL) configurable
 para datos frecuentemente accedidos. Soporta tanto caching in-memory (cachetools)
 como Redis (opcional) para ambientes de producción.
 """
-from typing import Optional, Any, Callable
+from typing import Optional, Any, Callable, Dict, Hashable
 from functools import wraps
+import pickle
 from cachetools import TTLCache
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
 import logging
+import threading
 import time
 
+from app.core.config import settings
+from app.core.validation import sanitize_phone_number
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    redis = None
+    REDIS_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+_DEBUG = logging.DEBUG
+
 
 # ===== Configuración de Caches =====
 
+class FastTTLCache(TTLCache):
+    """
+    TTLCache con __getitem__ de una sola búsqueda en el índice de
+    expiración, en lugar de la búsqueda + llamada a Cache.__getitem__ de
+    TTLCache. Mantiene la semántica: KeyError si falta o expiró, y el
+    acceso renueva el orden LRU.
+    
+    Usa los atributos internos de cachetools (versión fijada en
+    requirements.txt).
+    """
+    
+    def __getitem__(self, key):
+        links = self._TTLCache__links
+        link = links.get(key)
+        if link is None or not (self.timer() < link.expires):
+            return self.__missing__(key)
+        links.move_to_end(key)
+        return self._Cache__data[key]
+
+
+
+class PressureAwareTTLCache(FastTTLCache):
+    """
+    FastTTLCache cuyo TTL se acorta a medida que el cache se llena.
+
+    Con ocupación m = (len/maxsize - 0.7) / 0.2, acotada a [0, 1], cada
+    entrada nueva vive ttl * (1 - m): TTL completo hasta el 70% de
+    ocupación y cada vez más corto hasta el 90%. Nunca baja del 10% del
+    TTL base, para que una entrada recién guardada no nazca expirada.
+
+    Una entrada acortada se reubica en la lista de expiración (ordenada
+    por vencimiento) para que expire() la saque a tiempo y no siga
+    contando en len ni en la ocupación. Se busca su lugar desde el final,
+    donde están las entradas más recientes.
+    """
+
+    PRESSURE_LOW = 0.7
+    PRESSURE_HIGH = 0.9
+    MIN_TTL_FACTOR = 0.1
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        pressure = (len(self) / self.maxsize - self.PRESSURE_LOW) / (self.PRESSURE_HIGH - self.PRESSURE_LOW)
+        if pressure > 0:
+            factor = max(1 - pressure, self.MIN_TTL_FACTOR)
+            link = self._TTLCache__links[key]
+            link.expires -= self.ttl * (1 - factor)
+            prev = link.prev
+            root = self._TTLCache__root
+            if prev is not root and prev.expires > link.expires:
+                link.unlink()
+                while prev is not root and prev.expires > link.expires:
+                    prev = prev.prev
+                link.prev = prev
+                link.next = prev.next
+                prev.next.prev = link
+                prev.next = link
+
+
+class AccessCountTTLCache(PressureAwareTTLCache):
+    """
+    Cache que además del TTL invalida cada entrada después de max_reads
+    lecturas, para datos que conviene recalcular según cuánto se leen
+    (correlaciones, resúmenes) y no solo según el tiempo.
+
+    Internamente guarda [valor, lecturas_restantes]; __getitem__ devuelve
+    solo el valor. El TTL sigue siendo el límite superior.
+    """
+
+    def __init__(self, maxsize, ttl, max_reads: int, **kwargs):
+        super().__init__(maxsize, ttl, **kwargs)
+        self.max_reads = max_reads
+
+    def __getitem__(self, key):
+        entry = super().__getitem__(key)
+        entry[1] -= 1
+        if entry[1] <= 0:
+            # Última lectura permitida: la próxima será un miss
+            del self[key]
+        return entry[0]
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, [value, self.max_reads])
+
+    def pop(self, key, default=None):
+        # Invalidar no cuenta como lectura (y Cache.pop, que lee con
+        # self[key], fallaría al borrar si esa lectura agotó la entrada)
+        if key not in self:
+            return default
+        entry = super().__getitem__(key)
+        del self[key]
+        return entry[0]
+
+
+class TieredCache:
+    """
+    Cache de dos niveles: L1 en memoria del proceso y L2 en Redis,
+    compartido entre workers.
+
+    Lectura: L1 -> L2 (y se copia a L1) -> KeyError.
+    Escritura: ambos niveles, con el TTL de L1 en Redis.
+    Invalidación: pop en L1 y DEL en Redis; el L1 de los otros workers
+    queda con el valor viejo hasta su TTL (consistencia eventual).
+
+    Si Redis falla se loggea y se sigue solo con L1.
+    """
+
+    def __init__(self, name: str, local: TTLCache, client):
+        self.local = local
+        self.client = client
+        self._prefix = f"loki:cache:{name}:"
+
+    def _redis_key(self, key) -> str:
+        return self._prefix + repr(key)
+
+    @property
+    def maxsize(self):
+        return self.local.maxsize
+
+    @property
+    def ttl(self):
+        return self.local.ttl
+
+    def __len__(self):
+        return len(self.local)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, key):
+        try:
+            return self.local[key]
+        except KeyError:
+            pass
+        try:
+            raw = self.client.get(self._redis_key(key))
+        except Exception as e:
+            logger.warning(f"Redis no disponible (get): {e}")
+            raise KeyError(key)
+        if raw is None:
+            raise KeyError(key)
+        value = pickle.loads(raw)
+        self.local[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self.local[key] = value
+        try:
+            self.client.set(self._redis_key(key), pickle.dumps(value), ex=int(self.local.ttl))
+        except Exception as e:
+            logger.warning(f"Redis no disponible (set): {e}")
+
+    def pop(self, key, default=None):
+        value = self.local.pop(key, default)
+        try:
+            self.client.delete(self._redis_key(key))
+        except Exception as e:
+            logger.warning(f"Redis no disponible (delete): {e}")
+        return value
+
+    def clear(self):
+        """Limpia solo L1; las entradas en Redis expiran por TTL."""
+        self.local.clear()
+
+
+def _get_redis_client():
+    """Cliente Redis para el L2 de cache, o None si no está configurado."""
+    if not settings.REDIS_URL:
+        return None
+    if not REDIS_AVAILABLE:
+        logger.warning("REDIS_URL configurado pero el paquete redis no está instalado")
+        return None
+    # Timeouts cortos: ante un Redis lento se prefiere un miss a frenar el request
+    return redis.Redis.from_url(
+        settings.REDIS_URL, decode_responses=False, socket_timeout=0.2, socket_connect_timeout=0.2
+    )
+
+
+_redis_client = _get_redis_client()
+
+
+def _tiered(name: str, local: TTLCache):
+    """Envuelve el cache en un TieredCache si hay Redis; si no, lo deja igual."""
+    if _redis_client is None:
+        return local
+    return TieredCache(name, local, _redis_client)
+
 # Cache para usuarios (TTL: 5 minutos, max 1000 usuarios)
-usuario_cache = TTLCache(maxsize=1000, ttl=300)
+usuario_cache = PressureAwareTTLCache(maxsize=1000, ttl=300)
 
 # Cache para hábitos activos (TTL: 1 minuto, max 500 conjuntos)
-habitos_activos_cache = TTLCache(maxsize=500, ttl=60)
+habitos_activos_cache = PressureAwareTTLCache(maxsize=500, ttl=60)
 
 # Cache para trust level (TTL: 10 minutos, max 1000 usuarios)
-trust_level_cache = TTLCache(maxsize=1000, ttl=600)
+# Guarda dicts planos (no instancias ORM), así que se puede compartir en Redis
+trust_level_cache = _tiered('trust_level', PressureAwareTTLCache(maxsize=1000, ttl=600))
 
-# Cache para resúmenes de conversación (TTL: 15 minutos, max 100)
-resumenes_cache = TTLCache(maxsize=100, ttl=900)
+# Cache para el contexto histórico armado con los resúmenes de conversación
+# (TTL: 15 minutos o 50 lecturas, max 100)
+resumenes_cache = AccessCountTTLCache(maxsize=100, ttl=900, max_reads=50)
 
-# Cache para correlaciones (TTL: 30 minutos, max 100)
-correlaciones_cache = TTLCache(maxsize=100, ttl=1800)
+# Cache para las correlaciones guardadas de un usuario, ya serializadas
+# (TTL: 30 minutos o 50 lecturas, max 100)
+correlaciones_cache = AccessCountTTLCache(maxsize=100, ttl=1800, max_reads=50)
 
 # Cache para dashboard stats (TTL: 2 minutos, max 100)
-dashboard_cache = TTLCache(maxsize=100, ttl=120)
+dashboard_cache = PressureAwareTTLCache(maxsize=100, ttl=120)
+
+# Cache para respuestas exitosas por usuario (TTL: 1 minuto, max 500)
+respuestas_exitosas_cache = PressureAwareTTLCache(maxsize=500, ttl=60)
+
+# Cache para análisis de patrones por usuario (TTL: 5 minutos, max 200)
+patrones_cache = PressureAwareTTLCache(maxsize=200, ttl=300)
+
+# Cache para usuarios por teléfono (TTL: 5 minutos, max 10000 números)
+usuario_telefono_cache = PressureAwareTTLCache(maxsize=10_000, ttl=300)
+
+# Índice inverso usuario_id -> clave en usuario_telefono_cache, para invalidar
+# por usuario sin recorrer el cache. Mismo tamaño y TTL: se llena justo
+# después de la entrada que indexa, así que no vence antes que ella
+_usuario_telefono_keys = TTLCache(maxsize=10_000, ttl=300)
 
 
 # ===== Estadísticas de Cache =====
@@ -40,7 +264,14 @@ dashboard_cache = TTLCache(maxsize=100, ttl=120)
 class CacheStats:
     """
     Contador de estadísticas de cache para monitoreo.
+    
+    Los decoradores del camino caliente incrementan hits/misses
+    directamente (sin pasar por hit()/miss()). Los contadores no usan lock:
+    con varios threads se puede perder algún incremento, aceptable para
+    métricas de monitoreo.
     """
+    __slots__ = ('hits', 'misses', 'invalidations')
+    
     def __init__(self):
         self.hits = 0
         self.misses = 0
@@ -55,6 +286,14 @@ class CacheStats:
     def invalidate(self):
         self.invalidations += 1
     
+    @property
+    def total(self) -> int:
+        """
+        Total de accesos (hits + misses). Se deriva al leerlo en lugar de
+        mantener un tercer contador en cada acceso del camino caliente.
+        """
+        return self.hits + self.misses
+    
     @property
     def hit_rate(self) -> float:
         """Calcula el hit rate del cache."""
@@ -82,68 +321,203 @@ stats = {
     'resumenes': CacheStats(),
     'correlaciones': CacheStats(),
     'dashboard': CacheStats(),
+    'respuestas_exitosas': CacheStats(),
+    'patrones': CacheStats(),
+    'usuario_telefono': CacheStats(),
 }
 
 
+# ===== Single-flight =====
+
+# Locks por clave en cálculo: [lock, threads esperando]. Cada entrada se
+# borra cuando no queda nadie esperando, así el dict solo crece con la
+# cantidad de misses concurrentes, no con la cantidad de claves
+_inflight_locks: Dict[Hashable, list] = {}
+_inflight_guard = threading.Lock()
+
+
+def _load_single_flight(lock_key: Hashable, cache_get: Callable, cache_set: Callable,
+                        cache_key: Hashable, loader: Callable):
+    """
+    Ejecuta loader() para una clave que no está en cache, de a un thread
+    por clave: los demás threads que fallan en la misma clave esperan y
+    leen el resultado del cache en lugar de repetir la consulta a la BD.
+    """
+    with _inflight_guard:
+        entry = _inflight_locks.get(lock_key)
+        if entry is None:
+            entry = _inflight_locks[lock_key] = [threading.Lock(), 0]
+        entry[1] += 1
+    
+    try:
+        with entry[0]:
+            # Otro thread pudo haberlo cargado mientras esperábamos
+            try:
+                return cache_get(cache_key)
+            except KeyError:
+                pass
+            
+            result = loader()
+            if result is not None:
+                cache_set(cache_key, result)
+            return result
+    finally:
+        with _inflight_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _inflight_locks[lock_key]
+
+
 # ===== Decoradores de Cache =====
 
 def cached_usuario(func: Callable) -> Callable:
     """
     Decorator para cachear resultados de get_usuario.
     
-    Cache key: f"usuario:{usuario_id}"
+    Cache key: usuario_id (int; el cache ya es específico del tipo)
     TTL: 5 minutos
     """
+    # Métodos y stats enlazados una sola vez: el wrapper corre en cada request
+    _cache_get = usuario_cache.__getitem__
+    _cache_set = usuario_cache.__setitem__
+    _stats = stats['usuario']
+    _debug, _debug_enabled = logger.debug, logger.isEnabledFor
+    
     @wraps(func)
     def wrapper(db, usuario_id: int, *args, **kwargs):
-        cache_key = f"usuario:{usuario_id}"
-        
-        # Intentar obtener del cache
-        if cache_key in usuario_cache:
-            stats['usuario'].hit()
-            logger.debug(f"Cache HIT: {cache_key}")
-            return usuario_cache[cache_key]
+        # Intentar obtener del cache (una sola búsqueda)
+        try:
+            result = _cache_get(usuario_id)
+        except KeyError:
+            pass
+        else:
+            _stats.hits += 1
+            if _debug_enabled(_DEBUG):
+                _debug("Cache HIT: usuario:%s", usuario_id)
+            return result
         
         # Cache miss - ejecutar función
-        stats['usuario'].miss()
-        logger.debug(f"Cache MISS: {cache_key}")
-        result = func(db, usuario_id, *args, **kwargs)
-        
+        _stats.misses += 1
+        if _debug_enabled(_DEBUG):
+            _debug("Cache MISS: usuario:%s", usuario_id)
         # Guardar en cache solo si hay resultado
+        return _load_single_flight(
+            ('usuario', usuario_id), _cache_get, _cache_set, usuario_id,
+            lambda: func(db, usuario_id, *args, **kwargs)
+        )
+    
+    return wrapper
+
+
+def _detached_copy(instance):
+    """
+    Copia las columnas de una instancia ORM en una instancia detached
+    independiente de la sesión original (no se expira con sus commits).
+    """
+    mapper = inspect(instance).mapper
+    copy = mapper.class_(**{attr.key: getattr(instance, attr.key) for attr in mapper.column_attrs})
+    make_transient_to_detached(copy)
+    return copy
+
+
+def cached_usuario_by_telefono(func: Callable) -> Callable:
+    """
+    Decorator para cachear resultados de get_usuario_by_telefono.
+    
+    Cache key: f"usuario_telefono:{telefono}"
+    TTL: 5 minutos
+    
+    Guarda una copia detached del usuario y en cada hit la incorpora a la
+    sesión con merge(load=False), así el objeto devuelto se puede modificar
+    y persistir sin ejecutar el SELECT.
+    """
+    @wraps(func)
+    def wrapper(db, telefono: str, *args, **kwargs):
+        cached = get_cached_usuario_by_telefono(db, telefono)
+        if cached is not None:
+            return cached
+        
+        result = func(db, telefono, *args, **kwargs)
+        
         if result is not None:
-            usuario_cache[cache_key] = result
+            cache_usuario_by_telefono(telefono, result)
         
         return result
     
     return wrapper
 
 
+def get_cached_usuario_by_telefono(db, telefono: str):
+    """
+    Devuelve el usuario cacheado para el teléfono, ya incorporado a la
+    sesión, o None si no está en cache.
+    """
+    cache_key = _usuario_telefono_key(telefono)
+    _stats = stats['usuario_telefono']
+    
+    try:
+        cached = usuario_telefono_cache[cache_key]
+    except KeyError:
+        _stats.misses += 1
+        if logger.isEnabledFor(_DEBUG):
+            logger.debug("Cache MISS: %s", cache_key)
+        return None
+    
+    _stats.hits += 1
+    if logger.isEnabledFor(_DEBUG):
+        logger.debug("Cache HIT: %s", cache_key)
+    return db.merge(cached, load=False)
+
+
+def cache_usuario_by_telefono(telefono: str, usuario):
+    """Guarda una copia detached del usuario en el cache por teléfono."""
+    cache_key = _usuario_telefono_key(telefono)
+    usuario_telefono_cache[cache_key] = _detached_copy(usuario)
+    previous_key = _usuario_telefono_keys.get(usuario.id)
+    _usuario_telefono_keys[usuario.id] = cache_key
+    if previous_key is not None and previous_key != cache_key:
+        # El usuario cambió de teléfono: la entrada anterior quedó vieja
+        usuario_telefono_cache.pop(previous_key, None)
+
+
+def _usuario_telefono_key(telefono: str) -> str:
+    """Clave por teléfono normalizado (los webhooks lo reciben sin '+')."""
+    return f"usuario_telefono:{sanitize_phone_number(telefono)}"
+
+
 def cached_habitos_activos(func: Callable) -> Callable:
     """
     Decorator para cachear hábitos activos de un usuario.
     
-    Cache key: f"habitos_activos:{usuario_id}"
+    Cache key: usuario_id (int; el cache ya es específico del tipo)
     TTL: 1 minuto
     """
+    _cache_get = habitos_activos_cache.__getitem__
+    _cache_set = habitos_activos_cache.__setitem__
+    _stats = stats['habitos_activos']
+    _debug, _debug_enabled = logger.debug, logger.isEnabledFor
+    
     @wraps(func)
     def wrapper(db, usuario_id: int, activo: Optional[bool] = None, *args, **kwargs):
         # Solo cachear cuando se piden hábitos activos
         if activo is True:
-            cache_key = f"habitos_activos:{usuario_id}"
+            try:
+                result = _cache_get(usuario_id)
+            except KeyError:
+                pass
+            else:
+                _stats.hits += 1
+                if _debug_enabled(_DEBUG):
+                    _debug("Cache HIT: habitos_activos:%s", usuario_id)
+                return result
             
-            if cache_key in habitos_activos_cache:
-                stats['habitos_activos'].hit()
-                logger.debug(f"Cache HIT: {cache_key}")
-                return habitos_activos_cache[cache_key]
-            
-            stats['habitos_activos'].miss()
-            logger.debug(f"Cache MISS: {cache_key}")
-            result = func(db, usuario_id, activo, *args, **kwargs)
-            
-            if result is not None:
-                habitos_activos_cache[cache_key] = result
-            
-            return result
+            _stats.misses += 1
+            if _debug_enabled(_DEBUG):
+                _debug("Cache MISS: habitos_activos:%s", usuario_id)
+            return _load_single_flight(
+                ('habitos_activos', usuario_id), _cache_get, _cache_set, usuario_id,
+                lambda: func(db, usuario_id, activo, *args, **kwargs)
+            )
         
         # Si no es activo=True, no cachear
         return func(db, usuario_id, activo, *args, **kwargs)
@@ -151,49 +525,84 @@ def cached_habitos_activos(func: Callable) -> Callable:
     return wrapper
 
 
-def cached_trust_level(func: Callable) -> Callable:
+def _cached_trust_level(usuario_id_index: int) -> Callable:
     """
-    Decorator para cachear nivel de confianza de un usuario.
-    
-    Cache key: f"trust_level:{usuario_id}"
-    TTL: 10 minutos
-    
-    Funciona tanto con funciones como con métodos de clase.
+    Arma el decorator de cache de trust level para una posición fija de
+    usuario_id en los argumentos (0 en funciones, 1 en métodos por self).
     """
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        # Detectar si es método de clase (args[0] es self) o función
-        if len(args) >= 2 and hasattr(args[0], '__class__'):
-            # Es método: args[0] = self, args[1] = usuario_id
-            usuario_id = args[1]
-        elif len(args) >= 1:
-            # Es función: args[0] = usuario_id
-            usuario_id = args[0]
-        else:
-            # No hay usuario_id posicional, ejecutar sin cache
-            return func(*args, **kwargs)
+    def decorator(func: Callable) -> Callable:
+        _cache_get = trust_level_cache.__getitem__
+        _cache_set = trust_level_cache.__setitem__
+        _stats = stats['trust_level']
+        _debug, _debug_enabled = logger.debug, logger.isEnabledFor
         
-        cache_key = f"trust_level:{usuario_id}"
-        
-        if cache_key in trust_level_cache:
-            stats['trust_level'].hit()
-            logger.debug(f"Cache HIT: {cache_key}")
-            return trust_level_cache[cache_key]
-        
-        stats['trust_level'].miss()
-        logger.debug(f"Cache MISS: {cache_key}")
-        result = func(*args, **kwargs)
-        
-        if result is not None:
-            trust_level_cache[cache_key] = result
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                usuario_id = args[usuario_id_index]
+            except IndexError:
+                # No hay usuario_id posicional, ejecutar sin cache
+                return func(*args, **kwargs)
+            
+            try:
+                result = _cache_get(usuario_id)
+            except KeyError:
+                pass
+            else:
+                _stats.hits += 1
+                if _debug_enabled(_DEBUG):
+                    _debug("Cache HIT: trust_level:%s", usuario_id)
+                return result
+            
+            _stats.misses += 1
+            if _debug_enabled(_DEBUG):
+                _debug("Cache MISS: trust_level:%s", usuario_id)
+            return _load_single_flight(
+                ('trust_level', usuario_id), _cache_get, _cache_set, usuario_id,
+                lambda: func(*args, **kwargs)
+            )
         
-        return result
+        return wrapper
     
-    return wrapper
+    return decorator
+
+
+def cached_trust_level_func(func: Callable) -> Callable:
+    """
+    Decorator para cachear nivel de confianza de un usuario en funciones
+    cuyo primer argumento posicional es usuario_id.
+    
+    Cache key: usuario_id (int; el cache ya es específico del tipo)
+    TTL: 10 minutos
+    """
+    return _cached_trust_level(0)(func)
+
+
+def cached_trust_level_method(func: Callable) -> Callable:
+    """
+    Decorator para cachear nivel de confianza de un usuario en métodos
+    cuyo primer argumento después de self es usuario_id.
+    
+    Cache key: usuario_id (int; el cache ya es específico del tipo)
+    TTL: 10 minutos
+    """
+    return _cached_trust_level(1)(func)
 
 
 # ===== Funciones de Invalidación =====
 
+# Caches indexados por usuario_id (int) con sus estadísticas, para
+# invalidar todo lo de un usuario en una sola pasada
+USER_CACHES = (
+    (usuario_cache, stats['usuario']),
+    (habitos_activos_cache, stats['habitos_activos']),
+    (trust_level_cache, stats['trust_level']),
+    (respuestas_exitosas_cache, stats['respuestas_exitosas']),
+    (resumenes_cache, stats['resumenes']),
+    (correlaciones_cache, stats['correlaciones']),
+)
+
+
 def invalidate_usuario_cache(usuario_id: int):
     """
     Invalida cache de usuario específico.
@@ -201,11 +610,9 @@ def invalidate_usuario_cache(usuario_id: int):
     Args:
         usuario_id: ID del usuario a invalidar
     """
-    cache_key = f"usuario:{usuario_id}"
-    if cache_key in usuario_cache:
-        del usuario_cache[cache_key]
+    if usuario_cache.pop(usuario_id, None) is not None:
         stats['usuario'].invalidate()
-        logger.info(f"Cache invalidated: {cache_key}")
+        logger.info(f"Cache invalidated: usuario:{usuario_id}")
 
 
 def invalidate_habitos_cache(usuario_id: int):
@@ -215,11 +622,9 @@ def invalidate_habitos_cache(usuario_id: int):
     Args:
         usuario_id: ID del usuario a invalidar
     """
-    cache_key = f"habitos_activos:{usuario_id}"
-    if cache_key in habitos_activos_cache:
-        del habitos_activos_cache[cache_key]
+    if habitos_activos_cache.pop(usuario_id, None) is not None:
         stats['habitos_activos'].invalidate()
-        logger.info(f"Cache invalidated: {cache_key}")
+        logger.info(f"Cache invalidated: habitos_activos:{usuario_id}")
 
 
 def invalidate_trust_level_cache(usuario_id: int):
@@ -229,10 +634,60 @@ def invalidate_trust_level_cache(usuario_id: int):
     Args:
         usuario_id: ID del usuario a invalidar
     """
-    cache_key = f"trust_level:{usuario_id}"
-    if cache_key in trust_level_cache:
-        del trust_level_cache[cache_key]
+    if trust_level_cache.pop(usuario_id, None) is not None:
         stats['trust_level'].invalidate()
+        logger.info(f"Cache invalidated: trust_level:{usuario_id}")
+
+
+def invalidate_respuestas_exitosas_cache(usuario_id: int):
+    """
+    Invalida cache de respuestas exitosas de un usuario.
+    
+    Args:
+        usuario_id: ID del usuario a invalidar
+    """
+    if respuestas_exitosas_cache.pop(usuario_id, None) is not None:
+        stats['respuestas_exitosas'].invalidate()
+        logger.info(f"Cache invalidated: respuestas_exitosas:{usuario_id}")
+
+
+def invalidate_resumenes_cache(usuario_id: int):
+    """
+    Invalida cache de contexto histórico (resúmenes) de un usuario.
+    
+    Args:
+        usuario_id: ID del usuario a invalidar
+    """
+    if resumenes_cache.pop(usuario_id, None) is not None:
+        stats['resumenes'].invalidate()
+        logger.info(f"Cache invalidated: resumenes:{usuario_id}")
+
+
+def invalidate_correlaciones_cache(usuario_id: int):
+    """
+    Invalida cache de correlaciones guardadas de un usuario.
+    
+    Args:
+        usuario_id: ID del usuario a invalidar
+    """
+    if correlaciones_cache.pop(usuario_id, None) is not None:
+        stats['correlaciones'].invalidate()
+        logger.info(f"Cache invalidated: correlaciones:{usuario_id}")
+
+
+def invalidate_usuario_telefono_cache(telefono: str):
+    """
+    Invalida cache de usuario por teléfono.
+    
+    Args:
+        telefono: Número de teléfono del usuario a invalidar
+    """
+    cache_key = _usuario_telefono_key(telefono)
+    usuario = usuario_telefono_cache.pop(cache_key, None)
+    if usuario is not None:
+        if _usuario_telefono_keys.get(usuario.id) == cache_key:
+            del _usuario_telefono_keys[usuario.id]
+        stats['usuario_telefono'].invalidate()
         logger.info(f"Cache invalidated: {cache_key}")
 
 
@@ -243,10 +698,15 @@ def invalidate_all_user_caches(usuario_id: int):
     Args:
         usuario_id: ID del usuario a invalidar
     """
-    invalidate_usuario_cache(usuario_id)
-    invalidate_habitos_cache(usuario_id)
-    invalidate_trust_level_cache(usuario_id)
-    logger.info(f"All caches invalidated for usuario_id={usuario_id}")
+    # Caches con clave usuario_id: una pasada sobre la tabla y un solo log
+    for cache, cache_stats in USER_CACHES:
+        if cache.pop(usuario_id, None) is not None:
+            cache_stats.invalidations += 1
+    
+    cache_key = _usuario_telefono_keys.pop(usuario_id, None)
+    if cache_key is not None and usuario_telefono_cache.pop(cache_key, None) is not None:
+        stats['usuario_telefono'].invalidations += 1
+    logger.info("All caches invalidated for usuario_id=%s", usuario_id)
 
 
 def clear_all_caches():
@@ -259,6 +719,10 @@ def clear_all_caches():
     resumenes_cache.clear()
     correlaciones_cache.clear()
     dashboard_cache.clear()
+    respuestas_exitosas_cache.clear()
+    patrones_cache.clear()
+    usuario_telefono_cache.clear()
+    _usuario_telefono_keys.clear()
     
     # Reset stats
     for stat in stats.values():
@@ -269,51 +733,45 @@ def clear_all_caches():
 
 # ===== Funciones de Monitoreo =====
 
+# Tabla estática nombre -> (cache, estadísticas), armada una sola vez
+_CACHES = {
+    'usuario': (usuario_cache, stats['usuario']),
+    'habitos_activos': (habitos_activos_cache, stats['habitos_activos']),
+    'trust_level': (trust_level_cache, stats['trust_level']),
+    'resumenes': (resumenes_cache, stats['resumenes']),
+    'correlaciones': (correlaciones_cache, stats['correlaciones']),
+    'dashboard': (dashboard_cache, stats['dashboard']),
+    'respuestas_exitosas': (respuestas_exitosas_cache, stats['respuestas_exitosas']),
+    'patrones': (patrones_cache, stats['patrones']),
+    'usuario_telefono': (usuario_telefono_cache, stats['usuario_telefono']),
+}
+
+
 def get_cache_stats() -> dict:
     """
     Retorna estadísticas de todos los caches.
     
+    Los valores son numéricos para que los pueda consumir directamente
+    un scraper de métricas, sin parsear strings.
+    
     Returns:
         Dict con estadísticas por cache
     """
-    return {
-        'usuario': {
-            'size': len(usuario_cache),
-            'maxsize': usuario_cache.maxsize,
-            'ttl': 300,
-            'stats': str(stats['usuario'])
-        },
-        'habitos_activos': {
-            'size': len(habitos_activos_cache),
-            'maxsize': habitos_activos_cache.maxsize,
-            'ttl': 60,
-            'stats': str(stats['habitos_activos'])
-        },
-        'trust_level': {
-            'size': len(trust_level_cache),
-            'maxsize': trust_level_cache.maxsize,
-            'ttl': 600,
-            'stats': str(stats['trust_level'])
-        },
-        'resumenes': {
-            'size': len(resumenes_cache),
-            'maxsize': resumenes_cache.maxsize,
-            'ttl': 900,
-            'stats': str(stats['resumenes'])
-        },
-        'correlaciones': {
-            'size': len(correlaciones_cache),
-            'maxsize': correlaciones_cache.maxsize,
-            'ttl': 1800,
-            'stats': str(stats['correlaciones'])
-        },
-        'dashboard': {
-            'size': len(dashboard_cache),
-            'maxsize': dashboard_cache.maxsize,
-            'ttl': 120,
-            'stats': str(stats['dashboard'])
+    result = {}
+    for name, (cache, cache_stats) in _CACHES.items():
+        hits, misses = cache_stats.hits, cache_stats.misses
+        total = hits + misses
+        result[name] = {
+            'size': len(cache),
+            'maxsize': cache.maxsize,
+            'ttl': cache.ttl,
+            'hits': hits,
+            'misses': misses,
+            'total': total,
+            'invalidations': cache_stats.invalidations,
+            'hit_rate': (hits / total * 100) if total > 0 else 0.0
         }
-    }
+    return result
 
 
 def print_cache_stats():
@@ -329,12 +787,17 @@ def print_cache_stats():
         print(f"\n🔹 {cache_name.upper()}")
         print(f"   Size: {cache_info['size']}/{cache_info['maxsize']}")
         print(f"   TTL: {cache_info['ttl']}s")
-        print(f"   {cache_info['stats']}")
+        print(
+            f"   Hits: {cache_info['hits']}, Misses: {cache_info['misses']}, "
+            f"Invalidations: {cache_info['invalidations']}, Hit Rate: {cache_info['hit_rate']:.2f}%"
+        )
     
-    # Calcular totales
-    total_hits = sum(s.hits for s in stats.values())
-    total_misses = sum(s.misses for s in stats.values())
-    total_invalidations = sum(s.invalidations for s in stats.values())
+    # Calcular totales en una sola pasada
+    total_hits = total_misses = total_invalidations = 0
+    for cache_info in cache_stats.values():
+        total_hits += cache_info['hits']
+        total_misses += cache_info['misses']
+        total_invalidations += cache_info['invalidations']
     total_requests = total_hits + total_misses
     overall_hit_rate = (total_hits / total_requests * 100) if total_requests > 0 else 0
     
@@ -369,17 +832,34 @@ CACHE_CONFIG = {
     'resumenes': {
         'maxsize': 100,
         'ttl': 900,  # 15 minutos
+        'max_reads': 50,
         'description': 'Resúmenes de conversación'
     },
     'correlaciones': {
         'maxsize': 100,
         'ttl': 1800,  # 30 minutos
+        'max_reads': 50,
         'description': 'Correlaciones calculadas'
     },
     'dashboard': {
         'maxsize': 100,
         'ttl': 120,  # 2 minutos
         'description': 'Estadísticas de dashboard'
+    },
+    'respuestas_exitosas': {
+        'maxsize': 500,
+        'ttl': 60,  # 1 minuto
+        'description': 'Respuestas exitosas aprendidas por usuario'
+    },
+    'patrones': {
+        'maxsize': 200,
+        'ttl': 300,  # 5 minutos
+        'description': 'Análisis de patrones por usuario'
+    },
+    'usuario_telefono': {
+        'maxsize': 10_000,
+        'ttl': 300,  # 5 minutos
+        'description': 'Usuario por número de teléfono (webhooks)'
     }
 }
 
@@ -395,6 +875,8 @@ def print_cache_config():
         print(f"\n🔹 {cache_name.upper()}")
         print(f"   Max Size: {config['maxsize']} items")
         print(f"   TTL: {config['ttl']}s ({config['ttl'] // 60}min)")
+        if 'max_reads' in config:
+            print(f"   Max Reads: {config['max_reads']}")
         print(f"   Description: {config['description']}")
     
     print()
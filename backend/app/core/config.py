@@ -25,6 +25,11 @@ class Settings(BaseSettings):
         default="sqlite:///./data/moodtracker.db",
         validation_alias="DATABASE_URL",
     )
+    # Pool de conexiones (PostgreSQL). Conexiones máximas por worker:
+    # DB_POOL_SIZE + DB_MAX_OVERFLOW; multiplicar por WEB_CONCURRENCY
+    DB_POOL_SIZE: int = Field(default=20, validation_alias="DB_POOL_SIZE")
+    DB_MAX_OVERFLOW: int = Field(default=10, validation_alias="DB_MAX_OVERFLOW")
+    DB_POOL_RECYCLE: int = Field(default=1800, validation_alias="DB_POOL_RECYCLE")
     
     # Authentication & Security
     SECRET_KEY: str = Field(..., min_length=32, validation_alias="SECRET_KEY")
@@ -53,6 +58,9 @@ class Settings(BaseSettings):
     WHATSAPP_VERIFY_TOKEN: str | None = Field(default=None, validation_alias="WHATSAPP_VERIFY_TOKEN")
     WHATSAPP_PHONE_NUMBER_ID: str | None = Field(default=None, validation_alias="WHATSAPP_PHONE_NUMBER_ID")
     
+    # Redis (opcional): segundo nivel de cache compartido entre workers
+    REDIS_URL: str | None = Field(default=None, validation_alias="REDIS_URL")
+    
     # Logging Configuration
     LOG_LEVEL: str = Field(default="INFO", validation_alias="LOG_LEVEL")
     ENV: str = Field(default="development", validation_alias="ENV")
@@ -0,0 +1,183 @@
+"""
+Middleware CORS en ASGI puro.
+
+Reemplazo directo de starlette.middleware.cors.CORSMiddleware para la
+configuración de la app (orígenes explícitos o "*", credenciales, listas
+fijas de métodos y headers), con el mismo comportamiento:
+- Requests sin header Origin pasan sin tocar
+- Preflight (OPTIONS + Access-Control-Request-Method): 200 "OK" o 400
+  "Disallowed CORS ..." con los headers de preflight
+- Requests simples: agrega Access-Control-Allow-Origin (y Vary: Origin
+  cuando refleja el origen) a la respuesta
+
+Trabaja directo sobre los headers en bytes del scope: los headers de
+preflight y de respuestas simples se arman una sola vez al construir el
+middleware, sin objetos Headers/MutableHeaders/Response por request.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+ALL_METHODS = ("DELETE", "GET", "HEAD", "OPTIONS", "PATCH", "POST", "PUT")
+# Headers que el navegador siempre puede enviar (mismos que Starlette)
+SAFELISTED_HEADERS = {"Accept", "Accept-Language", "Content-Language", "Content-Type"}
+
+_TEXT_PLAIN = (b"content-type", b"text/plain; charset=utf-8")
+
+RawHeaders = List[Tuple[bytes, bytes]]
+
+
+class CORSMiddleware:
+    """
+    Middleware ASGI que aplica la política CORS.
+
+    Acepta los mismos argumentos que el CORSMiddleware de Starlette salvo
+    allow_origin_regex y expose_headers, que la app no usa.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        allow_origins: Sequence[str] = (),
+        allow_methods: Sequence[str] = ("GET",),
+        allow_headers: Sequence[str] = (),
+        allow_credentials: bool = False,
+        max_age: int = 600,
+    ):
+        if "*" in allow_methods:
+            allow_methods = ALL_METHODS
+
+        self.app = app
+        self.allow_all_origins = "*" in allow_origins
+        self.allow_all_headers = "*" in allow_headers
+        self.allow_origins = frozenset(origin.encode("latin-1") for origin in allow_origins)
+        self.allow_methods = frozenset(method.encode("latin-1") for method in allow_methods)
+
+        allow_headers = sorted(SAFELISTED_HEADERS | set(allow_headers))
+        self.allow_headers = frozenset(h.lower().encode("latin-1") for h in allow_headers)
+
+        # Con credenciales el origen se refleja siempre (nunca "*")
+        self.preflight_explicit_allow_origin = not self.allow_all_origins or allow_credentials
+
+        preflight_headers: RawHeaders = []
+        if self.preflight_explicit_allow_origin:
+            preflight_headers.append((b"vary", b"Origin"))
+        else:
+            preflight_headers.append((b"access-control-allow-origin", b"*"))
+        preflight_headers.append((b"access-control-allow-methods", ", ".join(allow_methods).encode("latin-1")))
+        preflight_headers.append((b"access-control-max-age", str(max_age).encode("latin-1")))
+        if allow_headers and not self.allow_all_headers:
+            preflight_headers.append((b"access-control-allow-headers", ", ".join(allow_headers).encode("latin-1")))
+        if allow_credentials:
+            preflight_headers.append((b"access-control-allow-credentials", b"true"))
+        self.preflight_headers = tuple(preflight_headers)
+
+        credentials: RawHeaders = [(b"access-control-allow-credentials", b"true")] if allow_credentials else []
+        # Respuesta simple con "*"; con cookie se refleja el origen en su lugar
+        self.simple_headers_wildcard = tuple(
+            [(b"access-control-allow-origin", b"*")] + credentials
+        )
+        # Respuesta simple que refleja el origen (se agrega además Vary)
+        self.simple_headers_explicit = tuple(credentials)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Una sola pasada por los headers del request (primer valor de cada uno)
+        origin = request_method = request_headers = None
+        has_cookie = False
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                if origin is None:
+                    origin = value
+            elif name == b"access-control-request-method":
+                if request_method is None:
+                    request_method = value
+            elif name == b"access-control-request-headers":
+                if request_headers is None:
+                    request_headers = value
+            elif name == b"cookie":
+                has_cookie = True
+
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
+
+        if request_method is not None and scope["method"] == "OPTIONS":
+            await self._preflight(send, origin, request_method, request_headers)
+            return
+
+        if self.allow_all_origins:
+            if has_cookie:
+                # Con cookies hay que responder el origen concreto, no "*"
+                extra = self.simple_headers_explicit
+                reflect = True
+            else:
+                extra = self.simple_headers_wildcard
+                reflect = False
+        elif origin in self.allow_origins:
+            extra = self.simple_headers_explicit
+            reflect = True
+        else:
+            # Origen no permitido: solo los headers fijos (como Starlette)
+            extra = self.simple_headers_explicit
+            reflect = False
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", ()))
+                headers.extend(extra)
+                if reflect:
+                    headers.append((b"access-control-allow-origin", origin))
+                    _add_vary_origin(headers)
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _preflight(
+        self, send: Send, origin: bytes, request_method: bytes, request_headers: Optional[bytes]
+    ) -> None:
+        headers = list(self.preflight_headers)
+        failures = []
+
+        if self.allow_all_origins or origin in self.allow_origins:
+            if self.preflight_explicit_allow_origin:
+                headers.append((b"access-control-allow-origin", origin))
+        else:
+            failures.append("origin")
+
+        if request_method not in self.allow_methods:
+            failures.append("method")
+
+        if self.allow_all_headers and request_headers is not None:
+            # Con "*" se reflejan los headers pedidos
+            headers.append((b"access-control-allow-headers", request_headers))
+        elif request_headers is not None:
+            for header in request_headers.lower().split(b","):
+                if header.strip() not in self.allow_headers:
+                    failures.append("headers")
+                    break
+
+        if failures:
+            status = 400
+            body = ("Disallowed CORS " + ", ".join(failures)).encode("utf-8")
+        else:
+            status = 200
+            body = b"OK"
+
+        headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        headers.append(_TEXT_PLAIN)
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+def _add_vary_origin(headers: RawHeaders) -> None:
+    """Agrega Origin al header Vary, sumándolo a uno existente si lo hay."""
+    for index, (name, value) in enumerate(headers):
+        if name.lower() == b"vary":
+            headers[index] = (name, value + b", Origin")
+            return
+    headers.append((b"vary", b"Origin"))
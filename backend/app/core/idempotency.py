@@ -0,0 +1,55 @@
+"""
+Idempotencia de webhooks entrantes.
+
+WhatsApp (Meta) y Twilio reintentan el webhook cuando no respondemos a
+tiempo. Cada mensaje se marca por su ID (message_id / MessageSid) y los
+reintentos del mismo ID se descartan antes de correr la IA, las escrituras
+en BD y el envío de la respuesta.
+
+Los IDs se guardan en memoria del proceso (TTLCache): con varios workers
+cada uno deduplica los reintentos que recibe.
+"""
+from typing import Optional
+from cachetools import TTLCache
+import logging
+
+logger = logging.getLogger(__name__)
+
+# IDs de mensajes ya recibidos (TTL: 10 minutos, max 10000)
+_processed_messages = TTLCache(maxsize=10_000, ttl=600)
+
+
+def mark_message(message_id: Optional[str]) -> bool:
+    """
+    Marca un mensaje como recibido.
+
+    Args:
+        message_id: ID del mensaje según el proveedor
+
+    Returns:
+        True si es la primera vez que se ve el ID (hay que procesarlo),
+        False si es un reintento. Sin ID siempre se procesa.
+    """
+    if not message_id:
+        return True
+
+    if message_id in _processed_messages:
+        logger.info(f"Webhook duplicado ignorado: {message_id}")
+        return False
+
+    _processed_messages[message_id] = True
+    return True
+
+
+def unmark_message(message_id: Optional[str]):
+    """
+    Quita la marca de un mensaje cuyo procesamiento falló,
+    para que el reintento del proveedor vuelva a procesarlo.
+    """
+    if message_id:
+        _processed_messages.pop(message_id, None)
+
+
+def clear_processed_messages():
+    """Limpia los IDs registrados. Útil para testing."""
+    _processed_messages.clear()
@@ -2,12 +2,65 @@
 Sistema de logging centralizado para Loki Mood Tracker.
 Reemplaza todos los print() con logging estructurado.
 """
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
 from typing import Optional
 
+# Formato detallado
+LOG_FORMAT = '%(asctime)s | %(name)s | %(levelname)s | %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Un solo Formatter para todos los handlers (es inmutable una vez creado)
+_FORMATTER = logging.Formatter(fmt=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+
+
+@lru_cache(maxsize=1)
+def _get_console_handler() -> logging.Handler:
+    """Handler de consola (stdout) compartido por todos los loggers."""
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(_FORMATTER)
+    return console_handler
+
+
+@lru_cache(maxsize=1)
+def _get_file_queue_handler() -> logging.Handler:
+    """
+    Handler de archivo compartido por todos los loggers: el directorio y
+    el nombre del archivo se resuelven una sola vez por proceso.
+
+    Los loggers solo encolan el registro (QueueHandler); un QueueListener
+    en un thread aparte hace la escritura a disco, así los requests no se
+    bloquean en write()/flush() del archivo.
+    """
+    # Crear directorio de logs si no existe
+    logs_dir = Path("logs")
+    logs_dir.mkdir(exist_ok=True)
+
+    # Nombre de archivo con fecha
+    log_filename = f"loki_{datetime.now().strftime('%Y%m%d')}.log"
+    log_path = logs_dir / log_filename
+
+    file_handler = logging.FileHandler(log_path, encoding='utf-8')
+    file_handler.setLevel(logging.DEBUG)  # Archivo guarda todo
+    file_handler.setFormatter(_FORMATTER)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    # Vaciar la cola y cerrar el archivo al terminar el proceso
+    atexit.register(listener.stop)
+
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setLevel(logging.DEBUG)
+    return queue_handler
+
 
 def setup_logger(
     name: str,
@@ -33,32 +86,12 @@ def setup_logger(
 
     logger.setLevel(level)
 
-    # Formato detallado
-    formatter = logging.Formatter(
-        fmt='%(asctime)s | %(name)s | %(levelname)s | %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-
     # Handler para consola (stdout)
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    logger.addHandler(_get_console_handler())
 
     # Handler para archivo (si está habilitado)
     if log_to_file:
-        # Crear directorio de logs si no existe
-        logs_dir = Path("logs")
-        logs_dir.mkdir(exist_ok=True)
-
-        # Nombre de archivo con fecha
-        log_filename = f"loki_{datetime.now().strftime('%Y%m%d')}.log"
-        log_path = logs_dir / log_filename
-
-        file_handler = logging.FileHandler(log_path, encoding='utf-8')
-        file_handler.setLevel(logging.DEBUG)  # Archivo guarda todo
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        logger.addHandler(_get_file_queue_handler())
 
     return logger
 
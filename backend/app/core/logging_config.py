@@ -9,19 +9,64 @@ Características:
 - Audit logging para operaciones sensibles
 - Context injection (request_id, user_id, etc.)
 """
+import atexit
+import copy
 import logging
 import logging.handlers
-import json
+import queue
 import sys
+import threading
+import time
 from pathlib import Path
 from datetime import datetime
 from typing import Optional, Dict, Any
 from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+import orjson
 
 # Variables de contexto para request tracing
 request_id_var: ContextVar[Optional[str]] = ContextVar('request_id', default=None)
 user_id_var: ContextVar[Optional[int]] = ContextVar('user_id', default=None)
 
+# Métodos ligados: se llaman en cada record
+_rid_get = request_id_var.get
+_uid_get = user_id_var.get
+
+# datetime naive en UTC -> RFC 3339 con sufijo Z; claves no-str como json.dumps
+_ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+# Auditoría: registros por lote y antigüedad máxima del lote (segundos)
+AUDIT_BUFFER_CAPACITY = 256
+AUDIT_FLUSH_INTERVAL = 5.0
+
+# Listeners activos; setup_logging los reemplaza en cada llamada
+_queue_listeners: list[logging.handlers.QueueListener] = []
+
+
+def _record_context(record: logging.LogRecord) -> tuple[Optional[str], Optional[int]]:
+    """
+    Obtiene (request_id, user_id) de un record.
+
+    Los records que pasan por la cola llevan el contexto capturado en el
+    hilo que los emitió; el listener corre en otro hilo sin ese contexto.
+    """
+    if hasattr(record, 'request_id'):
+        return record.request_id, record.user_id
+    return _rid_get(), _uid_get()
+
+
+def _exc_text(formatter: logging.Formatter, record: logging.LogRecord) -> str:
+    """
+    Traceback formateado del record, calculado una sola vez.
+
+    Se guarda en ``record.exc_text`` (como hace logging.Formatter) para que
+    los demás handlers del mismo record lo reutilicen.
+    """
+    if not record.exc_text:
+        record.exc_text = formatter.formatException(record.exc_info)
+    return record.exc_text
+
 
 class StructuredFormatter(logging.Formatter):
     """
@@ -40,8 +85,17 @@ class StructuredFormatter(logging.Formatter):
         Returns:
             String JSON con todos los campos del log
         """
+        return self.format_bytes(record).decode()
+    
+    def format_bytes(self, record: logging.LogRecord) -> bytes:
+        """
+        Formatea un log record como JSON en UTF-8, tal como lo genera orjson.
+        
+        Usado por los handlers de archivo binarios para escribir sin
+        decodificar y re-codificar cada línea.
+        """
         log_data = {
-            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'timestamp': datetime.utcfromtimestamp(record.created),
             'level': record.levelname,
             'logger': record.name,
             'message': record.getMessage(),
@@ -51,23 +105,24 @@ class StructuredFormatter(logging.Formatter):
         }
         
         # Agregar contexto de request si existe
-        request_id = request_id_var.get()
+        request_id, user_id = _record_context(record)
         if request_id:
             log_data['request_id'] = request_id
         
-        user_id = user_id_var.get()
         if user_id:
             log_data['user_id'] = user_id
         
         # Agregar exception info si existe
         if record.exc_info:
-            log_data['exception'] = self.formatException(record.exc_info)
+            log_data['exception'] = _exc_text(self, record)
         
         # Agregar campos extra si existen
-        if hasattr(record, 'extra_data'):
-            log_data['extra'] = record.extra_data
+        extra_data = getattr(record, 'extra_data', None)
+        if extra_data is not None:
+            log_data['extra'] = extra_data
         
-        return json.dumps(log_data, ensure_ascii=False)
+        # default=str: un extra no serializable no debe romper el log
+        return orjson.dumps(log_data, default=str, option=_ORJSON_OPTIONS)
 
 
 class SimpleFormatter(logging.Formatter):
@@ -85,25 +140,30 @@ class SimpleFormatter(logging.Formatter):
     }
     RESET = '\033[0m'
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Nivel coloreado y con padding, precalculado por nivel
+        self._level_labels = {
+            level: f"{color}{level:8}{self.RESET}" for level, color in self.COLORS.items()
+        }
+    
     def format(self, record: logging.LogRecord) -> str:
         """
         Formatea un log record de forma legible para desarrollo.
         """
-        color = self.COLORS.get(record.levelname, '')
-        reset = self.RESET if color else ''
+        level = self._level_labels.get(record.levelname) or f"{record.levelname:8}"
         
         # Formato: [TIMESTAMP] LEVEL - logger - message
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created))
         
-        base_msg = f"[{timestamp}] {color}{record.levelname:8}{reset} - {record.name:25} - {record.getMessage()}"
+        base_msg = f"[{timestamp}] {level} - {record.name:25} - {record.getMessage()}"
         
         # Agregar contexto si existe
         context_parts = []
-        request_id = request_id_var.get()
+        request_id, user_id = _record_context(record)
         if request_id:
             context_parts.append(f"request_id={request_id}")
         
-        user_id = user_id_var.get()
         if user_id:
             context_parts.append(f"user_id={user_id}")
         
@@ -112,11 +172,84 @@ class SimpleFormatter(logging.Formatter):
         
         # Agregar exception si existe
         if record.exc_info:
-            base_msg += '\n' + self.formatException(record.exc_info)
+            base_msg += '\n' + _exc_text(self, record)
         
         return base_msg
 
 
+# Instancias compartidas por todos los handlers: los formatters no guardan
+# estado por record y así su precálculo se hace una sola vez
+_STRUCTURED_FORMATTER = StructuredFormatter()
+_SIMPLE_FORMATTER = SimpleFormatter()
+
+
+# ===== Eventos de Auditoría =====
+# Structs con __slots__ en lugar de un dict por evento; orjson los
+# serializa de forma nativa. Los kwargs adicionales van en ``details``.
+
+@dataclass(slots=True)
+class AuditEvent:
+    """Base de los eventos de auditoría."""
+
+
+@dataclass(slots=True)
+class UserCreatedEvent(AuditEvent):
+    action: str = field(default='user_created', init=False)
+    user_id: int
+    telefono: str
+    details: Optional[Dict[str, Any]] = None
+
+
+@dataclass(slots=True)
+class UserAccessedEvent(AuditEvent):
+    action: str = field(default='user_accessed', init=False)
+    user_id: int
+    endpoint: str
+    details: Optional[Dict[str, Any]] = None
+
+
+@dataclass(slots=True)
+class HabitoCreatedEvent(AuditEvent):
+    action: str = field(default='habito_created', init=False)
+    user_id: int
+    habito_id: int
+    nombre: str
+    details: Optional[Dict[str, Any]] = None
+
+
+@dataclass(slots=True)
+class HabitoUpdatedEvent(AuditEvent):
+    action: str = field(default='habito_updated', init=False)
+    user_id: int
+    habito_id: int
+    changes: Dict[str, Any]
+    details: Optional[Dict[str, Any]] = None
+
+
+@dataclass(slots=True)
+class HabitoDeletedEvent(AuditEvent):
+    action: str = field(default='habito_deleted', init=False)
+    user_id: int
+    habito_id: int
+    details: Optional[Dict[str, Any]] = None
+
+
+@dataclass(slots=True)
+class AuthFailureEvent(AuditEvent):
+    action: str = field(default='auth_failure', init=False)
+    telefono: Optional[str]
+    reason: str
+    details: Optional[Dict[str, Any]] = None
+
+
+@dataclass(slots=True)
+class RateLimitExceededEvent(AuditEvent):
+    action: str = field(default='rate_limit_exceeded', init=False)
+    endpoint: str
+    identifier: str
+    details: Optional[Dict[str, Any]] = None
+
+
 class AuditLogger:
     """
     Logger especializado para audit trail de operaciones sensibles.
@@ -135,86 +268,49 @@ class AuditLogger:
         """Registra creación de usuario."""
         self.logger.info(
             f"User created: user_id={user_id}, telefono={telefono}",
-            extra={'extra_data': {
-                'action': 'user_created',
-                'user_id': user_id,
-                'telefono': telefono,
-                **kwargs
-            }}
+            extra={'extra_data': UserCreatedEvent(user_id, telefono, kwargs or None)}
         )
     
     def log_user_accessed(self, user_id: int, endpoint: str, **kwargs):
         """Registra acceso a datos de usuario."""
         self.logger.info(
             f"User data accessed: user_id={user_id}, endpoint={endpoint}",
-            extra={'extra_data': {
-                'action': 'user_accessed',
-                'user_id': user_id,
-                'endpoint': endpoint,
-                **kwargs
-            }}
+            extra={'extra_data': UserAccessedEvent(user_id, endpoint, kwargs or None)}
         )
     
     def log_habito_created(self, user_id: int, habito_id: int, nombre: str, **kwargs):
         """Registra creación de hábito."""
         self.logger.info(
             f"Habit created: user_id={user_id}, habito_id={habito_id}, nombre={nombre}",
-            extra={'extra_data': {
-                'action': 'habito_created',
-                'user_id': user_id,
-                'habito_id': habito_id,
-                'nombre': nombre,
-                **kwargs
-            }}
+            extra={'extra_data': HabitoCreatedEvent(user_id, habito_id, nombre, kwargs or None)}
         )
     
     def log_habito_updated(self, user_id: int, habito_id: int, changes: Dict[str, Any], **kwargs):
         """Registra actualización de hábito."""
         self.logger.info(
             f"Habit updated: user_id={user_id}, habito_id={habito_id}",
-            extra={'extra_data': {
-                'action': 'habito_updated',
-                'user_id': user_id,
-                'habito_id': habito_id,
-                'changes': changes,
-                **kwargs
-            }}
+            extra={'extra_data': HabitoUpdatedEvent(user_id, habito_id, changes, kwargs or None)}
         )
     
     def log_habito_deleted(self, user_id: int, habito_id: int, **kwargs):
         """Registra eliminación de hábito."""
         self.logger.warning(
             f"Habit deleted: user_id={user_id}, habito_id={habito_id}",
-            extra={'extra_data': {
-                'action': 'habito_deleted',
-                'user_id': user_id,
-                'habito_id': habito_id,
-                **kwargs
-            }}
+            extra={'extra_data': HabitoDeletedEvent(user_id, habito_id, kwargs or None)}
         )
     
     def log_auth_failure(self, telefono: Optional[str], reason: str, **kwargs):
         """Registra fallo de autenticación."""
         self.logger.warning(
             f"Auth failure: telefono={telefono}, reason={reason}",
-            extra={'extra_data': {
-                'action': 'auth_failure',
-                'telefono': telefono,
-                'reason': reason,
-                **kwargs
-            }}
+            extra={'extra_data': AuthFailureEvent(telefono, reason, kwargs or None)}
         )
     
     def log_rate_limit_exceeded(self, endpoint: str, identifier: str, **kwargs):
         """Registra exceso de rate limit."""
         self.logger.warning(
             f"Rate limit exceeded: endpoint={endpoint}, identifier={identifier}",
-            extra={'extra_data': {
-                'action': 'rate_limit_exceeded',
-                'endpoint': endpoint,
-                'identifier': identifier,
-                **kwargs
-            }}
+            extra={'extra_data': RateLimitExceededEvent(endpoint, identifier, kwargs or None)}
         )
 
 
@@ -244,6 +340,167 @@ LOG_LEVELS = {
 }
 
 
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que conserva el contexto de request del hilo emisor.
+
+    A diferencia del QueueHandler estándar no pre-formatea el mensaje ni
+    descarta exc_info: la cola es en memoria y los formatters del listener
+    necesitan la excepción original.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        # Resolver args ahora: pueden mutar antes de que el listener escriba
+        record.msg = record.getMessage()
+        record.args = None
+        record.request_id = _rid_get()
+        record.user_id = _uid_get()
+        return record
+
+
+class _BinaryFileMixin:
+    """
+    Escribe el archivo de log en modo binario.
+    
+    Con StructuredFormatter los bytes de orjson van directo al archivo;
+    otros formatters se codifican a UTF-8 una vez.
+    """
+    
+    terminator = b'\n'
+    
+    def _open(self):
+        return open(self.baseFilename, 'ab')
+    
+    def format(self, record: logging.LogRecord) -> bytes:
+        formatter = self.formatter
+        if isinstance(formatter, StructuredFormatter):
+            return formatter.format_bytes(record)
+        return super().format(record).encode('utf-8')
+
+
+class BinaryTimedRotatingFileHandler(_BinaryFileMixin, logging.handlers.TimedRotatingFileHandler):
+    """TimedRotatingFileHandler que escribe bytes UTF-8."""
+
+
+class BinaryRotatingFileHandler(_BinaryFileMixin, logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler que escribe bytes UTF-8."""
+    
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        # Rota cuando el archivo ya alcanzó maxBytes, sin formatear el
+        # record una segunda vez solo para medirlo
+        if self.stream is None:
+            self.stream = self._open()
+        return self.maxBytes > 0 and self.stream.tell() >= self.maxBytes
+
+
+class BatchingFileHandler(logging.handlers.MemoryHandler):
+    """
+    Acumula records y los escribe al archivo destino en una sola llamada.
+
+    El lote se vacía al llenarse, al llegar un record WARNING o superior,
+    o cuando el record más antiguo supera ``flush_interval`` segundos. Un
+    hilo daemon vacía además el lote cada ``flush_interval`` segundos, así
+    lo pendiente llega a disco aunque no lleguen más records.
+    La rotación del destino se respeta record a record.
+    """
+
+    def __init__(
+        self,
+        target: logging.handlers.BaseRotatingHandler,
+        capacity: int = AUDIT_BUFFER_CAPACITY,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+    ):
+        super().__init__(
+            capacity,
+            flushLevel=logging.WARNING,
+            target=target,
+            flushOnClose=True,
+        )
+        self.flush_interval = flush_interval
+        self._closed = threading.Event()
+        if flush_interval > 0:
+            threading.Thread(
+                target=self._flush_periodically, name='audit-log-flusher', daemon=True
+            ).start()
+
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self) -> None:
+        self._closed.set()
+        super().close()
+
+    def shouldFlush(self, record: logging.LogRecord) -> bool:
+        return (
+            super().shouldFlush(record)
+            or record.created - self.buffer[0].created >= self.flush_interval
+        )
+
+    def _write(self, lines: list) -> None:
+        if lines:
+            stream = self.target.stream or self.target._open()
+            self.target.stream = stream
+            # str o bytes según el destino (ver _BinaryFileMixin)
+            stream.write(lines[0][:0].join(lines))
+            stream.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            if not self.target or not self.buffer:
+                return
+            target = self.target
+            with target.lock:
+                lines = []
+                for record in self.buffer:
+                    if record.levelno < target.level:
+                        continue
+                    try:
+                        if target.shouldRollover(record):
+                            self._write(lines)
+                            lines = []
+                            target.doRollover()
+                        lines.append(target.format(record) + target.terminator)
+                    except Exception:
+                        target.handleError(record)
+                try:
+                    self._write(lines)
+                except Exception:
+                    target.handleError(self.buffer[-1])
+            self.buffer.clear()
+
+
+def _stop_queue_listeners() -> None:
+    """Detiene los listeners activos vaciando sus colas a disco."""
+    while _queue_listeners:
+        listener = _queue_listeners.pop()
+        listener.stop()
+        # Los handlers con buffer (auditoría) escriben lo pendiente y
+        # detienen su vaciado periódico
+        for handler in listener.handlers:
+            handler.close()
+
+
+atexit.register(_stop_queue_listeners)
+
+
+def _start_queue_listener(*handlers: logging.Handler) -> ContextQueueHandler:
+    """
+    Arranca un QueueListener para ``handlers`` y retorna el handler de cola.
+
+    La escritura a disco (y la rotación) ocurre en el hilo del listener;
+    el hilo que loggea solo encola el record.
+    """
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    listener.start()
+    _queue_listeners.append(listener)
+    return ContextQueueHandler(log_queue)
+
+
 def setup_logging(
     environment: str = 'development',
     log_level: str = 'INFO',
@@ -273,10 +530,12 @@ def setup_logging(
     
     # Obtener root logger
     root_logger = logging.getLogger()
-    root_logger.setLevel(getattr(logging, log_level.upper()))
+    # setLevel resuelve el nombre del nivel (tabla interna de logging)
+    root_logger.setLevel(log_level.upper())
     
-    # Limpiar handlers existentes
+    # Limpiar handlers existentes y detener listeners de llamadas previas
     root_logger.handlers.clear()
+    _stop_queue_listeners()
     
     # ===== Console Handler =====
     if enable_console:
@@ -285,10 +544,10 @@ def setup_logging(
         
         if environment == 'production':
             # JSON format para producción
-            console_handler.setFormatter(StructuredFormatter())
+            console_handler.setFormatter(_STRUCTURED_FORMATTER)
         else:
             # Format simple para desarrollo
-            console_handler.setFormatter(SimpleFormatter())
+            console_handler.setFormatter(_SIMPLE_FORMATTER)
         
         root_logger.addHandler(console_handler)
     
@@ -296,7 +555,7 @@ def setup_logging(
     if enable_file:
         # Log principal - rotación diaria, mantener 30 días
         app_log_file = log_dir / 'loki_moodtracker.log'
-        file_handler = logging.handlers.TimedRotatingFileHandler(
+        file_handler = BinaryTimedRotatingFileHandler(
             filename=app_log_file,
             when='midnight',
             interval=1,
@@ -306,23 +565,23 @@ def setup_logging(
         file_handler.setLevel(logging.DEBUG)
         
         if environment == 'production':
-            file_handler.setFormatter(StructuredFormatter())
+            file_handler.setFormatter(_STRUCTURED_FORMATTER)
         else:
-            file_handler.setFormatter(SimpleFormatter())
-        
-        root_logger.addHandler(file_handler)
+            file_handler.setFormatter(_SIMPLE_FORMATTER)
         
         # Error log separado - solo errores y críticos
         error_log_file = log_dir / 'errors.log'
-        error_handler = logging.handlers.RotatingFileHandler(
+        error_handler = BinaryRotatingFileHandler(
             filename=error_log_file,
             maxBytes=10 * 1024 * 1024,  # 10 MB
             backupCount=5,
             encoding='utf-8',
         )
         error_handler.setLevel(logging.ERROR)
-        error_handler.setFormatter(StructuredFormatter())
-        root_logger.addHandler(error_handler)
+        error_handler.setFormatter(_STRUCTURED_FORMATTER)
+        
+        # Los archivos se escriben desde el hilo del listener
+        root_logger.addHandler(_start_queue_listener(file_handler, error_handler))
     
     # ===== Configurar niveles por módulo =====
     for logger_name, level in LOG_LEVELS.items():
@@ -332,7 +591,7 @@ def setup_logging(
     audit_logger = None
     if enable_audit:
         audit_file = log_dir / 'audit.log'
-        audit_handler = logging.handlers.TimedRotatingFileHandler(
+        audit_handler = BinaryTimedRotatingFileHandler(
             filename=audit_file,
             when='midnight',
             interval=1,
@@ -340,12 +599,14 @@ def setup_logging(
             encoding='utf-8',
         )
         audit_handler.setLevel(logging.INFO)
-        audit_handler.setFormatter(StructuredFormatter())
+        audit_handler.setFormatter(_STRUCTURED_FORMATTER)
         
         # Logger separado para audit trail
         logger = logging.getLogger('audit')
         logger.setLevel(logging.INFO)
-        logger.addHandler(audit_handler)
+        logger.handlers.clear()
+        # Escrituras por lote; WARNING+ se escribe de inmediato
+        logger.addHandler(_start_queue_listener(BatchingFileHandler(audit_handler)))
         logger.propagate = False  # No propagar a root logger
         
         audit_logger = AuditLogger(logger)
@@ -8,95 +8,118 @@ Loggea todas las requests con:
 - User ID (si está autenticado)
 - Errores y excepciones
 """
-import time
+import asyncio
+import logging
 import uuid
-from typing import Callable
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from app.core.logging_config import get_logger, set_request_context, clear_request_context
 
 logger = get_logger(__name__)
 
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+class RequestLoggingMiddleware:
     """
-    Middleware que loggea todas las HTTP requests.
+    Middleware ASGI que loggea todas las HTTP requests.
     
     Features:
     - Genera request_id único para tracing
     - Loggea inicio y fin de request
-    - Mide tiempo de respuesta
+    - Mide tiempo de respuesta (hasta el último chunk del body, sin
+      contar las background tasks que corren después)
+    - Warning para requests más lentos que ``threshold_ms``
     - Captura errores y excepciones
     - Inyecta contexto en logs subsiguientes
+    
+    ASGI puro en lugar de BaseHTTPMiddleware: no crea una tarea extra por
+    request y una sola medición sirve para el log de fin y el de lentitud.
     """
     
-    def __init__(self, app: ASGIApp):
-        super().__init__(app)
+    def __init__(
+        self,
+        app: ASGIApp,
+        threshold_ms: float = 1000.0,  # 1 segundo
+    ):
+        self.app = app
+        self.threshold_ms = threshold_ms
+        self._threshold_s = threshold_ms / 1000.0
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """
         Procesa request y loggea información relevante.
         """
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
         # Generar request ID único
-        request_id = str(uuid.uuid4())
+        request_id = uuid.uuid4().hex
+        method = scope['method']
+        path = scope['path']
         
         # Obtener user_id si está en el request state (seteado por auth)
-        user_id = getattr(request.state, 'user_id', None)
+        user_id = scope.get('state', {}).get('user_id')
         
         # Establecer contexto para todos los logs subsiguientes
         set_request_context(request_id=request_id, user_id=user_id)
         
-        # Log inicio de request
-        logger.info(
-            f"Request started: {request.method} {request.url.path}",
-            extra={'extra_data': {
-                'method': request.method,
-                'path': request.url.path,
-                'query_params': str(request.query_params),
-                'client_host': request.client.host if request.client else None,
-            }}
-        )
+        # Mensajes y extra_data solo se construyen si INFO está habilitado
+        info_enabled = logger.isEnabledFor(logging.INFO)
         
-        # Medir tiempo de respuesta
-        start_time = time.time()
+        # Campos comunes a todos los logs del request. Cada record recibe su
+        # propia copia: los handlers en cola formatean después, en otro hilo
+        request_fields = {'method': method, 'path': path}
         
-        try:
-            # Procesar request
-            response = await call_next(request)
-            
-            # Calcular duración
-            duration_ms = (time.time() - start_time) * 1000
-            
-            # Log fin de request exitoso
+        # Log inicio de request
+        if info_enabled:
+            client = scope.get('client')
             logger.info(
-                f"Request completed: {request.method} {request.url.path} - "
-                f"Status: {response.status_code} - Duration: {duration_ms:.2f}ms",
+                "Request started: %s %s", method, path,
                 extra={'extra_data': {
-                    'method': request.method,
-                    'path': request.url.path,
-                    'status_code': response.status_code,
-                    'duration_ms': round(duration_ms, 2),
+                    **request_fields,
+                    'query_params': scope.get('query_string', b'').decode('latin-1'),
+                    'client_host': client[0] if client else None,
                 }}
             )
-            
-            # Agregar request_id a headers de respuesta para debugging
-            response.headers['X-Request-ID'] = request_id
-            
-            return response
+        
+        status_code = 500
+        
+        # Medir tiempo de respuesta con el reloj del event loop: monotónico y,
+        # en uvloop, cacheado por iteración (sin syscall por lectura)
+        loop_time = asyncio.get_running_loop().time
+        start_time = loop_time()
+        # Fin de la respuesta: se toma al enviar el último chunk del body,
+        # no al volver la app, que en Starlette espera a las BackgroundTasks
+        end_time = None
+        
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, end_time
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                # Agregar request_id a headers de respuesta para debugging;
+                # tupla de bytes directa, sin pasar por MutableHeaders
+                message['headers'] = [
+                    *message.get('headers', ()),
+                    (b'x-request-id', request_id.encode('ascii')),
+                ]
+            await send(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body', False):
+                end_time = loop_time()
+        
+        try:
+            # Procesar request
+            await self.app(scope, receive, send_wrapper)
         
         except Exception as e:
             # Calcular duración hasta el error
-            duration_ms = (time.time() - start_time) * 1000
+            duration_ms = (loop_time() - start_time) * 1000
             
             # Log error
             logger.exception(
-                f"Request failed: {request.method} {request.url.path} - "
-                f"Error: {str(e)} - Duration: {duration_ms:.2f}ms",
+                "Request failed: %s %s - Error: %s - Duration: %.2fms",
+                method, path, e, duration_ms,
                 extra={'extra_data': {
-                    'method': request.method,
-                    'path': request.url.path,
+                    **request_fields,
                     'error': str(e),
                     'error_type': type(e).__name__,
                     'duration_ms': round(duration_ms, 2),
@@ -106,44 +129,35 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
             # Re-lanzar excepción para que FastAPI la maneje
             raise
         
+        else:
+            duration = (end_time if end_time is not None else loop_time()) - start_time
+            is_slow = duration > self._threshold_s
+            
+            # Comparar en segundos: el caso común (request rápido con INFO
+            # deshabilitado) no convierte ni construye nada
+            if info_enabled or is_slow:
+                duration_ms = duration * 1000.0
+                timing = {
+                    **request_fields,
+                    'status_code': status_code,
+                    'duration_ms': round(duration_ms, 2),
+                }
+                
+                # Log fin de request exitoso
+                if info_enabled:
+                    logger.info(
+                        "Request completed: %s %s - Status: %d - Duration: %.2fms",
+                        method, path, status_code, duration_ms,
+                        extra={'extra_data': timing}
+                    )
+                
+                if is_slow:
+                    logger.warning(
+                        "Slow request detected: %s %s - Duration: %.2fms (threshold: %sms)",
+                        method, path, duration_ms, self.threshold_ms,
+                        extra={'extra_data': {**timing, 'threshold_ms': self.threshold_ms}}
+                    )
+        
         finally:
             # Limpiar contexto
             clear_request_context()
-
-
-class SlowRequestMiddleware(BaseHTTPMiddleware):
-    """
-    Middleware que loggea warnings para requests lentos.
-    
-    Ayuda a identificar endpoints que necesitan optimización.
-    """
-    
-    def __init__(
-        self,
-        app: ASGIApp,
-        threshold_ms: float = 1000.0,  # 1 segundo
-    ):
-        super().__init__(app)
-        self.threshold_ms = threshold_ms
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        """
-        Procesa request y loggea si es muy lento.
-        """
-        start_time = time.time()
-        response = await call_next(request)
-        duration_ms = (time.time() - start_time) * 1000
-        
-        if duration_ms > self.threshold_ms:
-            logger.warning(
-                f"Slow request detected: {request.method} {request.url.path} - "
-                f"Duration: {duration_ms:.2f}ms (threshold: {self.threshold_ms}ms)",
-                extra={'extra_data': {
-                    'method': request.method,
-                    'path': request.url.path,
-                    'duration_ms': round(duration_ms, 2),
-                    'threshold_ms': self.threshold_ms,
-                }}
-            )
-        
-        return response
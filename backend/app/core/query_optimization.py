@@ -3,25 +3,38 @@ Utilidades para análisis y optimización de queries de base de datos.
 """
 from sqlalchemy import event, text
 from sqlalchemy.engine import Engine
-from typing import List, Dict, Any
+from collections import OrderedDict
+from operator import itemgetter
+from typing import List, Dict, Any, Optional
+import hashlib
+import heapq
 import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+_by_total_duration = itemgetter('total_duration')
+
+# Bytes de SQL retenidos por query lenta; el reporte muestra menos
+QUERY_SAMPLE_SIZE = 512
+
 
 class QueryAnalyzer:
     """
     Analizador de queries para detectar slow queries y optimizar rendimiento.
     """
     
-    def __init__(self, slow_query_threshold: float = 0.1):
+    def __init__(self, slow_query_threshold: float = 0.1, max_slow_queries: int = 1000):
         """
         Args:
             slow_query_threshold: Umbral en segundos para considerar una query lenta
+            max_slow_queries: Máximo de queries distintas retenidas (se descarta
+                la que lleva más tiempo sin repetirse)
         """
         self.slow_query_threshold = slow_query_threshold
-        self.slow_queries: List[Dict[str, Any]] = []
+        self.max_slow_queries = max_slow_queries
+        # digest del SQL -> agregados; una entrada por query distinta
+        self.slow_queries: OrderedDict[bytes, Dict[str, Any]] = OrderedDict()
     
     def enable_query_logging(self, engine: Engine):
         """
@@ -32,39 +45,64 @@ class QueryAnalyzer:
         """
         @event.listens_for(engine, "before_cursor_execute")
         def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-            conn.info.setdefault('query_start_time', []).append(time.time())
+            # Un escalar por ejecución: el contexto es propio de cada statement
+            context._qa_start = time.perf_counter()
         
         @event.listens_for(engine, "after_cursor_execute")
         def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-            total_time = time.time() - conn.info['query_start_time'].pop()
+            total_time = time.perf_counter() - context._qa_start
             
             if total_time > self.slow_query_threshold:
-                slow_query = {
-                    'query': statement,
-                    'parameters': parameters,
-                    'duration': total_time,
-                    'timestamp': time.time()
-                }
-                self.slow_queries.append(slow_query)
+                self._record_slow_query(statement, total_time)
                 logger.warning(
                     f"Slow query detected ({total_time:.3f}s): {statement[:100]}..."
                 )
     
-    def get_slow_queries(self) -> List[Dict[str, Any]]:
+    def _record_slow_query(self, statement: str, duration: float):
+        """
+        Agrega una ejecución lenta a las estadísticas de su query.
+        
+        Solo se guarda un fragmento del SQL; las repeticiones de la misma
+        query actualizan conteo y tiempos en lugar de duplicarse.
+        """
+        key = hashlib.blake2b(statement.encode(), digest_size=8).digest()
+        entry = self.slow_queries.get(key)
+        if entry is None:
+            self.slow_queries[key] = {
+                'query': statement[:QUERY_SAMPLE_SIZE],
+                'count': 1,
+                'total_duration': duration,
+                'max_duration': duration,
+                'last_seen': time.time(),
+            }
+            if len(self.slow_queries) > self.max_slow_queries:
+                self.slow_queries.popitem(last=False)
+            return
+        
+        entry['count'] += 1
+        entry['total_duration'] += duration
+        if duration > entry['max_duration']:
+            entry['max_duration'] = duration
+        entry['last_seen'] = time.time()
+        self.slow_queries.move_to_end(key)
+    
+    def get_slow_queries(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """
-        Retorna lista de queries lentas detectadas.
+        Retorna las queries lentas detectadas ordenadas por tiempo total.
+
+        Args:
+            limit: Si se indica, solo las ``limit`` con más tiempo (top-K sin ordenar todo)
         """
-        return sorted(
-            self.slow_queries,
-            key=lambda x: x['duration'],
-            reverse=True
-        )
+        entries = self.slow_queries.values()
+        if limit is not None:
+            return heapq.nlargest(limit, entries, key=_by_total_duration)
+        return sorted(entries, key=_by_total_duration, reverse=True)
     
     def clear_slow_queries(self):
         """
         Limpia el registro de queries lentas.
         """
-        self.slow_queries = []
+        self.slow_queries.clear()
     
     def print_report(self):
         """
@@ -75,8 +113,11 @@ class QueryAnalyzer:
             return
         
         print(f"\n⚠️  {len(self.slow_queries)} queries lentas detectadas:\n")
-        for i, query in enumerate(self.get_slow_queries()[:10], 1):
-            print(f"{i}. Duración: {query['duration']:.3f}s")
+        for i, query in enumerate(self.get_slow_queries(10), 1):
+            print(
+                f"{i}. Total: {query['total_duration']:.3f}s - "
+                f"Ejecuciones: {query['count']} - Máx: {query['max_duration']:.3f}s"
+            )
             print(f"   Query: {query['query'][:200]}...")
             print()
 
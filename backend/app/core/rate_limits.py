@@ -2,7 +2,8 @@
 Configuración centralizada de rate limits para la API.
 Define límites específicos para cada tipo de endpoint.
 """
-from typing import Dict
+import ipaddress
+from typing import Dict, FrozenSet, Iterable, Tuple
 
 # Rate limits por categoría de endpoint
 RATE_LIMITS: Dict[str, str] = {
@@ -45,6 +46,10 @@ RATE_LIMIT_MESSAGES: Dict[str, str] = {
     "default": "Límite de solicitudes alcanzado. Por favor, espera un momento.",
 }
 
+# Valores por defecto resueltos una sola vez al cargar el módulo
+_DEFAULT_LIMIT = RATE_LIMITS["public"]
+_DEFAULT_MESSAGE = RATE_LIMIT_MESSAGES["default"]
+
 
 def get_rate_limit(category: str) -> str:
     """
@@ -56,7 +61,7 @@ def get_rate_limit(category: str) -> str:
     Returns:
         String de rate limit en formato slowapi (ej: '10/minute')
     """
-    return RATE_LIMITS.get(category, RATE_LIMITS["public"])
+    return RATE_LIMITS.get(category, _DEFAULT_LIMIT)
 
 
 def get_rate_limit_message(category: str) -> str:
@@ -69,7 +74,7 @@ def get_rate_limit_message(category: str) -> str:
     Returns:
         Mensaje de error amigable
     """
-    return RATE_LIMIT_MESSAGES.get(category, RATE_LIMIT_MESSAGES["default"])
+    return RATE_LIMIT_MESSAGES.get(category, _DEFAULT_MESSAGE)
 
 
 # Rate limits especiales por IP (whitelist/blacklist)
@@ -85,3 +90,72 @@ IP_BLACKLIST = [
     # IPs bloqueadas por abuso
     # Agregar dinámicamente cuando se detecten patrones de abuso
 ]
+
+
+# Índice de CIDRs por longitud de prefijo, construido una sola vez al cargar
+# el módulo: verificar una IP cuesta una máscara y un lookup en set por cada
+# longitud de prefijo presente, sin parsear redes en cada request.
+_CidrIndex = Dict[int, Tuple[Tuple[int, FrozenSet[int]], ...]]
+
+
+def _build_cidr_index(cidrs: Iterable[str]) -> _CidrIndex:
+    by_version: Dict[int, Dict[int, set]] = {4: {}, 6: {}}
+    for cidr in cidrs:
+        network = ipaddress.ip_network(cidr, strict=False)
+        by_version[network.version].setdefault(network.prefixlen, set()).add(
+            int(network.network_address)
+        )
+    
+    index: _CidrIndex = {}
+    for version, by_prefix in by_version.items():
+        bits = 32 if version == 4 else 128
+        full = (1 << bits) - 1
+        # Prefijos más largos primero (coincidencia más específica)
+        index[version] = tuple(
+            (full ^ (full >> prefixlen), frozenset(networks))
+            for prefixlen, networks in sorted(by_prefix.items(), reverse=True)
+        )
+    return index
+
+
+def _ip_in_index(ip: str, index: _CidrIndex) -> bool:
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    
+    value = int(address)
+    for mask, networks in index[address.version]:
+        if value & mask in networks:
+            return True
+    return False
+
+
+_WHITELIST_INDEX = _build_cidr_index(IP_WHITELIST)
+_BLACKLIST_INDEX = _build_cidr_index(IP_BLACKLIST)
+
+
+def is_whitelisted(ip: str) -> bool:
+    """
+    Indica si una IP pertenece a alguna red de IP_WHITELIST.
+    
+    Args:
+        ip: Dirección IPv4 o IPv6 del cliente
+        
+    Returns:
+        True si la IP está en la whitelist; False si no, o si no es válida
+    """
+    return _ip_in_index(ip, _WHITELIST_INDEX)
+
+
+def is_blacklisted(ip: str) -> bool:
+    """
+    Indica si una IP pertenece a alguna red de IP_BLACKLIST.
+    
+    Args:
+        ip: Dirección IPv4 o IPv6 del cliente
+        
+    Returns:
+        True si la IP está en la blacklist; False si no, o si no es válida
+    """
+    return _ip_in_index(ip, _BLACKLIST_INDEX)
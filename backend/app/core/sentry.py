@@ -1,21 +1,24 @@
 """
 Sentry configuration for error tracking and performance monitoring
 """
-import sentry_sdk
-from sentry_sdk.integrations.fastapi import FastApiIntegration
-from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
 from app.core.config import settings
 from app.core.logger import setup_logger
 import os
 
 logger = setup_logger(__name__)
 
+# sentry_sdk is imported only once init_sentry() finds a DSN, so dev/test
+# workers without Sentry do not pay its import cost at startup.
+_sentry_sdk = None
+
 
 def init_sentry():
     """
     Initialize Sentry SDK for error tracking.
     Only initializes if SENTRY_DSN environment variable is set.
     """
+    global _sentry_sdk
+    
     sentry_dsn = os.getenv("SENTRY_DSN")
     environment = os.getenv("RAILWAY_ENVIRONMENT", "development")
     
@@ -23,30 +26,35 @@ def init_sentry():
         logger.warning("SENTRY_DSN not configured - Sentry error tracking disabled")
         return
     
+    is_prod = environment == "production"
+    
     try:
+        import sentry_sdk
+        from sentry_sdk.integrations.fastapi import FastApiIntegration
+        from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
+        
         sentry_sdk.init(
             dsn=sentry_dsn,
             environment=environment,
-            # Set traces_sample_rate to 1.0 to capture 100% of transactions for performance monitoring.
-            # We recommend adjusting this value in production.
-            traces_sample_rate=0.1 if environment == "production" else 1.0,
-            # Set profiles_sample_rate to 1.0 to profile 100% of sampled transactions.
-            # We recommend adjusting this value in production.
-            profiles_sample_rate=0.1 if environment == "production" else 1.0,
+            # Capture 100% of transactions outside production; 1% in production
+            # keeps tracing overhead off the request hot path.
+            traces_sample_rate=0.01 if is_prod else 1.0,
+            # Profiling is disabled in production.
+            profiles_sample_rate=0 if is_prod else 1.0,
             # Integrations
             integrations=[
                 FastApiIntegration(transaction_style="url"),
-                SqlalchemyIntegration(),
             ],
+            # SqlalchemyIntegration is auto-enabled when SQLAlchemy is installed
+            # and wraps every cursor execute in a span regardless of sampling;
+            # CRUD-heavy request paths pay for it on every query.
+            disabled_integrations=[SqlalchemyIntegration()],
             # Send default PII (Personally Identifiable Information)
             send_default_pii=False,  # Set to False for privacy
             # Release tracking
             release=f"loki-moodtracker@{settings.VERSION}",
-            # Custom tags
-            _experiments={
-                "profiles_sample_rate": 0.1 if environment == "production" else 1.0,
-            },
         )
+        _sentry_sdk = sentry_sdk
         
         logger.info(f"✅ Sentry initialized successfully (environment: {environment})")
         
@@ -62,6 +70,10 @@ def capture_exception(error: Exception, context: dict = None):
         error: The exception to capture
         context: Additional context dictionary to attach to the error
     """
+    sentry_sdk = _sentry_sdk
+    if sentry_sdk is None:
+        return
+    
     if context:
         with sentry_sdk.push_scope() as scope:
             for key, value in context.items():
@@ -80,6 +92,10 @@ def capture_message(message: str, level: str = "info", context: dict = None):
         level: Severity level ("debug", "info", "warning", "error", "fatal")
         context: Additional context dictionary to attach to the message
     """
+    sentry_sdk = _sentry_sdk
+    if sentry_sdk is None:
+        return
+    
     if context:
         with sentry_sdk.push_scope() as scope:
             for key, value in context.items():
@@ -97,6 +113,10 @@ def set_user_context(user_id: int, phone: str = None):
         user_id: User ID
         phone: User phone (optional, will be masked for privacy)
     """
+    sentry_sdk = _sentry_sdk
+    if sentry_sdk is None:
+        return
+    
     user_data = {"id": user_id}
     
     if phone:
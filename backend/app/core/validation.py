@@ -5,6 +5,13 @@ import re
 import html
 from typing import Optional
 
+try:
+    import regex
+    REGEX_AVAILABLE = True
+except ImportError:
+    regex = None
+    REGEX_AVAILABLE = False
+
 
 # Patrones peligrosos comunes
 DANGEROUS_PATTERNS = [
@@ -16,6 +23,67 @@ DANGEROUS_PATTERNS = [
     r'<object[^>]*>',  # Objects
 ]
 
+# Patrones sospechosos de SQL injection
+SQL_INJECTION_PATTERNS = [
+    r"(\bOR\b|\bAND\b)\s+['\"]?\d+['\"]?\s*=\s*['\"]?\d+['\"]?",  # OR 1=1
+    r";\s*(DROP|DELETE|UPDATE|INSERT|CREATE|ALTER)\s+",  # Comandos SQL
+    r"--",  # Comentarios SQL
+    r"/\*.*\*/",  # Comentarios multilinea
+    r"UNION\s+SELECT",  # UNION attacks
+    r"exec\s*\(",  # Ejecución de comandos
+]
+
+# Tiempo máximo (segundos) de cada escaneo de patrones peligrosos. Patrones
+# como <script[^>]*>.*?</script> o /\*.*\*/ son cuadráticos sobre inputs
+# maliciosos; con el módulo regex el escaneo se corta y cuenta como
+# coincidencia. Sin regex instalado se usa re, sin límite de tiempo
+PATTERN_SCAN_TIMEOUT = 0.05
+_pattern_re = regex if REGEX_AVAILABLE else re
+
+# Regexes compiladas una vez al importar (se usan en cada mensaje entrante).
+# Cada familia de patrones va en una sola alternación: un escaneo por
+# mensaje en lugar de uno por patrón
+_SQL_COMBINED = _pattern_re.compile(
+    '|'.join(f'(?:{p})' for p in SQL_INJECTION_PATTERNS), _pattern_re.IGNORECASE
+)
+_XSS_COMBINED = _pattern_re.compile(
+    '|'.join(f'(?:{p})' for p in DANGEROUS_PATTERNS), _pattern_re.IGNORECASE | _pattern_re.DOTALL
+)
+_PHONE_STRIP_RE = re.compile(r'[^\d+]')
+# Tabla ASCII para str.translate: elimina todo salvo dígitos y +
+_PHONE_TRANSLATE = {c: None for c in range(128) if chr(c) not in '0123456789+'}
+# Caracteres que html.escape reemplaza; sin ninguno, escapar no cambia el texto
+_HTML_SPECIAL_RE = re.compile(r'[<>&"\']')
+# Tabla para str.translate: elimina los caracteres de control (salvo \t, \n
+# y \r) y escapa comillas dobles en una sola pasada
+_JSON_TRANSLATE = dict.fromkeys([*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F])
+_JSON_TRANSLATE[ord('"')] = '\\"'
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+_URL_RE = re.compile(r'^https?://[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}(/.*)?$')
+
+# SQL + XSS en una sola alternación: un único escaneo para el caso común
+# (texto limpio). DOTALL solo aplica a los patrones XSS, como en validate_no_xss
+_COMBINED_DANGEROUS = _pattern_re.compile(
+    '|'.join(
+        [f'(?:{p})' for p in SQL_INJECTION_PATTERNS]
+        + [f'(?s:{p})' for p in DANGEROUS_PATTERNS]
+    ),
+    _pattern_re.IGNORECASE,
+)
+
+
+def _matches(pattern, text: str) -> bool:
+    """
+    Indica si el patrón aparece en el texto. Un escaneo que excede
+    PATTERN_SCAN_TIMEOUT se trata como coincidencia (input sospechoso).
+    """
+    if not REGEX_AVAILABLE:
+        return pattern.search(text) is not None
+    try:
+        return pattern.search(text, timeout=PATTERN_SCAN_TIMEOUT) is not None
+    except TimeoutError:
+        return True
+
 
 def sanitize_html(text: str, max_length: Optional[int] = None) -> str:
     """
@@ -35,11 +103,14 @@ def sanitize_html(text: str, max_length: Optional[int] = None) -> str:
     if not text:
         return ""
     
-    # Escapar HTML
-    text = html.escape(text)
+    # Escapar HTML solo si hay algo que escapar: html.escape hace un
+    # replace por carácter especial aunque el texto no tenga ninguno
+    if _HTML_SPECIAL_RE.search(text):
+        text = html.escape(text)
     
-    # Aplicar límite de longitud si se especifica
-    if max_length and len(text) > max_length:
+    # Aplicar límite de longitud si se especifica (el slice de un texto
+    # más corto devuelve el mismo objeto, sin copia)
+    if max_length:
         text = text[:max_length]
     
     return text.strip()
@@ -63,16 +134,17 @@ def sanitize_phone_number(phone: str) -> str:
         return ""
     
     # Remover prefijo whatsapp: si existe
-    phone = phone.replace("whatsapp:", "")
+    phone = phone.removeprefix("whatsapp:")
     
-    # Mantener solo dígitos y +
-    phone = re.sub(r'[^\d+]', '', phone)
+    # Mantener solo dígitos y +. translate para el caso ASCII (lo normal);
+    # la regex cubre dígitos Unicode
+    if phone.isascii():
+        phone = phone.translate(_PHONE_TRANSLATE)
+    else:
+        phone = _PHONE_STRIP_RE.sub('', phone)
     
     # Asegurar que empieza con +
-    if not phone.startswith('+'):
-        phone = '+' + phone
-    
-    return phone
+    return phone if phone.startswith('+') else '+' + phone
 
 
 def sanitize_json_string(text: str) -> str:
@@ -88,13 +160,9 @@ def sanitize_json_string(text: str) -> str:
     if not text:
         return ""
     
-    # Remover caracteres de control excepto newlines y tabs
-    text = re.sub(r'[\x00-\x08\x0B-\x0C\x0E-\x1F\x7F]', '', text)
-    
-    # Escapar comillas dobles para JSON
-    text = text.replace('"', '\\"')
-    
-    return text.strip()
+    # Remover caracteres de control excepto newlines y tabs, y escapar
+    # comillas dobles para JSON
+    return text.translate(_JSON_TRANSLATE).strip()
 
 
 def validate_no_sql_injection(text: str) -> bool:
@@ -114,22 +182,7 @@ def validate_no_sql_injection(text: str) -> bool:
     if not text:
         return True
     
-    # Patrones sospechosos de SQL injection
-    sql_patterns = [
-        r"(\bOR\b|\bAND\b)\s+['\"]?\d+['\"]?\s*=\s*['\"]?\d+['\"]?",  # OR 1=1
-        r";\s*(DROP|DELETE|UPDATE|INSERT|CREATE|ALTER)\s+",  # Comandos SQL
-        r"--",  # Comentarios SQL
-        r"/\*.*\*/",  # Comentarios multilinea
-        r"UNION\s+SELECT",  # UNION attacks
-        r"exec\s*\(",  # Ejecución de comandos
-    ]
-    
-    text_upper = text.upper()
-    for pattern in sql_patterns:
-        if re.search(pattern, text_upper, re.IGNORECASE):
-            return False
-    
-    return True
+    return not _matches(_SQL_COMBINED, text)
 
 
 def validate_no_xss(text: str) -> bool:
@@ -145,11 +198,7 @@ def validate_no_xss(text: str) -> bool:
     if not text:
         return True
     
-    for pattern in DANGEROUS_PATTERNS:
-        if re.search(pattern, text, re.IGNORECASE | re.DOTALL):
-            return False
-    
-    return True
+    return not _matches(_XSS_COMBINED, text)
 
 
 def sanitize_user_input(
@@ -178,21 +227,29 @@ def sanitize_user_input(
     if not text:
         return ""
     
-    # Validar contra SQL injection
-    if check_sql and not validate_no_sql_injection(text):
-        raise ValueError("Texto contiene patrones sospechosos de SQL injection")
+    # Truncar antes de validar: lo que pase de max_length se descarta de
+    # todos modos, y así el escaneo de patrones queda acotado por max_length
+    # aunque llegue un payload enorme
+    if len(text) > max_length:
+        text = text[:max_length]
     
-    # Validar contra XSS
-    if check_xss and not validate_no_xss(text):
-        raise ValueError("Texto contiene patrones sospechosos de XSS")
+    # Con ambas validaciones activas, un solo escaneo descarta el texto
+    # limpio; si hay coincidencia se repiten por separado para el mensaje
+    needs_checks = not (check_sql and check_xss) or _matches(_COMBINED_DANGEROUS, text)
     
-    # Sanitizar HTML si no se permite
+    if needs_checks:
+        # Validar contra SQL injection
+        if check_sql and not validate_no_sql_injection(text):
+            raise ValueError("Texto contiene patrones sospechosos de SQL injection")
+        
+        # Validar contra XSS
+        if check_xss and not validate_no_xss(text):
+            raise ValueError("Texto contiene patrones sospechosos de XSS")
+    
+    # Sanitizar HTML si no se permite (el escape puede alargar el texto,
+    # sanitize_html vuelve a aplicar el límite)
     if not allow_html:
         text = sanitize_html(text, max_length)
-    else:
-        # Aplicar límite de longitud
-        if len(text) > max_length:
-            text = text[:max_length]
     
     return text.strip()
 
@@ -211,8 +268,7 @@ def validate_email(email: str) -> bool:
         return False
     
     # Patrón básico de email
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email))
+    return bool(_EMAIL_RE.match(email))
 
 
 def validate_url(url: str) -> bool:
@@ -229,5 +285,4 @@ def validate_url(url: str) -> bool:
         return False
     
     # Patrón básico de URL (http/https)
-    pattern = r'^https?://[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}(/.*)?$'
-    return bool(re.match(pattern, url))
+    return bool(_URL_RE.match(url))
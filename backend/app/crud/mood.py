@@ -1,37 +1,208 @@
-from sqlalchemy.orm import Session
-from typing import Optional
+from datetime import datetime
+from sqlalchemy import and_, bindparam, func, insert, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased, load_only, selectinload
+from typing import Dict, List, Optional, Sequence, Tuple
 
 from app.models.mood import Usuario, EstadoAnimo, Habito, RegistroHabito, ConversacionContexto, Correlacion
 from app.schemas.mood import (
     UsuarioCreate, EstadoAnimoCreate, HabitoCreate, HabitoUpdate,
     RegistroHabitoCreate, ConversacionContextoCreate, CorrelacionCreate
 )
+from app.core.validation import sanitize_phone_number
 from app.core.caching import (
-    cached_usuario, cached_habitos_activos,
-    invalidate_usuario_cache, invalidate_habitos_cache,
-    invalidate_all_user_caches
+    cached_usuario, cached_usuario_by_telefono, cached_habitos_activos,
+    get_cached_usuario_by_telefono, cache_usuario_by_telefono,
+    invalidate_usuario_cache, invalidate_habitos_cache, invalidate_usuario_telefono_cache,
+    invalidate_correlaciones_cache, invalidate_all_user_caches
 )
 
 
+def _save(db: Session, instance, commit: bool):
+    """
+    Agrega la instancia a la sesión y la persiste.
+
+    Con commit=False solo hace flush (asigna el id) y deja el commit al
+    llamador, para agrupar varias escrituras en una sola transacción.
+    """
+    db.add(instance)
+    if commit:
+        db.commit()
+        db.refresh(instance)
+    else:
+        db.flush()
+    return instance
+
+
 # ===== Usuario CRUD =====
 @cached_usuario
 def get_usuario(db: Session, usuario_id: int):
-    return db.query(Usuario).filter(Usuario.id == usuario_id).first()
+    return db.get(Usuario, usuario_id)
+
+
+def usuario_exists(db: Session, usuario_id: int) -> bool:
+    """
+    Verifica si existe el usuario seleccionando solo su id,
+    sin cargar la fila completa.
+    """
+    return db.query(Usuario.id).filter(Usuario.id == usuario_id).first() is not None
+
+
+# Statements usados en cada webhook, construidos una vez a nivel de módulo
+# para que SQLAlchemy reutilice la compilación cacheada en cada llamada
+_USUARIO_BY_TELEFONO = select(Usuario).where(Usuario.telefono == bindparam("telefono")).limit(1)
+
+_CONVERSACIONES_BY_USUARIO = select(ConversacionContexto).where(
+    ConversacionContexto.usuario_id == bindparam("usuario_id")
+).order_by(ConversacionContexto.timestamp.desc(), ConversacionContexto.id.desc())
+
+_ESTADOS_ANIMO_BY_USUARIO = select(EstadoAnimo).where(
+    EstadoAnimo.usuario_id == bindparam("usuario_id")
+).order_by(EstadoAnimo.timestamp.desc(), EstadoAnimo.id.desc())
+
+# El hábito de cada registro se carga en una segunda query (IN) en lugar
+# de una por registro al acceder a registro.habito
+_REGISTROS_BY_USUARIO = select(RegistroHabito).where(
+    RegistroHabito.usuario_id == bindparam("usuario_id")
+).order_by(RegistroHabito.timestamp.desc(), RegistroHabito.id.desc()).options(selectinload(RegistroHabito.habito))
+
+_REGISTROS_BY_HABITO = select(RegistroHabito).where(
+    RegistroHabito.habito_id == bindparam("habito_id")
+).order_by(RegistroHabito.timestamp.desc())
+
+# Variantes keyset (seek) de los listados por timestamp: con un cursor
+# ``before`` el índice compuesto (usuario/hábito, timestamp) salta directo
+# a la página en lugar de recorrer y descartar ``skip`` filas. El timestamp
+# no es único (inserts por lote), así que el cursor es (timestamp, id)
+_CONVERSACIONES_BY_USUARIO_BEFORE = _CONVERSACIONES_BY_USUARIO.where(
+    tuple_(ConversacionContexto.timestamp, ConversacionContexto.id) < tuple_(bindparam("before_ts"), bindparam("before_id"))
+)
+
+_ESTADOS_ANIMO_BY_USUARIO_BEFORE = _ESTADOS_ANIMO_BY_USUARIO.where(
+    tuple_(EstadoAnimo.timestamp, EstadoAnimo.id) < tuple_(bindparam("before_ts"), bindparam("before_id"))
+)
+
+_REGISTROS_BY_USUARIO_BEFORE = _REGISTROS_BY_USUARIO.where(
+    tuple_(RegistroHabito.timestamp, RegistroHabito.id) < tuple_(bindparam("before_ts"), bindparam("before_id"))
+)
+
+_CORRELACIONES_BY_USUARIO = select(Correlacion).where(
+    Correlacion.usuario_id == bindparam("usuario_id")
+).order_by(Correlacion.impacto_animo.desc())
+
+_INSERT_CONVERSACION = insert(ConversacionContexto).returning(ConversacionContexto.id)
+
+_INSERT_ESTADO_ANIMO = insert(EstadoAnimo).returning(EstadoAnimo.id)
+
+# INSERT ... ON CONFLICT DO NOTHING por dialecto (misma API en ambos)
+_UPSERT_INSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
+
+def _page(
+    stmt, seek_stmt, params: dict, before: Optional[Tuple[datetime, int]], skip: int, limit: int
+):
+    """
+    Arma la página de un listado ordenado por (timestamp, id) descendente.
+
+    Con ``before`` usa el statement keyset (filas estrictamente anteriores
+    al cursor (timestamp, id) de la última fila de la página previa) y
+    ignora ``skip``; si no, offset/limit.
+    """
+    if before is not None:
+        params["before_ts"], params["before_id"] = before
+        return seek_stmt.limit(limit), params
+    return stmt.offset(skip).limit(limit), params
+
+
+def _bulk_insert(db: Session, model, rows: List[dict], commit: bool) -> list:
+    """
+    Inserta varias filas con un único INSERT ... RETURNING por lotes
+    (insertmanyvalues) y un solo commit, en lugar de un add/commit/refresh
+    por fila.
+
+    Devuelve las instancias en el mismo orden que ``rows``, con sus ids.
+    """
+    if not rows:
+        return []
+    stmt = insert(model).returning(model, sort_by_parameter_order=True)
+    instances = db.scalars(stmt, rows).all()
+    if commit:
+        db.commit()
+    return instances
+
+
+def _insert_returning_id(db: Session, statement, values: dict, commit: bool) -> int:
+    """
+    Inserta una fila con un INSERT ... RETURNING id y devuelve solo el id,
+    sin instanciar el objeto ORM ni recargarlo con un SELECT.
+
+    Para escrituras donde el llamador no necesita la fila completa.
+    """
+    row_id = db.execute(statement, values).scalar_one()
+    if commit:
+        db.commit()
+    return row_id
 
 
+@cached_usuario_by_telefono
 def get_usuario_by_telefono(db: Session, telefono: str):
-    return db.query(Usuario).filter(Usuario.telefono == telefono).first()
+    # Los teléfonos se guardan normalizados (UsuarioCreate): +<dígitos>
+    telefono = sanitize_phone_number(telefono)
+    return db.scalars(_USUARIO_BY_TELEFONO, {"telefono": telefono}).first()
+
+
+def get_usuario_with_recent_conversaciones(
+    db: Session, telefono: str, limit: int = 5
+) -> Tuple[Optional[Usuario], List[ConversacionContexto]]:
+    """
+    Obtiene el usuario por teléfono junto con sus últimas conversaciones
+    en un solo round-trip.
+
+    Si el usuario está en el cache por teléfono solo consulta las
+    conversaciones; si no, une el usuario con sus conversaciones rankeadas
+    con ROW_NUMBER() OVER (ORDER BY timestamp DESC).
+
+    Returns:
+        (usuario, conversaciones más recientes primero); (None, []) si no existe.
+    """
+    telefono = sanitize_phone_number(telefono)
+    usuario = get_cached_usuario_by_telefono(db, telefono)
+    if usuario is not None:
+        return usuario, get_conversaciones_by_usuario(db, usuario_id=usuario.id, limit=limit)
+
+    usuario_id = select(Usuario.id).where(Usuario.telefono == telefono).scalar_subquery()
+    ranked = select(
+        ConversacionContexto,
+        func.row_number().over(order_by=ConversacionContexto.timestamp.desc()).label('rn')
+    ).where(ConversacionContexto.usuario_id == usuario_id).subquery()
+
+    reciente = aliased(ConversacionContexto, ranked)
+    rows = db.execute(
+        select(Usuario, reciente)
+        .outerjoin(ranked, and_(ranked.c.usuario_id == Usuario.id, ranked.c.rn <= limit))
+        .where(Usuario.telefono == telefono)
+        .order_by(ranked.c.rn)
+    ).all()
+    if not rows:
+        return None, []
+
+    usuario = rows[0][0]
+    cache_usuario_by_telefono(telefono, usuario)
+    return usuario, [conversacion for _, conversacion in rows if conversacion is not None]
 
 
 def get_usuarios(db: Session, skip: int = 0, limit: int = 100):
     return db.query(Usuario).offset(skip).limit(limit).all()
 
 
-def create_usuario(db: Session, usuario: UsuarioCreate):
-    db_usuario = Usuario(**usuario.model_dump())
-    db.add(db_usuario)
-    db.commit()
-    db.refresh(db_usuario)
+def create_usuario(db: Session, usuario: UsuarioCreate, commit: bool = True):
+    db_usuario = _save(db, Usuario(**usuario.model_dump()), commit)
+    if commit:
+        # El próximo mensaje del usuario no necesita el SELECT por teléfono.
+        # Con commit=False la fila todavía puede revertirse: no se cachea
+        cache_usuario_by_telefono(db_usuario.telefono, db_usuario)
     return db_usuario
 
 
@@ -45,47 +216,120 @@ def get_or_create_usuario(db: Session, usuario: UsuarioCreate):
     if existing:
         return existing
     
-    # Si no existe, intentar crearlo
+    dialect_insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if dialect_insert is not None:
+        # Inserción atómica: si otra request ya creó el usuario, el
+        # INSERT no devuelve fila y basta con leer la existente
+        stmt = dialect_insert(Usuario).values(**usuario.model_dump()).on_conflict_do_nothing(
+            index_elements=[Usuario.telefono]
+        ).returning(Usuario)
+        created = db.scalars(stmt).first()
+        if created is None:
+            db.commit()
+            return get_usuario_by_telefono(db, telefono=usuario.telefono)
+        # Cachear con los valores del RETURNING antes del commit, que expira
+        # la instancia: copiarla después dispararía un SELECT para recargarla
+        cache_usuario_by_telefono(usuario.telefono, created)
+        try:
+            db.commit()
+        except Exception:
+            invalidate_usuario_telefono_cache(usuario.telefono)
+            raise
+        return created
+    
+    # Otros dialectos: crear y, si choca con la restricción única,
+    # leer el usuario que ya fue confirmado por la otra transacción
     try:
         return create_usuario(db, usuario=usuario)
-    except Exception:
-        # Si falla (probablemente por race condition), obtenerlo de nuevo
+    except IntegrityError:
         db.rollback()
-        # Esperar un poco para asegurar que la otra transacción termine
-        import time
-        time.sleep(0.05)  # 50ms
         existing = get_usuario_by_telefono(db, telefono=usuario.telefono)
         if existing:
             return existing
-        raise  # Si aún no existe, re-lanzar el error original
+        raise
 
 
 # ===== EstadoAnimo CRUD =====
 def get_estado_animo(db: Session, estado_animo_id: int):
-    return db.query(EstadoAnimo).filter(EstadoAnimo.id == estado_animo_id).first()
+    return db.get(EstadoAnimo, estado_animo_id)
 
 
-def get_estados_animo_by_usuario(db: Session, usuario_id: int, skip: int = 0, limit: int = 100):
+def get_estados_animo_by_usuario(
+    db: Session,
+    usuario_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    fields: Optional[Sequence] = None,
+    before: Optional[Tuple[datetime, int]] = None,
+):
     """
     Obtiene estados de ánimo de un usuario ordenados por timestamp descendente.
     Usa el índice compuesto ix_estados_animo_usuario_timestamp.
+
+    Args:
+        fields: Columnas a cargar (p.ej. ``[EstadoAnimo.nivel]``). Solo para
+            callers que no acceden a otros atributos: el resto se cargaría
+            con una query por fila.
+        before: Cursor keyset (timestamp, id); solo estados anteriores. La
+            página siguiente usa el (timestamp, id) del último estado devuelto.
+    """
+    stmt, params = _page(
+        _ESTADOS_ANIMO_BY_USUARIO, _ESTADOS_ANIMO_BY_USUARIO_BEFORE,
+        {"usuario_id": usuario_id}, before, skip, limit
+    )
+    if fields:
+        stmt = stmt.options(load_only(*fields))
+    return db.scalars(stmt, params).all()
+
+
+def get_latest_estados_animo(db: Session, usuario_ids: List[int]) -> Dict[int, EstadoAnimo]:
+    """
+    Obtiene el estado de ánimo más reciente de varios usuarios en una sola query.
+    Usa ROW_NUMBER() OVER (PARTITION BY usuario_id ORDER BY timestamp DESC).
+
+    Returns:
+        Dict {usuario_id: EstadoAnimo}; los usuarios sin registros no aparecen.
     """
-    return db.query(EstadoAnimo).filter(
-        EstadoAnimo.usuario_id == usuario_id
-    ).order_by(EstadoAnimo.timestamp.desc()).offset(skip).limit(limit).all()
+    if not usuario_ids:
+        return {}
 
+    ranked = select(
+        EstadoAnimo,
+        func.row_number().over(
+            partition_by=EstadoAnimo.usuario_id,
+            order_by=EstadoAnimo.timestamp.desc()
+        ).label('rn')
+    ).where(EstadoAnimo.usuario_id.in_(usuario_ids)).subquery()
 
-def create_estado_animo(db: Session, estado_animo: EstadoAnimoCreate, usuario_id: int):
+    latest = aliased(EstadoAnimo, ranked)
+    estados = db.execute(select(latest).where(ranked.c.rn == 1)).scalars().all()
+    return {estado.usuario_id: estado for estado in estados}
+
+
+def get_latest_estado_animo(db: Session, usuario_id: int) -> Optional[EstadoAnimo]:
+    """Obtiene el estado de ánimo más reciente de un usuario."""
+    return get_latest_estados_animo(db, [usuario_id]).get(usuario_id)
+
+
+def create_estado_animo(
+    db: Session, estado_animo: EstadoAnimoCreate, usuario_id: int, commit: bool = True
+):
     db_estado_animo = EstadoAnimo(**estado_animo.model_dump(), usuario_id=usuario_id)
-    db.add(db_estado_animo)
-    db.commit()
-    db.refresh(db_estado_animo)
-    return db_estado_animo
+    return _save(db, db_estado_animo, commit)
+
+
+def insert_estado_animo(
+    db: Session, estado_animo: EstadoAnimoCreate, usuario_id: int, commit: bool = True
+) -> int:
+    """Como create_estado_animo, pero devuelve solo el id del registro."""
+    return _insert_returning_id(
+        db, _INSERT_ESTADO_ANIMO, {**estado_animo.model_dump(), "usuario_id": usuario_id}, commit
+    )
 
 
 # ===== Habito CRUD =====
 def get_habito(db: Session, habito_id: int):
-    return db.query(Habito).filter(Habito.id == habito_id).first()
+    return db.get(Habito, habito_id)
 
 
 @cached_habitos_activos
@@ -96,18 +340,17 @@ def get_habitos_by_usuario(db: Session, usuario_id: int, activo: Optional[bool]
     return query.all()
 
 
-def create_habito(db: Session, habito: HabitoCreate, usuario_id: int):
-    db_habito = Habito(**habito.model_dump(), usuario_id=usuario_id)
-    db.add(db_habito)
-    db.commit()
-    db.refresh(db_habito)
+def create_habito(db: Session, habito: HabitoCreate, usuario_id: int, commit: bool = True):
+    db_habito = _save(db, Habito(**habito.model_dump(), usuario_id=usuario_id), commit)
     # Invalidar cache de hábitos al crear uno nuevo
-    invalidate_habitos_cache(usuario_id)
+    # (con commit=False lo invalida el llamador después de su commit)
+    if commit:
+        invalidate_habitos_cache(usuario_id)
     return db_habito
 
 
 def update_habito(db: Session, habito_id: int, habito_update: HabitoUpdate):
-    db_habito = db.query(Habito).filter(Habito.id == habito_id).first()
+    db_habito = db.get(Habito, habito_id)
     if db_habito:
         update_data = habito_update.dict(exclude_unset=True)
         for key, value in update_data.items():
@@ -120,7 +363,7 @@ def update_habito(db: Session, habito_id: int, habito_update: HabitoUpdate):
 
 
 def delete_habito(db: Session, habito_id: int):
-    db_habito = db.query(Habito).filter(Habito.id == habito_id).first()
+    db_habito = db.get(Habito, habito_id)
     if db_habito:
         usuario_id = db_habito.usuario_id
         db.delete(db_habito)
@@ -132,17 +375,22 @@ def delete_habito(db: Session, habito_id: int):
 
 # ===== RegistroHabito CRUD =====
 def get_registro_habito(db: Session, registro_id: int):
-    return db.query(RegistroHabito).filter(RegistroHabito.id == registro_id).first()
+    return db.get(RegistroHabito, registro_id)
 
 
-def get_registros_by_usuario(db: Session, usuario_id: int, skip: int = 0, limit: int = 100):
+def get_registros_by_usuario(
+    db: Session, usuario_id: int, skip: int = 0, limit: int = 100, before: Optional[Tuple[datetime, int]] = None
+):
     """
     Obtiene registros de hábitos de un usuario ordenados por timestamp descendente.
     Usa el índice compuesto ix_registros_habitos_usuario_timestamp.
+    Con ``before`` pagina por keyset (ver get_estados_animo_by_usuario).
     """
-    return db.query(RegistroHabito).filter(
-        RegistroHabito.usuario_id == usuario_id
-    ).order_by(RegistroHabito.timestamp.desc()).offset(skip).limit(limit).all()
+    stmt, params = _page(
+        _REGISTROS_BY_USUARIO, _REGISTROS_BY_USUARIO_BEFORE,
+        {"usuario_id": usuario_id}, before, skip, limit
+    )
+    return db.scalars(stmt, params).all()
 
 
 def get_registros_by_habito(db: Session, habito_id: int, skip: int = 0, limit: int = 100):
@@ -150,47 +398,66 @@ def get_registros_by_habito(db: Session, habito_id: int, skip: int = 0, limit: i
     Obtiene registros de un hábito específico ordenados por timestamp descendente.
     Usa el índice compuesto ix_registros_habitos_habito_timestamp.
     """
-    return db.query(RegistroHabito).filter(
-        RegistroHabito.habito_id == habito_id
-    ).order_by(RegistroHabito.timestamp.desc()).offset(skip).limit(limit).all()
+    stmt = _REGISTROS_BY_HABITO.offset(skip).limit(limit)
+    return db.scalars(stmt, {"habito_id": habito_id}).all()
 
 
-def create_registro_habito(db: Session, registro: RegistroHabitoCreate, usuario_id: int):
+def create_registro_habito(
+    db: Session, registro: RegistroHabitoCreate, usuario_id: int, commit: bool = True
+):
     db_registro = RegistroHabito(**registro.model_dump(), usuario_id=usuario_id)
-    db.add(db_registro)
-    db.commit()
-    db.refresh(db_registro)
-    return db_registro
+    return _save(db, db_registro, commit)
+
+
+def bulk_create_registros_habito(
+    db: Session, registros: List[RegistroHabitoCreate], usuario_id: int, commit: bool = True
+) -> List[RegistroHabito]:
+    """Crea varios registros de hábitos del usuario en un solo INSERT y commit."""
+    return _bulk_insert(
+        db, RegistroHabito,
+        [{**registro.model_dump(), "usuario_id": usuario_id} for registro in registros],
+        commit,
+    )
 
 
 # ===== ConversacionContexto CRUD =====
 def get_conversacion(db: Session, conversacion_id: int):
-    return db.query(ConversacionContexto).filter(ConversacionContexto.id == conversacion_id).first()
+    return db.get(ConversacionContexto, conversacion_id)
 
 
-def get_conversaciones_by_usuario(db: Session, usuario_id: int, skip: int = 0, limit: int = 100):
-    return db.query(ConversacionContexto).filter(
-        ConversacionContexto.usuario_id == usuario_id
-    ).order_by(ConversacionContexto.timestamp.desc()).offset(skip).limit(limit).all()
+def get_conversaciones_by_usuario(
+    db: Session, usuario_id: int, skip: int = 0, limit: int = 100, before: Optional[Tuple[datetime, int]] = None
+):
+    stmt, params = _page(
+        _CONVERSACIONES_BY_USUARIO, _CONVERSACIONES_BY_USUARIO_BEFORE,
+        {"usuario_id": usuario_id}, before, skip, limit
+    )
+    return db.scalars(stmt, params).all()
 
 
-def create_conversacion(db: Session, conversacion: ConversacionContextoCreate, usuario_id: int):
+def create_conversacion(
+    db: Session, conversacion: ConversacionContextoCreate, usuario_id: int, commit: bool = True
+):
     db_conversacion = ConversacionContexto(**conversacion.model_dump(), usuario_id=usuario_id)
-    db.add(db_conversacion)
-    db.commit()
-    db.refresh(db_conversacion)
-    return db_conversacion
+    return _save(db, db_conversacion, commit)
+
+
+def insert_conversacion(
+    db: Session, conversacion: ConversacionContextoCreate, usuario_id: int, commit: bool = True
+) -> int:
+    """Como create_conversacion, pero devuelve solo el id de la conversación."""
+    return _insert_returning_id(
+        db, _INSERT_CONVERSACION, {**conversacion.model_dump(), "usuario_id": usuario_id}, commit
+    )
 
 
 # ===== Correlacion CRUD =====
 def get_correlacion(db: Session, correlacion_id: int):
-    return db.query(Correlacion).filter(Correlacion.id == correlacion_id).first()
+    return db.get(Correlacion, correlacion_id)
 
 
 def get_correlaciones_by_usuario(db: Session, usuario_id: int):
-    return db.query(Correlacion).filter(
-        Correlacion.usuario_id == usuario_id
-    ).order_by(Correlacion.impacto_animo.desc()).all()
+    return db.scalars(_CORRELACIONES_BY_USUARIO, {"usuario_id": usuario_id}).all()
 
 
 def create_correlacion(db: Session, correlacion: CorrelacionCreate, usuario_id: int):
@@ -198,12 +465,32 @@ def create_correlacion(db: Session, correlacion: CorrelacionCreate, usuario_id:
     db.add(db_correlacion)
     db.commit()
     db.refresh(db_correlacion)
+    invalidate_correlaciones_cache(usuario_id)
     return db_correlacion
 
 
+def bulk_create_correlaciones(
+    db: Session, correlaciones: List[CorrelacionCreate], usuario_id: int, commit: bool = True
+) -> List[Correlacion]:
+    """
+    Crea varias correlaciones del usuario en un solo INSERT y commit.
+    Con commit=False el llamador invalida correlaciones_cache después de su commit.
+    """
+    db_correlaciones = _bulk_insert(
+        db, Correlacion,
+        [{**correlacion.model_dump(), "usuario_id": usuario_id} for correlacion in correlaciones],
+        commit,
+    )
+    if commit:
+        invalidate_correlaciones_cache(usuario_id)
+    return db_correlaciones
+
+
 def delete_correlacion(db: Session, correlacion_id: int):
-    db_correlacion = db.query(Correlacion).filter(Correlacion.id == correlacion_id).first()
+    db_correlacion = db.get(Correlacion, correlacion_id)
     if db_correlacion:
+        usuario_id = db_correlacion.usuario_id
         db.delete(db_correlacion)
         db.commit()
+        invalidate_correlaciones_cache(usuario_id)
     return db_correlacion
\ No newline at end of file
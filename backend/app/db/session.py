@@ -1,6 +1,6 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.orm import DeclarativeBase, sessionmaker
 import os
 from pathlib import Path
 
@@ -12,24 +12,52 @@ SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
     # Extraer la ruta del archivo de la URL de SQLite
     db_path = SQLALCHEMY_DATABASE_URL.replace("sqlite:///", "")
-    db_dir = os.path.dirname(db_path)
+    in_memory = db_path in ("sqlite://", ":memory:") or "mode=memory" in db_path
+    db_dir = None if in_memory else os.path.dirname(db_path)
     
     # Crear el directorio si no existe
     if db_dir and not os.path.exists(db_dir):
         os.makedirs(db_dir, exist_ok=True)
         print(f"📁 Directorio de base de datos creado: {db_dir}")
     
+    engine_kwargs = {}
+    if in_memory:
+        # En memoria: una única conexión compartida, si no cada conexión
+        # del pool vería una base distinta
+        engine_kwargs["poolclass"] = StaticPool
+    
     engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        **engine_kwargs,
     )
+    
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL: lectores no bloquean al escritor; NORMAL es seguro con WAL
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
 else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_pre_ping=True,  # descarta conexiones caídas antes de usarlas
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_use_lifo=True,  # reutiliza conexiones calientes; las ociosas expiran
+    )
 
 # Crear una sesión local
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Base para los modelos de declaración
-Base = declarative_base()
+class Base(DeclarativeBase):
+    pass
+
 
 # Dependencia para obtener la sesión de BD
 def get_db():
@@ -1,5 +1,7 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -18,9 +20,9 @@ from app.core.config import settings
 from app.core.logger import setup_logger
 from app.core.sentry import init_sentry
 from app.core.logging_config import setup_logging, set_audit_logger, get_logger
-from app.core.logging_middleware import RequestLoggingMiddleware, SlowRequestMiddleware
-from app.db.session import engine
-from app.models import mood
+from app.core.logging_middleware import RequestLoggingMiddleware
+from app.core.cors_middleware import CORSMiddleware
+from app.services.whatsapp_service import whatsapp_service
 
 # Inicializar sistema de logging estructurado
 environment = 'production' if settings.ENV == 'production' else 'development'
@@ -41,12 +43,20 @@ logger = get_logger(__name__)
 init_sentry()
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup/shutdown de la app: cierra los clientes HTTP compartidos."""
+    yield
+    await whatsapp_service.aclose()
+
+
 def create_app() -> FastAPI:
     """Application factory to enable future configuration hooks."""
     app = FastAPI(
         title="MoodTracker API - Loki",
         version="0.1.0",
         description="API for Loki, the WhatsApp-based emotional companion",
+        lifespan=lifespan,
     )
 
     # Configurar rate limiting
@@ -56,8 +66,12 @@ def create_app() -> FastAPI:
 
     # ===== Middlewares de Logging =====
     # Agregar middlewares de logging (ANTES de CORS)
-    app.add_middleware(SlowRequestMiddleware, threshold_ms=1000)  # Warn si >1s
-    app.add_middleware(RequestLoggingMiddleware)  # Loggea todas las requests
+    # Loggea todas las requests; warning si >1s
+    app.add_middleware(RequestLoggingMiddleware, threshold_ms=1000)
+
+    # Comprimir respuestas >= 1 KB (analytics, patterns, dashboard). Va
+    # dentro de CORS: CORS suma Origin al Vary: Accept-Encoding de GZip
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
 
     # Configurar CORS de forma restrictiva
     app.add_middleware(
@@ -4,6 +4,7 @@ Maneja la personalidad de Loki y extrae información contextual de las conversac
 """
 
 from typing import Dict, Any, Optional, List
+import asyncio
 import json
 import os
 from datetime import datetime
@@ -21,6 +22,9 @@ from app.services.pending_topics_service import pending_topics_service
 
 logger = setup_logger(__name__)
 
+# Máximo de llamadas simultáneas al proveedor de IA (protege sus rate limits)
+MAX_CONCURRENT_LLM_CALLS = 8
+
 
 class LokiAIService:
     """
@@ -36,6 +40,10 @@ class LokiAIService:
         # Modo de conversación: 'conciso' (default) o 'profundo'
         self.conversation_mode = 'conciso'
 
+        # Los SDKs de Gemini/Claude son bloqueantes: se llaman en un thread,
+        # con un tope de llamadas concurrentes
+        self._llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+
         # Prioridad: Google Gemini > Anthropic Claude > Fallback
         self.ai_provider = None
         
@@ -1002,14 +1010,16 @@ Ejemplos:
             # Formato simple y directo que no activa filtros
             simple_prompt = f"{usuario_nombre} te dice: '{mensaje_sin_context}'. Responde de forma amigable y breve."
             
-            response = self.gemini_model.generate_content(
-                simple_prompt,
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=300,
-                    temperature=0.8,
-                ),
-                safety_settings=safety_settings
-            )
+            async with self._llm_semaphore:
+                response = await asyncio.to_thread(
+                    self.gemini_model.generate_content,
+                    simple_prompt,
+                    generation_config=genai.types.GenerationConfig(
+                        max_output_tokens=300,
+                        temperature=0.8,
+                    ),
+                    safety_settings=safety_settings
+                )
             
             # Manejar respuestas bloqueadas
             if not response.candidates or not response.text:
@@ -1019,13 +1029,15 @@ Ejemplos:
             
         elif self.ai_provider == 'claude':
             # Claude API
-            response = self.claude_client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=300,
-                temperature=0.8,
-                system=system_prompt,
-                messages=messages
-            )
+            async with self._llm_semaphore:
+                response = await asyncio.to_thread(
+                    self.claude_client.messages.create,
+                    model="claude-3-haiku-20240307",
+                    max_tokens=300,
+                    temperature=0.8,
+                    system=system_prompt,
+                    messages=messages
+                )
             respuesta = response.content[0].text
         else:
             # Fallback a reglas si no hay API
@@ -4,7 +4,7 @@ Mapea emociones complejas, detecta ciclos emocionales y analiza patrones de recu
 """
 
 from typing import List, Dict, Optional, Tuple
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import func, and_
 from datetime import datetime, timedelta
 import statistics
@@ -497,7 +497,9 @@ class EmotionalAnalysisService:
             recovery_start = period['start']
             recovery_end = recovery_start + timedelta(days=int(float(period['recovery'].total_seconds() / 86400)))
 
-            habitos = db.query(RegistroHabito).filter(
+            habitos = db.query(RegistroHabito).options(
+                selectinload(RegistroHabito.habito)  # evita una query por registro
+            ).filter(
                 and_(
                     RegistroHabito.usuario_id == usuario_id,
                     RegistroHabito.timestamp >= recovery_start,
@@ -74,7 +74,20 @@ def categorize_habit(habit_name: str) -> str:
 async def create_or_update_habits_from_mentions(
     db: Session,
     usuario_id: int,
-    habits_mentioned: List[str]
+    habits_mentioned: List[str],
+    commit: bool = True
+) -> Dict[str, List]:
+    """
+    Versión async de create_or_update_habits, para llamar desde el event loop.
+    """
+    return create_or_update_habits(db, usuario_id, habits_mentioned, commit=commit)
+
+
+def create_or_update_habits(
+    db: Session,
+    usuario_id: int,
+    habits_mentioned: List[str],
+    commit: bool = True
 ) -> Dict[str, List]:
     """
     Crea o actualiza hábitos basándose en las menciones detectadas en la conversación.
@@ -83,6 +96,8 @@ async def create_or_update_habits_from_mentions(
         db: Sesión de base de datos
         usuario_id: ID del usuario
         habits_mentioned: Lista de hábitos mencionados (puede incluir texto adicional)
+        commit: Si es False las escrituras solo se hacen flush y el llamador
+            hace un único commit al final
     
     Returns:
         Dict con 'created', 'updated', y 'registered' habits
@@ -122,7 +137,7 @@ async def create_or_update_habits_from_mentions(
                     completado=True,
                     notas=f"Auto-registrado desde conversación: {mention}"
                 )
-                crud.create_registro_habito(db, registro=registro_data, usuario_id=usuario_id)
+                crud.create_registro_habito(db, registro=registro_data, usuario_id=usuario_id, commit=commit)
                 
                 result['registered'].append({
                     'id': habito.id,
@@ -143,7 +158,7 @@ async def create_or_update_habits_from_mentions(
                     activo=True
                 )
                 
-                nuevo_habito = crud.create_habito(db, habito=habito_data, usuario_id=usuario_id)
+                nuevo_habito = crud.create_habito(db, habito=habito_data, usuario_id=usuario_id, commit=commit)
                 
                 # Crear también el registro de cumplimiento
                 registro_data = schemas.RegistroHabitoCreate(
@@ -151,7 +166,7 @@ async def create_or_update_habits_from_mentions(
                     completado=True,
                     notas=f"Auto-creado y registrado desde conversación: {mention}"
                 )
-                crud.create_registro_habito(db, registro=registro_data, usuario_id=usuario_id)
+                crud.create_registro_habito(db, registro=registro_data, usuario_id=usuario_id, commit=commit)
                 
                 result['created'].append({
                     'id': nuevo_habito.id,
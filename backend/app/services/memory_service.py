@@ -14,6 +14,7 @@ from app.models.mood import (
     Usuario, ConversacionContexto, ResumenConversacion,
     PerfilUsuario, EstadoAnimo
 )
+from app.core.caching import resumenes_cache, stats, invalidate_resumenes_cache
 
 
 class ConversationalMemoryService:
@@ -82,6 +83,7 @@ class ConversationalMemoryService:
 
         db.add(resumen)
         db.commit()
+        invalidate_resumenes_cache(usuario_id)
 
         return resumen
 
@@ -444,14 +446,28 @@ class ConversationalMemoryService:
         Obtiene contexto histórico de largo plazo basado en resúmenes previos.
         Útil para incluir en el prompt de Claude.
 
+        El texto se cachea por usuario junto con num_summaries (resumenes_cache
+        lo descarta después de 50 lecturas o 15 minutos).
+
         Returns:
             Texto de contexto histórico formateado
         """
+        try:
+            cached_num, contexto = resumenes_cache[usuario_id]
+        except KeyError:
+            pass
+        else:
+            if cached_num == num_summaries:
+                stats['resumenes'].hit()
+                return contexto
+        stats['resumenes'].miss()
+
         resumenes = db.query(ResumenConversacion).filter(
             ResumenConversacion.usuario_id == usuario_id
         ).order_by(desc(ResumenConversacion.fecha_resumen)).limit(num_summaries).all()
 
         if not resumenes:
+            resumenes_cache[usuario_id] = (num_summaries, "")
             return ""
 
         contexto = "### CONTEXTO HISTÓRICO DE CONVERSACIONES PREVIAS\n\n"
@@ -460,6 +476,7 @@ class ConversationalMemoryService:
             contexto += f"**Período: {resumen.periodo_inicio.strftime('%d/%m/%Y')} - {resumen.periodo_fin.strftime('%d/%m/%Y')}**\n"
             contexto += f"{resumen.resumen_texto}\n\n"
 
+        resumenes_cache[usuario_id] = (num_summaries, contexto)
         return contexto
 
 
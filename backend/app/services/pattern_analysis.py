@@ -14,6 +14,7 @@ from app.models.mood import (
     Usuario, EstadoAnimo, Habito, RegistroHabito, 
     Correlacion, ConversacionContexto
 )
+from app.core.caching import patrones_cache, stats, invalidate_correlaciones_cache
 
 
 class PatternAnalysisService:
@@ -354,6 +355,7 @@ class PatternAnalysisService:
                 db.add(nueva_corr)
         
         db.commit()
+        invalidate_correlaciones_cache(usuario_id)
     
     def get_relevant_insights_for_conversation(
         self, 
@@ -367,6 +369,43 @@ class PatternAnalysisService:
         # Obtener análisis reciente
         patterns = self.analyze_user_patterns(db, usuario_id, days_lookback=30)
         
+        return self._build_conversation_insight(patterns, current_mood)
+    
+    def analyze_with_conversation_insight(
+        self,
+        db: Session,
+        usuario_id: int,
+        current_mood: Optional[int] = None,
+        days_lookback: int = 30
+    ) -> Tuple[Dict, str]:
+        """
+        Analiza patrones una sola vez y deriva el insight conversacional
+        del mismo resultado. El análisis se cachea por usuario (5 minutos).
+        
+        Returns:
+            Tuple con (análisis completo, insight conversacional)
+        """
+        cache_key = (usuario_id, days_lookback)
+        
+        try:
+            patterns = patrones_cache[cache_key]
+        except KeyError:
+            stats['patrones'].miss()
+            patterns = self.analyze_user_patterns(db, usuario_id, days_lookback=days_lookback)
+            patrones_cache[cache_key] = patterns
+        else:
+            stats['patrones'].hit()
+        
+        return patterns, self._build_conversation_insight(patterns, current_mood)
+    
+    def _build_conversation_insight(
+        self,
+        patterns: Dict,
+        current_mood: Optional[int] = None
+    ) -> str:
+        """
+        Deriva el insight conversacional a partir de un análisis ya calculado.
+        """
         if not patterns.get('has_enough_data'):
             return ""
         
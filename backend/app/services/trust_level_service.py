@@ -5,7 +5,7 @@ El nivel de confianza determina cómo Loki se comunica: de reservado a cercano.
 from sqlalchemy.orm import Session
 from app.models.mood import Usuario
 from typing import Dict, Optional
-from app.core.caching import cached_trust_level, invalidate_trust_level_cache
+from app.core.caching import cached_trust_level_method, invalidate_trust_level_cache
 
 
 class TrustLevelService:
@@ -84,7 +84,7 @@ class TrustLevelService:
         else:
             return 5
 
-    def update_trust_level(self, db: Session, usuario_id: int) -> Dict:
+    def update_trust_level(self, db: Session, usuario_id: int, commit: bool = True) -> Dict:
         """
         Actualiza el nivel de confianza del usuario basado en sus interacciones.
         También incrementa el contador de interacciones.
@@ -92,11 +92,15 @@ class TrustLevelService:
         Args:
             db: Sesión de base de datos
             usuario_id: ID del usuario
+            commit: Si es False solo hace flush; el llamador hace el commit
+                y después invalida el cache de trust level
 
         Returns:
             Diccionario con información del nivel de confianza actualizado
         """
-        usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
+        # populate_existing: el usuario puede venir del cache por teléfono con
+        # contadores desactualizados; se recargan antes de incrementarlos
+        usuario = db.query(Usuario).populate_existing().filter(Usuario.id == usuario_id).first()
         if not usuario:
             return {'error': 'Usuario no encontrado'}
 
@@ -108,10 +112,13 @@ class TrustLevelService:
         nivel_nuevo = self.calculate_trust_level(usuario.total_interacciones)
         usuario.nivel_confianza = nivel_nuevo
 
-        db.commit()
-
-        # Invalidar cache de trust level al actualizar
-        invalidate_trust_level_cache(usuario_id)
+        if commit:
+            db.commit()
+            # Invalidar recién después del commit: antes, una lectura
+            # concurrente volvería a cachear el valor viejo
+            invalidate_trust_level_cache(usuario_id)
+        else:
+            db.flush()
 
         # Detectar si hubo cambio de nivel (para celebrar o notificar)
         nivel_cambio = nivel_nuevo > nivel_anterior
@@ -137,7 +144,7 @@ class TrustLevelService:
         """
         return self.TRUST_LEVELS.get(nivel, self.TRUST_LEVELS[1])
 
-    @cached_trust_level
+    @cached_trust_level_method
     def get_user_trust_info(self, usuario_id: int, db: Session = None) -> Optional[Dict]:
         """
         Obtiene información completa del nivel de confianza de un usuario.
@@ -155,7 +162,7 @@ class TrustLevelService:
         if db is None:
             raise ValueError("db session is required")
             
-        usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
+        usuario = db.get(Usuario, usuario_id)
         if not usuario:
             return None
 
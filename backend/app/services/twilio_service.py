@@ -3,6 +3,8 @@ Servicio para integración con Twilio WhatsApp API.
 Maneja el envío de mensajes a través de Twilio.
 """
 
+import asyncio
+
 try:
     from twilio.rest import Client
     TWILIO_AVAILABLE = True
@@ -93,21 +95,24 @@ class TwilioWhatsAppService:
             # Asegurar formato whatsapp:+número
             to_number = f"whatsapp:+{phone_number}"
             
-            print(f"📤 Enviando mensaje a WhatsApp (Twilio):")
-            print(f"   From: {self.from_number}")
-            print(f"   To: {to_number}")
-            print(f"   Message: {message[:50]}...")
+            logger.debug(
+                "📤 Enviando mensaje a WhatsApp (Twilio): from=%s to=%s message=%.50s...",
+                self.from_number, to_number, message
+            )
             
-            # Enviar mensaje con Twilio
-            twilio_message = self.client.messages.create(
+            # Enviar mensaje con Twilio (el SDK es bloqueante: corre en un thread
+            # para no frenar el event loop ni la persistencia que corre en paralelo)
+            twilio_message = await asyncio.to_thread(
+                self.client.messages.create,
                 body=message,
                 from_=self.from_number,
                 to=to_number
             )
             
-            print(f"✅ Mensaje enviado exitosamente")
-            print(f"   SID: {twilio_message.sid}")
-            print(f"   Status: {twilio_message.status}")
+            logger.info(
+                "✅ Mensaje enviado exitosamente (SID: %s, status: %s)",
+                twilio_message.sid, twilio_message.status
+            )
             
             return {
                 'success': True,
@@ -116,8 +121,7 @@ class TwilioWhatsAppService:
             }
             
         except Exception as e:
-            logger.error(f"❌ Error enviando mensaje con Twilio: {e}")
-            print(f"❌ Error enviando mensaje: {str(e)}")
+            logger.error("❌ Error enviando mensaje con Twilio: %s", e)
             return {
                 'success': False,
                 'error': str(e)
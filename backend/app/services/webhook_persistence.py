@@ -0,0 +1,119 @@
+"""
+Persistencia compartida de los mensajes recibidos por los webhooks
+de WhatsApp (Meta) y Twilio.
+"""
+from typing import Optional
+
+import orjson
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.models.mood import Usuario
+from app.core.caching import (
+    invalidate_usuario_cache, invalidate_usuario_telefono_cache, invalidate_habitos_cache
+)
+from app.core.logger import setup_logger
+from app.services.habit_automation import create_or_update_habits, get_habit_summary
+
+logger = setup_logger(__name__)
+
+
+def _dumps(obj) -> str:
+    """Serializa a JSON con orjson (UTF-8 nativo, sin escapar no-ASCII)."""
+    return orjson.dumps(obj).decode()
+
+
+def save_webhook_exchange(
+    bind,
+    usuario_id: int,
+    phone_number: str,
+    message_text: str,
+    ai_response: dict,
+    nombre_detectado: Optional[str] = None
+) -> bool:
+    """
+    Persiste la conversación, el estado de ánimo, los hábitos detectados y,
+    si se indica, el nombre del usuario, en una sola transacción.
+
+    Pensado para correr como background task: la sesión del request ya está
+    cerrada, así que abre una propia sobre ``bind``, el engine de esa sesión
+    (``db.get_bind()``; respeta overrides de get_db). Es síncrona; desde
+    código async se llama con run_in_threadpool para no bloquear el event loop.
+
+    Returns:
+        True si se guardó, False si hubo un error (se loggea y se hace rollback)
+    """
+    db = Session(bind=bind, autoflush=False)
+    habits_mentioned = []
+    try:
+        if nombre_detectado:
+            usuario = db.get(Usuario, usuario_id)
+            if usuario:
+                usuario.nombre = nombre_detectado
+                logger.info("✅ Nombre actualizado a: %s para usuario %s", nombre_detectado, usuario_id)
+
+        # El contexto extraído se lee una sola vez; si la IA no extrajo nada
+        # (el caso común) no se arman los schemas de ánimo ni de hábitos
+        context_extracted = ai_response.get('context_extracted') or {}
+        mood_level = context_extracted.get('mood_level')
+        habits_mentioned = context_extracted.get('habits_mentioned') or []
+
+        # Se serializa una sola vez: se guarda tanto en la conversación
+        # como en el estado de ánimo
+        context_json = _dumps(context_extracted)
+
+        # Guardar la conversación
+        conversacion_data = schemas.ConversacionContextoCreate(
+            mensaje_usuario=message_text,
+            respuesta_loki=ai_response['respuesta'],
+            entidades_extraidas=context_json,
+            categorias_detectadas=_dumps(habits_mentioned)
+        )
+        crud.insert_conversacion(db, conversacion=conversacion_data, usuario_id=usuario_id, commit=False)
+
+        # Si se detectó un nivel de ánimo, registrarlo
+        if mood_level:
+            estado_animo_data = schemas.EstadoAnimoCreate(
+                nivel=mood_level,
+                notas_texto=message_text,
+                contexto_extraido=context_json,
+                disparadores_detectados=_dumps(context_extracted.get('emotional_triggers', []))
+            )
+            crud.insert_estado_animo(db, estado_animo=estado_animo_data, usuario_id=usuario_id, commit=False)
+
+        # Si se detectaron hábitos, registrarlos automáticamente. En un
+        # savepoint: si fallan se revierten solo los hábitos, y la
+        # conversación y el ánimo se guardan igual
+        if habits_mentioned:
+            try:
+                with db.begin_nested():
+                    habits_result = create_or_update_habits(
+                        db=db,
+                        usuario_id=usuario_id,
+                        habits_mentioned=habits_mentioned,
+                        commit=False
+                    )
+
+                # Log del resultado
+                summary = get_habit_summary(habits_result)
+                if summary:
+                    logger.info("Hábitos auto-gestionados para %s: %s", phone_number, summary)
+
+            except Exception as e:
+                logger.error("Error auto-gestionando hábitos: %s", e)
+                # No fallar el flujo principal si hay error en hábitos
+
+        # Una sola transacción para todas las escrituras del mensaje
+        db.commit()
+        if nombre_detectado:
+            invalidate_usuario_cache(usuario_id)
+            invalidate_usuario_telefono_cache(phone_number)
+        if habits_mentioned:
+            invalidate_habitos_cache(usuario_id)
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error("Error guardando conversación del webhook: %s", e, exc_info=True)
+        return False
+    finally:
+        db.close()
@@ -24,6 +24,34 @@ class WhatsAppService:
         self.phone_number_id = settings.WHATSAPP_PHONE_NUMBER_ID
         self.api_version = "v18.0"
         self.base_url = f"https://graph.facebook.com/{self.api_version}"
+        # HMAC ya inicializado con la clave; cada verificación trabaja sobre
+        # una copia en lugar de volver a procesar la clave
+        self._hmac_template = (
+            hmac.new(self.verify_token.encode(), digestmod=hashlib.sha256)
+            if self.verify_token else None
+        )
+        # Cliente HTTP compartido: reutiliza conexiones y sesiones TLS con
+        # graph.facebook.com entre mensajes. Se crea en el primer uso.
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Cliente HTTP con pool de conexiones keep-alive."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=100,
+                    max_keepalive_connections=50,
+                    keepalive_expiry=60
+                )
+            )
+        return self._client
+
+    async def aclose(self):
+        """Cierra el cliente HTTP compartido (shutdown de la app)."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
         
     def verify_webhook(self, mode: str, token: str, challenge: str) -> Optional[str]:
         """
@@ -35,18 +63,18 @@ class WhatsAppService:
         log_security_event(logger, "webhook_verification_failed", f"mode={mode}", "WARNING")
         return None
 
-    def verify_webhook_signature(self, payload: str, signature: str) -> bool:
+    def verify_webhook_signature(self, payload: bytes, signature: str) -> bool:
         """
         Verifica la firma X-Hub-Signature-256 del webhook de Meta.
 
         Args:
-            payload: Body del request como string
+            payload: Body crudo del request
             signature: Header X-Hub-Signature-256
 
         Returns:
             True si la firma es válida, False si no
         """
-        if not self.verify_token:
+        if self._hmac_template is None:
             logger.warning("WHATSAPP_VERIFY_TOKEN no configurado, no se puede verificar firma")
             return False
 
@@ -55,11 +83,9 @@ class WhatsAppService:
             return False
 
         # Calcular firma esperada
-        expected_signature = "sha256=" + hmac.new(
-            self.verify_token.encode(),
-            payload.encode(),
-            hashlib.sha256
-        ).hexdigest()
+        mac = self._hmac_template.copy()
+        mac.update(payload)
+        expected_signature = "sha256=" + mac.hexdigest()
 
         # Comparación segura contra timing attacks
         is_valid = hmac.compare_digest(expected_signature, signature)
@@ -82,39 +108,32 @@ class WhatsAppService:
             Dict con 'phone_number', 'message_text', 'message_id', 'timestamp', 'profile_name'
             o None si no es un mensaje válido.
         """
+        # Indexado directo: se ejecuta en cada request. Los webhooks sin
+        # mensajes (p.ej. actualizaciones de estado) caen en el except
         try:
-            entry = data.get('entry', [{}])[0]
-            changes = entry.get('changes', [{}])[0]
-            value = changes.get('value', {})
-
-            # Verificar que hay mensajes
-            messages = value.get('messages', [])
-            if not messages:
-                return None
-
-            message = messages[0]
+            value = data['entry'][0]['changes'][0]['value']
+            message = value['messages'][0]
+        except (KeyError, IndexError, TypeError):
+            return None
 
-            # Solo procesar mensajes de texto por ahora
-            if message.get('type') != 'text':
-                return None
+        # Solo procesar mensajes de texto por ahora
+        if message.get('type') != 'text':
+            return None
 
-            # Extraer información del contacto si está disponible
-            contacts = value.get('contacts', [])
+        # Extraer información del contacto si está disponible
+        try:
+            profile_name = value['contacts'][0]['profile']['name']
+        except (KeyError, IndexError, TypeError):
             profile_name = None
-            if contacts:
-                profile = contacts[0].get('profile', {})
-                profile_name = profile.get('name')
-
-            return {
-                'phone_number': message.get('from'),
-                'message_text': message.get('text', {}).get('body', ''),
-                'message_id': message.get('id'),
-                'timestamp': message.get('timestamp'),
-                'profile_name': profile_name  # Nombre del perfil de WhatsApp
-            }
-        except (KeyError, IndexError) as e:
-            logger.error(f"Error parsing webhook message: {e}")
-            return None
+
+        text = message.get('text')
+        return {
+            'phone_number': message.get('from'),
+            'message_text': text.get('body', '') if text else '',
+            'message_id': message.get('id'),
+            'timestamp': message.get('timestamp'),
+            'profile_name': profile_name  # Nombre del perfil de WhatsApp
+        }
     
     async def send_message(
         self, 
@@ -162,11 +181,10 @@ class WhatsAppService:
         logger.debug(f"Mensaje: {message[:100]}...")
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, headers=headers)
-                response.raise_for_status()
-                logger.info(f"Mensaje enviado exitosamente a {phone_number}")
-                return response.json()
+            response = await self.client.post(url, json=payload, headers=headers)
+            response.raise_for_status()
+            logger.info(f"Mensaje enviado exitosamente a {phone_number}")
+            return response.json()
         except httpx.HTTPError as e:
             logger.error(f"Error sending WhatsApp message: {e}")
             if hasattr(e, 'response') and e.response is not None:
@@ -198,10 +216,9 @@ class WhatsAppService:
         }
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, headers=headers)
-                response.raise_for_status()
-                return response.json()
+            response = await self.client.post(url, json=payload, headers=headers)
+            response.raise_for_status()
+            return response.json()
         except httpx.HTTPError as e:
             logger.error(f"Error marking message as read: {e}")
             return {"error": str(e)}
@@ -15,4 +15,5 @@ alembic upgrade head
 echo "[3/4] Migrations completed successfully"
 
 echo "[4/4] Starting Uvicorn server..."
-uvicorn app.main:app --host 0.0.0.0 --port $PORT
+# uvloop + httptools (incluidos en uvicorn[standard]); workers vía WEB_CONCURRENCY
+uvicorn app.main:app --host 0.0.0.0 --port $PORT --loop uvloop --http httptools
@@ -7,6 +7,7 @@ from sqlalchemy.orm import sessionmaker, Session
 from app.db.session import Base
 from app.models.mood import Usuario
 from app import schemas, crud
+from app.core.caching import clear_all_caches
 
 
 # Create in-memory SQLite database for testing
@@ -37,6 +38,8 @@ def db_session() -> Session:
         session.close()
         # Drop all tables after test
         Base.metadata.drop_all(bind=engine)
+        # Los caches guardan filas de esta BD; no deben sobrevivir al test
+        clear_all_caches()
 
 
 @pytest.fixture(scope="function")
@@ -4,20 +4,25 @@ Tests para el sistema de caching.
 Verifica que los decoradores de cache funcionen correctamente
 y que la invalidación funcione como esperado.
 """
+import threading
+import time
+
 import pytest
 from app.core.caching import (
-    usuario_cache, habitos_activos_cache, trust_level_cache,
-    cached_usuario, cached_habitos_activos, cached_trust_level,
+    usuario_cache, habitos_activos_cache, trust_level_cache, respuestas_exitosas_cache,
+    cached_usuario, cached_habitos_activos, cached_trust_level_func,
     invalidate_usuario_cache, invalidate_habitos_cache, invalidate_trust_level_cache,
+    invalidate_respuestas_exitosas_cache, invalidate_usuario_telefono_cache,
     invalidate_all_user_caches, clear_all_caches,
-    get_cache_stats, stats
+    get_cache_stats, stats, _inflight_locks, FastTTLCache, PressureAwareTTLCache,
+    AccessCountTTLCache, TieredCache
 )
 from app.crud.mood import (
-    get_usuario, get_habitos_by_usuario, create_habito,
-    update_habito, delete_habito
+    get_usuario, get_usuario_by_telefono, get_or_create_usuario, get_habitos_by_usuario,
+    create_habito, update_habito, delete_habito
 )
 from app.services.trust_level_service import trust_service
-from app.schemas.mood import HabitoCreate, HabitoUpdate
+from app.schemas.mood import HabitoCreate, HabitoUpdate, UsuarioCreate
 
 
 @pytest.fixture
@@ -54,6 +59,66 @@ class TestUsuarioCache:
         # Deben ser el mismo objeto
         assert usuario1.id == usuario2.id
     
+    def test_usuario_telefono_cache_hit(self, db_session, test_usuario):
+        """Verifica que el lookup por teléfono se sirva del cache ya adjunto a la sesión."""
+        clear_all_caches()
+        
+        get_usuario_by_telefono(db_session, test_usuario.telefono)
+        assert stats['usuario_telefono'].misses == 1
+        
+        usuario = get_usuario_by_telefono(db_session, test_usuario.telefono)
+        assert stats['usuario_telefono'].hits == 1
+        assert usuario.id == test_usuario.id
+        assert usuario in db_session
+    
+    def test_usuario_telefono_cache_survives_commit(self, db_session, test_usuario):
+        """Verifica que los cambios sobre un usuario cacheado se persistan."""
+        clear_all_caches()
+        get_usuario_by_telefono(db_session, test_usuario.telefono)
+        db_session.close()
+        
+        usuario = get_usuario_by_telefono(db_session, test_usuario.telefono)
+        usuario.nombre = "Nuevo Nombre"
+        db_session.commit()
+        invalidate_usuario_telefono_cache(test_usuario.telefono)
+        db_session.close()
+        
+        assert get_usuario_by_telefono(db_session, test_usuario.telefono).nombre == "Nuevo Nombre"
+        assert stats['usuario_telefono'].invalidations == 1
+
+    def test_usuario_telefono_cache_warmed_on_create(self, db_session):
+        """Verifica que crear un usuario deje el lookup por teléfono en cache."""
+        clear_all_caches()
+
+        creado = get_or_create_usuario(
+            db_session, UsuarioCreate(telefono="+5491100000001", nombre="Nuevo")
+        )
+        hits = stats['usuario_telefono'].hits
+
+        usuario = get_usuario_by_telefono(db_session, "5491100000001")
+        assert stats['usuario_telefono'].hits == hits + 1
+        assert usuario.id == creado.id
+
+    def test_usuario_telefono_cache_warmed_without_reload(self, db_session):
+        """Verifica que cachear el usuario recién creado no recargue la fila."""
+        from sqlalchemy import event
+        from tests.conftest import engine
+
+        clear_all_caches()
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.lstrip().split(None, 1)[0].upper())
+
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            get_or_create_usuario(db_session, UsuarioCreate(telefono="+5491100000002", nombre="Nuevo"))
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+
+        assert "INSERT" in statements
+        assert "SELECT" not in statements[statements.index("INSERT") + 1:]
+    
     def test_usuario_cache_invalidation(self, db_session, test_usuario):
         """Verifica que la invalidación funcione."""
         clear_all_caches()
@@ -194,6 +259,49 @@ class TestTrustLevelCache:
         assert stats['trust_level'].misses == 2
         assert trust2['total_interacciones'] == trust1['total_interacciones'] + 1
 
+    def test_trust_level_without_commit_leaves_invalidation_to_caller(self, db_session, test_usuario):
+        """Verifica que con commit=False el cache no se invalide antes del commit."""
+        clear_all_caches()
+        trust_service.get_user_trust_info(test_usuario.id, db=db_session)
+        
+        trust_service.update_trust_level(db_session, test_usuario.id, commit=False)
+        assert test_usuario.id in trust_level_cache
+        assert stats['trust_level'].invalidations == 0
+        
+        db_session.commit()
+        invalidate_trust_level_cache(test_usuario.id)
+        assert trust_service.get_user_trust_info(test_usuario.id, db=db_session)['total_interacciones'] == 1
+
+
+class TestSingleFlight:
+    """Tests para la carga de a un thread por clave en los misses."""
+    
+    def test_concurrent_misses_load_once(self):
+        """Verifica que misses concurrentes de la misma clave consulten una sola vez."""
+        clear_all_caches()
+        calls = []
+        
+        @cached_trust_level_func
+        def slow_trust_info(usuario_id):
+            calls.append(usuario_id)
+            time.sleep(0.05)
+            return {'nivel_confianza': 1}
+        
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(slow_trust_info(42)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert calls == [42]
+        assert results == [{'nivel_confianza': 1}] * 8
+        # Los locks se liberan al terminar
+        assert _inflight_locks == {}
+
 
 class TestCacheInvalidation:
     """Tests para invalidación de caches."""
@@ -219,6 +327,29 @@ class TestCacheInvalidation:
         assert stats['usuario'].invalidations >= 1
         assert stats['habitos_activos'].invalidations >= 1
         assert stats['trust_level'].invalidations >= 1
+
+    def test_invalidate_all_user_caches_drops_telefono_entry(self, db_session, test_usuario):
+        """Verifica que la entrada por teléfono se invalide por usuario_id."""
+        clear_all_caches()
+        get_usuario_by_telefono(db_session, test_usuario.telefono)
+        get_usuario_by_telefono(db_session, test_usuario.telefono)
+        assert stats['usuario_telefono'].hits == 1
+
+        invalidate_all_user_caches(test_usuario.id)
+
+        assert stats['usuario_telefono'].invalidations == 1
+        get_usuario_by_telefono(db_session, test_usuario.telefono)
+        assert stats['usuario_telefono'].misses == 2
+
+    def test_invalidate_respuestas_exitosas_cache(self):
+        """Verifica la invalidación del cache de respuestas exitosas."""
+        clear_all_caches()
+        
+        respuestas_exitosas_cache[1] = {'total': 0}
+        invalidate_respuestas_exitosas_cache(1)
+        
+        assert 1 not in respuestas_exitosas_cache
+        assert stats['respuestas_exitosas'].invalidations == 1
     
     def test_clear_all_caches(self, db_session, test_usuario):
         """Verifica que clear_all_caches limpie todo."""
@@ -280,6 +411,9 @@ class TestCacheStats:
         assert cache_stats['usuario']['maxsize'] == 1000
         assert cache_stats['usuario']['ttl'] == 300
         assert cache_stats['usuario']['size'] >= 0
+        assert cache_stats['usuario']['misses'] == 1
+        assert cache_stats['usuario']['total'] == stats['usuario'].total == 1
+        assert cache_stats['usuario']['hit_rate'] == 0.0
 
 
 class TestCacheTTL:
@@ -318,6 +452,244 @@ class TestCacheTTL:
         assert stats['usuario'].misses == 2
 
 
+class TestFastTTLCache:
+    """Tests para el TTLCache con lookup de una sola búsqueda."""
+    
+    def test_expiry_and_lru_order(self):
+        """Verifica expiración por TTL y que el acceso renueve el orden LRU."""
+        now = [0]
+        cache = FastTTLCache(maxsize=2, ttl=10, timer=lambda: now[0])
+        cache['a'] = 1
+        cache['b'] = 2
+        
+        assert cache['a'] == 1
+        cache['c'] = 3  # 'b' es el menos usado recientemente
+        assert 'b' not in cache
+        assert cache['a'] == 1
+        
+        now[0] = 10
+        with pytest.raises(KeyError):
+            cache['a']
+        with pytest.raises(KeyError):
+            cache['inexistente']
+
+
+class TestPressureAwareTTLCache:
+    """Tests para el TTL que se acorta con la ocupación del cache."""
+    
+    def test_ttl_shrinks_with_pressure(self):
+        """Verifica TTL completo hasta 70% de ocupación y más corto después."""
+        now = [0]
+        cache = PressureAwareTTLCache(maxsize=10, ttl=100, timer=lambda: now[0])
+        for key in range(9):
+            cache[key] = key
+        
+        # 7/10 -> TTL completo, 8/10 -> mitad, 9/10 -> mínimo (10%)
+        now[0] = 11
+        assert 8 not in cache
+        assert cache[7] == 7
+        
+        now[0] = 51
+        assert 7 not in cache
+        assert cache[6] == 6
+        
+        now[0] = 100
+        assert 0 not in cache
+        assert len(cache) == 0
+
+    def test_expire_removes_shortened_entries(self):
+        """Verifica que expire() saque las entradas acortadas aunque haya más viejas vigentes."""
+        now = [0]
+        cache = PressureAwareTTLCache(maxsize=10, ttl=100, timer=lambda: now[0])
+        for key in range(9):
+            cache[key] = key
+
+        now[0] = 11
+        cache.expire()
+        assert len(cache) == 8
+        assert sorted(cache) == list(range(8))
+
+        now[0] = 51
+        cache.expire()
+        assert len(cache) == 7
+
+        # Con la ocupación ya baja, una entrada nueva vuelve al TTL completo
+        cache['nuevo'] = 'valor'
+        now[0] = 99
+        assert len(cache) == 8
+        assert cache['nuevo'] == 'valor'
+
+
+class TestAccessCountTTLCache:
+    """Tests para el cache que expira por cantidad de lecturas."""
+    
+    def test_expires_after_max_reads(self):
+        """Verifica que la entrada se invalide después de max_reads lecturas."""
+        cache = AccessCountTTLCache(maxsize=10, ttl=100, max_reads=3)
+        cache['correlacion'] = {'impacto': 0.5}
+        
+        for _ in range(3):
+            assert cache['correlacion'] == {'impacto': 0.5}
+        
+        with pytest.raises(KeyError):
+            cache['correlacion']
+        
+        # Guardar de nuevo reinicia el contador
+        cache['correlacion'] = {'impacto': 0.7}
+        assert cache['correlacion'] == {'impacto': 0.7}
+    
+    def test_pop_does_not_count_as_read(self):
+        """Verifica que invalidar una entrada en su última lectura no falle."""
+        cache = AccessCountTTLCache(maxsize=10, ttl=100, max_reads=1)
+        cache['correlacion'] = {'impacto': 0.5}
+        
+        assert cache.pop('correlacion') == {'impacto': 0.5}
+        assert cache.pop('correlacion') is None
+
+
+class TestResumenesCache:
+    """Tests para el cache del contexto histórico de largo plazo."""
+    
+    def test_long_term_context_cached_until_new_summary(self, db_session, test_usuario):
+        """Verifica que el contexto se cachee y se invalide al generar un resumen."""
+        import datetime
+        from app.models.mood import ConversacionContexto, ResumenConversacion
+        from app.services.memory_service import memory_service
+        
+        clear_all_caches()
+        ahora = datetime.datetime.utcnow()
+        db_session.add(ResumenConversacion(
+            usuario_id=test_usuario.id, resumen_texto="Primer resumen",
+            periodo_inicio=ahora, periodo_fin=ahora
+        ))
+        db_session.commit()
+        
+        contexto = memory_service.get_long_term_context(db_session, test_usuario.id)
+        assert "Primer resumen" in contexto
+        
+        # Una fila nueva sin pasar por el servicio no se ve: sale del cache
+        db_session.add(ResumenConversacion(
+            usuario_id=test_usuario.id, resumen_texto="Segundo resumen",
+            fecha_resumen=ahora + datetime.timedelta(minutes=1),
+            periodo_inicio=ahora, periodo_fin=ahora
+        ))
+        db_session.commit()
+        assert memory_service.get_long_term_context(db_session, test_usuario.id) == contexto
+        assert stats['resumenes'].hits == 1
+        
+        # Generar un resumen invalida el cache
+        db_session.add_all([
+            ConversacionContexto(
+                usuario_id=test_usuario.id, mensaje_usuario=f"hola {i}", respuesta_loki="hola"
+            )
+            for i in range(3)
+        ])
+        db_session.commit()
+        memory_service.generate_conversation_summary(db_session, test_usuario.id)
+        
+        assert "Segundo resumen" in memory_service.get_long_term_context(db_session, test_usuario.id)
+
+
+class TestCorrelacionesCache:
+    """Tests para el cache de correlaciones guardadas."""
+    
+    def test_correlaciones_cache_invalidated_on_write(self, db_session, test_usuario):
+        """Verifica que crear o borrar una correlación invalide el cache del usuario."""
+        from app.core.caching import correlaciones_cache
+        from app.crud.mood import create_correlacion, delete_correlacion
+        from app.schemas.mood import CorrelacionCreate
+        
+        clear_all_caches()
+        correlaciones_cache[test_usuario.id] = []
+        correlacion = create_correlacion(
+            db_session,
+            CorrelacionCreate(factor="Ejercicio", impacto_animo=1.5, confianza_estadistica=0.8, num_datos=10),
+            usuario_id=test_usuario.id
+        )
+        assert test_usuario.id not in correlaciones_cache
+        
+        correlaciones_cache[test_usuario.id] = []
+        delete_correlacion(db_session, correlacion.id)
+        assert test_usuario.id not in correlaciones_cache
+
+
+class FakeRedis:
+    """Cliente mínimo con la interfaz get/set/delete que usa TieredCache."""
+    
+    def __init__(self):
+        self.data = {}
+    
+    def get(self, key):
+        return self.data.get(key)
+    
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+    
+    def delete(self, key):
+        return 1 if self.data.pop(key, None) is not None else 0
+
+
+class TestTieredCache:
+    """Tests para el cache de dos niveles (memoria + Redis)."""
+    
+    def test_l2_shared_between_workers(self):
+        """Verifica que un worker lea de Redis lo que guardó otro."""
+        shared = FakeRedis()
+        worker_a = TieredCache('trust_level', FastTTLCache(maxsize=10, ttl=60), shared)
+        worker_b = TieredCache('trust_level', FastTTLCache(maxsize=10, ttl=60), shared)
+        
+        worker_a[1] = {'nivel_confianza': 2}
+        assert 1 not in worker_b.local
+        assert worker_b[1] == {'nivel_confianza': 2}
+        assert 1 in worker_b.local  # copiado a L1
+        
+        worker_a.pop(1, None)
+        worker_b.local.clear()
+        with pytest.raises(KeyError):
+            worker_b[1]
+    
+    def test_redis_errors_fall_back_to_local(self):
+        """Verifica que un Redis caído se comporte como un miss."""
+        class BrokenRedis:
+            def get(self, *args, **kwargs):
+                raise ConnectionError("down")
+            set = delete = get
+        
+        cache = TieredCache('trust_level', FastTTLCache(maxsize=10, ttl=60), BrokenRedis())
+        cache[1] = 'valor'
+        assert cache[1] == 'valor'
+        assert cache.pop(1, None) == 'valor'
+        with pytest.raises(KeyError):
+            cache[1]
+
+
+class TestPatronesCache:
+    """Tests para el cache del análisis de patrones."""
+
+    def test_analysis_cached_by_usuario_and_lookback(self, monkeypatch):
+        """Verifica que el análisis se calcule una vez por (usuario_id, días)."""
+        from app.core.caching import patrones_cache
+        from app.services.pattern_analysis import pattern_service
+
+        clear_all_caches()
+        calls = []
+
+        def fake_analyze(db, usuario_id, days_lookback=30):
+            calls.append((usuario_id, days_lookback))
+            return {'has_enough_data': False}
+
+        monkeypatch.setattr(pattern_service, 'analyze_user_patterns', fake_analyze)
+
+        pattern_service.analyze_with_conversation_insight(None, 1)
+        pattern_service.analyze_with_conversation_insight(None, 1)
+        pattern_service.analyze_with_conversation_insight(None, 1, days_lookback=7)
+
+        assert calls == [(1, 30), (1, 7)]
+        assert (1, 30) in patrones_cache
+        assert stats['patrones'].hits == 1
+        assert stats['patrones'].misses == 2
+
+
 class TestCacheMaxSize:
     """Tests para verificar límites de tamaño de cache."""
     
@@ -0,0 +1,88 @@
+"""
+Tests para el middleware CORS en ASGI puro.
+
+Compara sus respuestas con las del CORSMiddleware de Starlette para las
+mismas configuraciones y requests.
+"""
+import itertools
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+from starlette.middleware.cors import CORSMiddleware as StarletteCORSMiddleware
+
+from app.core.cors_middleware import CORSMiddleware
+
+
+CONFIGS = [
+    # Configuración de la app
+    dict(
+        allow_origins=["http://localhost:3000"],
+        allow_credentials=True,
+        allow_methods=["GET", "POST", "PUT", "DELETE"],
+        allow_headers=["Authorization", "Content-Type"],
+    ),
+    dict(allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"]),
+    dict(allow_origins=["*"], allow_methods=["GET"]),
+]
+
+REQUESTS = [
+    ("GET", {}),
+    ("GET", {"Origin": "http://localhost:3000"}),
+    ("GET", {"Origin": "http://evil.example"}),
+    ("GET", {"Origin": "http://localhost:3000", "Cookie": "a=1"}),
+    ("OPTIONS", {"Origin": "http://localhost:3000"}),
+    ("OPTIONS", {"Origin": "http://localhost:3000", "Access-Control-Request-Method": "POST"}),
+    ("OPTIONS", {"Origin": "http://localhost:3000", "Access-Control-Request-Method": "PATCH"}),
+    ("OPTIONS", {"Origin": "http://evil.example", "Access-Control-Request-Method": "GET"}),
+    (
+        "OPTIONS",
+        {
+            "Origin": "http://localhost:3000",
+            "Access-Control-Request-Method": "GET",
+            "Access-Control-Request-Headers": "authorization, Content-Type",
+        },
+    ),
+    (
+        "OPTIONS",
+        {
+            "Origin": "http://localhost:3000",
+            "Access-Control-Request-Method": "GET",
+            "Access-Control-Request-Headers": "X-Custom",
+        },
+    ),
+]
+
+
+def _client(middleware, config) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/")
+    def index():
+        return PlainTextResponse("hola", headers={"Vary": "Accept-Encoding"})
+
+    @app.options("/")
+    def options():
+        return PlainTextResponse("options")
+
+    app.add_middleware(middleware, **config)
+    return TestClient(app)
+
+
+def _summary(response):
+    headers = {
+        name: value
+        for name, value in response.headers.items()
+        if name.startswith("access-control-") or name == "vary"
+    }
+    return response.status_code, response.text, headers
+
+
+@pytest.mark.parametrize("config,request_data", itertools.product(CONFIGS, REQUESTS))
+def test_matches_starlette(config, request_data):
+    """Debe responder igual que el CORSMiddleware de Starlette"""
+    method, headers = request_data
+    esperado = _client(StarletteCORSMiddleware, config).request(method, "/", headers=headers)
+    obtenido = _client(CORSMiddleware, config).request(method, "/", headers=headers)
+    assert _summary(obtenido) == _summary(esperado)
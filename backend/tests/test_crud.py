@@ -2,9 +2,11 @@
 Tests for CRUD operations
 """
 import pytest
+from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from app import crud, schemas
 from app.models.mood import Usuario
+from app.core.caching import clear_all_caches
 
 
 def test_create_usuario(db_session: Session):
@@ -33,6 +35,19 @@ def test_get_usuario_by_telefono(db_session: Session, test_usuario: Usuario):
     assert usuario.telefono == test_usuario.telefono
 
 
+def test_get_usuario_by_telefono_normalizes_number(db_session: Session, test_usuario: Usuario):
+    """Test that webhook-style numbers (no '+', whatsapp: prefix) find the stored user"""
+    assert crud.get_usuario_by_telefono(db_session, telefono="1234567890").id == test_usuario.id
+    usuario, _ = crud.get_usuario_with_recent_conversaciones(db_session, telefono="whatsapp:+1234567890")
+    assert usuario.id == test_usuario.id
+
+
+def test_usuario_exists(db_session: Session, test_usuario: Usuario):
+    """Test checking user existence without loading the row"""
+    assert crud.usuario_exists(db_session, usuario_id=test_usuario.id) is True
+    assert crud.usuario_exists(db_session, usuario_id=test_usuario.id + 1000) is False
+
+
 def test_get_or_create_usuario_existing(db_session: Session, test_usuario: Usuario):
     """Test get_or_create with existing user"""
     usuario_data = schemas.UsuarioCreate(
@@ -60,6 +75,28 @@ def test_get_or_create_usuario_new(db_session: Session):
     assert usuario.nombre == "New User"
 
 
+
+def test_get_or_create_usuario_race(db_session: Session, test_usuario: Usuario, monkeypatch):
+    """Test get_or_create when another request creates the user between lookup and insert"""
+    from app.crud import mood as crud_mood
+
+    lookup = crud_mood.get_usuario_by_telefono
+    calls = []
+
+    def stale_first_lookup(db, telefono):
+        calls.append(telefono)
+        return None if len(calls) == 1 else lookup(db, telefono=telefono)
+
+    monkeypatch.setattr(crud_mood, "get_usuario_by_telefono", stale_first_lookup)
+    usuario = crud.get_or_create_usuario(
+        db_session,
+        usuario=schemas.UsuarioCreate(telefono=test_usuario.telefono, nombre="Duplicado"),
+    )
+
+    assert usuario.id == test_usuario.id
+    assert usuario.nombre == test_usuario.nombre
+    assert len(calls) == 2
+
 def test_create_habito(db_session: Session, test_usuario: Usuario):
     """Test creating a new habit"""
     habito_data = schemas.HabitoCreate(
@@ -103,6 +140,127 @@ def test_create_estado_animo(db_session: Session, test_usuario: Usuario):
     assert estado.usuario_id == test_usuario.id
 
 
+def test_get_latest_estados_animo(db_session: Session, test_usuario: Usuario):
+    """Test getting the latest mood of several users in one query"""
+    from datetime import datetime, timedelta
+    from app.models.mood import EstadoAnimo
+
+    otro = crud.create_usuario(
+        db_session, usuario=schemas.UsuarioCreate(nombre="Otro", telefono="+1987654321")
+    )
+    now = datetime.utcnow()
+    db_session.add_all([
+        EstadoAnimo(usuario_id=test_usuario.id, nivel=3, timestamp=now - timedelta(days=1)),
+        EstadoAnimo(usuario_id=test_usuario.id, nivel=8, timestamp=now),
+        EstadoAnimo(usuario_id=otro.id, nivel=5, timestamp=now - timedelta(hours=2)),
+    ])
+    db_session.commit()
+
+    latest = crud.get_latest_estados_animo(db_session, [test_usuario.id, otro.id, 9999])
+
+    assert latest[test_usuario.id].nivel == 8
+    assert latest[otro.id].nivel == 5
+    assert 9999 not in latest
+    assert crud.get_latest_estado_animo(db_session, usuario_id=test_usuario.id).nivel == 8
+
+
+
+def test_get_estados_animo_by_usuario_ordered_and_partial(db_session: Session, test_usuario: Usuario):
+    """Test paging moods newest first and loading only the requested columns"""
+    from sqlalchemy import inspect
+    from app.models.mood import EstadoAnimo
+
+    usuario_id = test_usuario.id
+    now = datetime.utcnow()
+    db_session.add_all([
+        EstadoAnimo(usuario_id=usuario_id, nivel=nivel, timestamp=now - timedelta(hours=nivel))
+        for nivel in (1, 2, 3)
+    ])
+    db_session.commit()
+    db_session.expunge_all()
+
+    estados = crud.get_estados_animo_by_usuario(db_session, usuario_id=usuario_id, skip=1, limit=1)
+    assert [e.nivel for e in estados] == [2]
+
+    parciales = crud.get_estados_animo_by_usuario(
+        db_session, usuario_id=usuario_id, fields=[EstadoAnimo.nivel]
+    )
+    assert [e.nivel for e in parciales] == [1, 2, 3]
+    assert "notas_texto" in inspect(parciales[0]).unloaded
+
+
+def test_get_estados_animo_by_usuario_keyset(db_session: Session, test_usuario: Usuario):
+    """Test paging moods with the (timestamp, id) of the previous page's last row as cursor"""
+    from app.models.mood import EstadoAnimo
+
+    usuario_id = test_usuario.id
+    now = datetime.utcnow()
+    db_session.add_all([
+        EstadoAnimo(usuario_id=usuario_id, nivel=nivel, timestamp=now - timedelta(hours=nivel))
+        for nivel in (1, 2, 3, 4, 5)
+    ])
+    db_session.commit()
+
+    paginas = []
+    before = None
+    while True:
+        pagina = crud.get_estados_animo_by_usuario(
+            db_session, usuario_id=usuario_id, limit=2, before=before
+        )
+        if not pagina:
+            break
+        paginas.append([e.nivel for e in pagina])
+        before = (pagina[-1].timestamp, pagina[-1].id)
+
+    assert paginas == [[1, 2], [3, 4], [5]]
+
+
+def test_keyset_pages_keep_rows_with_equal_timestamps(db_session: Session, test_usuario: Usuario):
+    """Test that rows sharing a timestamp at a page boundary are not skipped"""
+    from app.models.mood import EstadoAnimo
+
+    usuario_id = test_usuario.id
+    now = datetime.utcnow()
+    db_session.add_all([
+        EstadoAnimo(usuario_id=usuario_id, nivel=nivel, timestamp=now) for nivel in (1, 2, 3, 4, 5)
+    ])
+    db_session.commit()
+
+    pagina = crud.get_estados_animo_by_usuario(db_session, usuario_id=usuario_id, limit=2)
+    vistos = [e.id for e in pagina]
+    while pagina:
+        # Con cursor, skip no se aplica
+        pagina = crud.get_estados_animo_by_usuario(
+            db_session, usuario_id=usuario_id, skip=10, limit=2,
+            before=(pagina[-1].timestamp, pagina[-1].id)
+        )
+        vistos.extend(e.id for e in pagina)
+
+    assert len(vistos) == 5
+    assert vistos == sorted(vistos, reverse=True)
+
+
+def test_get_registros_by_usuario_loads_habito(db_session: Session, test_usuario: Usuario):
+    """Test that the habit of each record is eager-loaded with the records"""
+    from sqlalchemy import inspect
+
+    usuario_id = test_usuario.id
+    habito = crud.create_habito(
+        db_session, habito=schemas.HabitoCreate(nombre_habito="Correr"), usuario_id=usuario_id
+    )
+    crud.create_registro_habito(
+        db_session,
+        registro=schemas.RegistroHabitoCreate(habito_id=habito.id, completado=True),
+        usuario_id=usuario_id,
+    )
+    db_session.expunge_all()
+
+    registros = crud.get_registros_by_usuario(db_session, usuario_id=usuario_id)
+    assert len(registros) == 1
+    assert "habito" not in inspect(registros[0]).unloaded
+    assert registros[0].habito.nombre_habito == "Correr"
+
+
 def test_create_conversacion(db_session: Session, test_usuario: Usuario):
     """Test creating a conversation entry"""
     conversacion_data = schemas.ConversacionContextoCreate(
@@ -124,6 +282,84 @@ def test_create_conversacion(db_session: Session, test_usuario: Usuario):
     assert conversacion.usuario_id == test_usuario.id
 
 
+def test_create_conversacion_without_commit(db_session: Session, test_usuario: Usuario):
+    """Test that commit=False only flushes and leaves the commit to the caller"""
+    conversacion_data = schemas.ConversacionContextoCreate(
+        mensaje_usuario="Hola Loki",
+        respuesta_loki="Hola!"
+    )
+    
+    conversacion = crud.create_conversacion(
+        db_session,
+        conversacion=conversacion_data,
+        usuario_id=test_usuario.id,
+        commit=False
+    )
+    assert conversacion.id is not None
+    
+    db_session.rollback()
+    assert crud.get_conversaciones_by_usuario(db_session, usuario_id=test_usuario.id) == []
+
+
+def test_insert_conversacion_and_estado_animo(db_session: Session, test_usuario: Usuario):
+    """Test write-only inserts that return just the new ids"""
+    conversacion_id = crud.insert_conversacion(
+        db_session,
+        conversacion=schemas.ConversacionContextoCreate(mensaje_usuario="Hola Loki"),
+        usuario_id=test_usuario.id
+    )
+    estado_id = crud.insert_estado_animo(
+        db_session,
+        estado_animo=schemas.EstadoAnimoCreate(nivel=6),
+        usuario_id=test_usuario.id
+    )
+    
+    conversacion = crud.get_conversacion(db_session, conversacion_id)
+    assert conversacion.mensaje_usuario == "Hola Loki"
+    assert conversacion.timestamp is not None
+    assert crud.get_estado_animo(db_session, estado_id).nivel == 6
+
+
+def test_get_usuario_with_recent_conversaciones(db_session: Session, test_usuario: Usuario):
+    """Test fetching a user and their latest conversations in one call"""
+    usuario, conversaciones = crud.get_usuario_with_recent_conversaciones(
+        db_session, telefono=test_usuario.telefono
+    )
+    assert usuario.id == test_usuario.id
+    assert conversaciones == []
+    
+    base = datetime(2024, 1, 1)
+    for i in range(7):
+        conversacion = crud.create_conversacion(
+            db_session,
+            conversacion=schemas.ConversacionContextoCreate(
+                mensaje_usuario=f"mensaje {i}",
+                respuesta_loki="ok"
+            ),
+            usuario_id=test_usuario.id
+        )
+        conversacion.timestamp = base + timedelta(minutes=i)
+    db_session.commit()
+    esperados = [f"mensaje {i}" for i in range(6, 1, -1)]
+    
+    # Sin cache: una sola query con el usuario y sus conversaciones
+    clear_all_caches()
+    usuario, conversaciones = crud.get_usuario_with_recent_conversaciones(
+        db_session, telefono=test_usuario.telefono, limit=5
+    )
+    assert usuario.id == test_usuario.id
+    assert [c.mensaje_usuario for c in conversaciones] == esperados
+    
+    # Con el usuario en cache: solo las conversaciones
+    usuario, conversaciones = crud.get_usuario_with_recent_conversaciones(
+        db_session, telefono=test_usuario.telefono, limit=5
+    )
+    assert usuario.id == test_usuario.id
+    assert [c.mensaje_usuario for c in conversaciones] == esperados
+    
+    assert crud.get_usuario_with_recent_conversaciones(db_session, telefono="+0000000000") == (None, [])
+
+
 def test_create_registro_habito(db_session: Session, test_usuario_with_habits: Usuario):
     """Test creating a habit tracking entry"""
     # Get one of the user's habits
@@ -146,3 +382,32 @@ def test_create_registro_habito(db_session: Session, test_usuario_with_habits: U
     assert registro.habito_id == habito.id
     assert registro.completado is True
     assert registro.usuario_id == test_usuario_with_habits.id
+
+
+def test_bulk_create_registros_habito_and_correlaciones(
+    db_session: Session, test_usuario_with_habits: Usuario
+):
+    """Test creating several rows in a single insert keeps input order and ids"""
+    usuario_id = test_usuario_with_habits.id
+    habitos = crud.get_habitos_by_usuario(db_session, usuario_id=usuario_id)
+    
+    registros = crud.bulk_create_registros_habito(
+        db_session,
+        [schemas.RegistroHabitoCreate(habito_id=h.id, notas=f"n{i}") for i, h in enumerate(habitos)],
+        usuario_id=usuario_id,
+    )
+    assert [r.habito_id for r in registros] == [h.id for h in habitos]
+    assert all(r.id is not None and r.timestamp is not None for r in registros)
+    
+    correlaciones = crud.bulk_create_correlaciones(
+        db_session,
+        [
+            schemas.CorrelacionCreate(factor=f"factor {i}", impacto_animo=i, confianza_estadistica=0.5, num_datos=3)
+            for i in range(3)
+        ],
+        usuario_id=usuario_id,
+    )
+    assert [c.factor for c in correlaciones] == ["factor 0", "factor 1", "factor 2"]
+    assert len(crud.get_correlaciones_by_usuario(db_session, usuario_id)) == 3
+    
+    assert crud.bulk_create_correlaciones(db_session, [], usuario_id=usuario_id) == []
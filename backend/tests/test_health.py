@@ -10,3 +10,18 @@ def test_health_endpoint_returns_ok() -> None:
     response = client.get("/health/")
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
+
+
+def test_responses_carry_request_id_header() -> None:
+    response = client.get("/health/")
+    assert response.headers.get("X-Request-ID")
+
+
+def test_large_responses_are_gzipped() -> None:
+    response = client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+    assert response.headers.get("Content-Encoding") == "gzip"
+
+
+def test_small_responses_are_not_compressed() -> None:
+    response = client.get("/health/", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
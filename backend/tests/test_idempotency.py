@@ -0,0 +1,29 @@
+"""
+Tests para la idempotencia de webhooks
+"""
+from app.core.idempotency import mark_message, unmark_message, clear_processed_messages
+
+
+def test_mark_message_detects_duplicates():
+    """El primer mensaje se procesa y sus reintentos se descartan"""
+    clear_processed_messages()
+    assert mark_message("wamid.1") is True
+    assert mark_message("wamid.1") is False
+    assert mark_message("wamid.2") is True
+
+
+def test_mark_message_without_id():
+    """Sin ID no se puede deduplicar: siempre se procesa"""
+    clear_processed_messages()
+    assert mark_message(None) is True
+    assert mark_message("") is True
+    assert mark_message(None) is True
+
+
+def test_unmark_message_allows_retry():
+    """Un mensaje cuyo procesamiento falló se vuelve a procesar"""
+    clear_processed_messages()
+    assert mark_message("SM123") is True
+    unmark_message("SM123")
+    assert mark_message("SM123") is True
+    unmark_message(None)
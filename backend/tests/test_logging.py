@@ -3,7 +3,9 @@ Tests para el sistema de logging estructurado.
 """
 import pytest
 import logging
+import logging.handlers
 import json
+import time
 from pathlib import Path
 from app.core.logging_config import (
     setup_logging,
@@ -13,6 +15,8 @@ from app.core.logging_config import (
     StructuredFormatter,
     SimpleFormatter,
     AuditLogger,
+    BatchingFileHandler,
+    BinaryRotatingFileHandler,
 )
 
 
@@ -92,6 +96,28 @@ class TestStructuredFormatter:
             assert 'exception' in data
             assert 'ZeroDivisionError' in data['exception']
 
+    def test_reuses_cached_exception_text(self):
+        """Verifica que el traceback se formatea una vez y se reutiliza entre handlers."""
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            import sys
+            record = logging.LogRecord(
+                name='test',
+                level=logging.ERROR,
+                pathname='test.py',
+                lineno=10,
+                msg='Error occurred',
+                args=(),
+                exc_info=sys.exc_info(),
+            )
+
+        data = json.loads(StructuredFormatter().format(record))
+        assert record.exc_text == data['exception']
+
+        record.exc_text = 'cached traceback'
+        assert SimpleFormatter().format(record).endswith('\ncached traceback')
+
 
 class TestSimpleFormatter:
     """Tests para el formatter simple."""
@@ -214,6 +240,31 @@ class TestSetupLogging:
         )
         assert has_simple_formatter
 
+    def test_file_handlers_write_through_queue(self, tmp_path):
+        """Verifica que los archivos se escriben vía QueueListener con el contexto del emisor."""
+        from logging.handlers import QueueHandler
+        from app.core.logging_config import _stop_queue_listeners
+
+        log_dir = tmp_path / 'test_logs'
+        logger, _ = setup_logging(
+            environment='production',
+            log_dir=log_dir,
+            enable_console=False,
+            enable_audit=False,
+        )
+        assert any(isinstance(h, QueueHandler) for h in logger.handlers)
+
+        set_request_context(request_id='req-queue', user_id=7)
+        logging.getLogger('test.queue').error('queued error')
+        clear_request_context()
+        _stop_queue_listeners()  # vacía la cola a disco
+
+        lines = (log_dir / 'errors.log').read_text(encoding='utf-8').splitlines()
+        data = json.loads(lines[-1])
+        assert data['message'] == 'queued error'
+        assert data['request_id'] == 'req-queue'
+        assert data['user_id'] == 7
+
 
 class TestAuditLogger:
     """Tests para AuditLogger."""
@@ -275,6 +326,108 @@ class TestAuditLogger:
             identifier='127.0.0.1'
         )
 
+    def test_audit_event_serialized_to_file(self, tmp_path):
+        """Verifica que el evento de auditoría se escribe como JSON en audit.log."""
+        from app.core.logging_config import _stop_queue_listeners
+
+        log_dir = tmp_path / 'audit_logs'
+        _, audit = setup_logging(
+            environment='production',
+            log_dir=log_dir,
+            enable_console=False,
+            enable_audit=True,
+        )
+        audit.log_habito_created(user_id=1, habito_id=10, nombre='Meditar', ip='127.0.0.1')
+        _stop_queue_listeners()  # vacía cola y lote a disco
+
+        data = json.loads((log_dir / 'audit.log').read_text(encoding='utf-8').splitlines()[-1])
+        assert data['extra'] == {
+            'action': 'habito_created',
+            'user_id': 1,
+            'habito_id': 10,
+            'nombre': 'Meditar',
+            'details': {'ip': '127.0.0.1'},
+        }
+
+
+class TestBatchingFileHandler:
+    """Tests para el buffer de escritura de auditoría."""
+
+    @staticmethod
+    def _record(level, msg, created=None):
+        record = logging.LogRecord('audit', level, 'test.py', 1, msg, (), None)
+        if created is not None:
+            record.created = created
+        return record
+
+    def test_batches_until_warning(self, tmp_path):
+        """Verifica que INFO se acumula y WARNING vacía el lote completo."""
+        path = tmp_path / 'audit.log'
+        target = logging.handlers.RotatingFileHandler(path, encoding='utf-8')
+        handler = BatchingFileHandler(target, capacity=10)
+
+        for i in range(3):
+            handler.handle(self._record(logging.INFO, f'info {i}'))
+        assert path.read_text(encoding='utf-8') == ''
+
+        handler.handle(self._record(logging.WARNING, 'warn'))
+        assert path.read_text(encoding='utf-8').splitlines() == [
+            'info 0', 'info 1', 'info 2', 'warn'
+        ]
+        handler.close()
+        target.close()
+
+    def test_flushes_on_capacity_and_age(self, tmp_path):
+        """Verifica el vaciado por capacidad y por antigüedad del lote."""
+        path = tmp_path / 'audit.log'
+        target = logging.handlers.RotatingFileHandler(path, encoding='utf-8')
+        handler = BatchingFileHandler(target, capacity=3, flush_interval=5.0)
+
+        handler.handle(self._record(logging.INFO, 'a', created=100.0))
+        handler.handle(self._record(logging.INFO, 'b', created=101.0))
+        handler.handle(self._record(logging.INFO, 'c', created=102.0))
+        assert path.read_text(encoding='utf-8').splitlines() == ['a', 'b', 'c']
+
+        handler.handle(self._record(logging.INFO, 'd', created=200.0))
+        assert path.read_text(encoding='utf-8').splitlines() == ['a', 'b', 'c']
+        handler.handle(self._record(logging.INFO, 'e', created=205.0))
+        assert path.read_text(encoding='utf-8').splitlines() == ['a', 'b', 'c', 'd', 'e']
+
+        handler.handle(self._record(logging.INFO, 'f', created=206.0))
+        handler.close()  # flushOnClose
+        target.close()
+        assert path.read_text(encoding='utf-8').splitlines()[-1] == 'f'
+
+    def test_flushes_periodically_without_new_records(self, tmp_path):
+        """Verifica que el lote se vacía por tiempo aunque no lleguen records."""
+        path = tmp_path / 'audit.log'
+        target = logging.handlers.RotatingFileHandler(path, encoding='utf-8')
+        handler = BatchingFileHandler(target, capacity=10, flush_interval=0.05)
+
+        handler.handle(self._record(logging.INFO, 'solo'))
+        deadline = time.monotonic() + 2.0
+        while path.read_text(encoding='utf-8') == '' and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert path.read_text(encoding='utf-8').splitlines() == ['solo']
+
+        handler.close()
+        target.close()
+
+    def test_batches_into_binary_handler(self, tmp_path):
+        """Verifica el lote sobre un handler binario con JSON de orjson."""
+        path = tmp_path / 'audit.log'
+        target = BinaryRotatingFileHandler(path)
+        target.setFormatter(StructuredFormatter())
+        handler = BatchingFileHandler(target, capacity=2)
+
+        handler.handle(self._record(logging.INFO, 'año'))
+        handler.handle(self._record(logging.INFO, 'niño'))
+        handler.close()
+        target.close()
+
+        lines = path.read_bytes().decode('utf-8').splitlines()
+        assert [json.loads(line)['message'] for line in lines] == ['año', 'niño']
+
 
 class TestRequestContext:
     """Tests para contexto de request."""
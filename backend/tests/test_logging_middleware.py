@@ -0,0 +1,54 @@
+"""
+Tests para el middleware de logging de requests.
+"""
+import asyncio
+import logging
+
+from fastapi import BackgroundTasks, FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.logging_middleware import RequestLoggingMiddleware
+
+
+def _client() -> TestClient:
+    app = FastAPI()
+
+    async def slow_task():
+        await asyncio.sleep(0.3)
+
+    @app.get("/background")
+    async def background(background_tasks: BackgroundTasks):
+        background_tasks.add_task(slow_task)
+        return {"ok": True}
+
+    @app.get("/slow")
+    async def slow():
+        await asyncio.sleep(0.3)
+        return {"ok": True}
+
+    app.add_middleware(RequestLoggingMiddleware, threshold_ms=200)
+    return TestClient(app)
+
+
+def _slow_warnings(caplog):
+    return [r for r in caplog.records if r.getMessage().startswith("Slow request detected")]
+
+
+def test_background_tasks_do_not_count_as_slow(caplog):
+    """La duración termina con el body: las background tasks no la inflan"""
+    with caplog.at_level(logging.INFO, logger="app.core.logging_middleware"):
+        response = _client().get("/background")
+
+    assert response.status_code == 200
+    assert "x-request-id" in response.headers
+    assert _slow_warnings(caplog) == []
+    completed = [r for r in caplog.records if r.getMessage().startswith("Request completed")]
+    assert completed[0].extra_data["duration_ms"] < 200
+
+
+def test_slow_response_is_reported(caplog):
+    """Una respuesta que tarda más que el umbral sí se reporta"""
+    with caplog.at_level(logging.INFO, logger="app.core.logging_middleware"):
+        _client().get("/slow")
+
+    assert len(_slow_warnings(caplog)) == 1
@@ -0,0 +1,55 @@
+"""
+Tests para la configuración de rate limits y el chequeo de IPs por CIDR.
+"""
+from app.core.rate_limits import (
+    RATE_LIMITS,
+    get_rate_limit,
+    get_rate_limit_message,
+    _build_cidr_index,
+    _ip_in_index,
+)
+
+
+class TestGetRateLimit:
+    """Tests para get_rate_limit y get_rate_limit_message"""
+
+    def test_known_category(self):
+        """Debe devolver el límite configurado"""
+        assert get_rate_limit("auth") == RATE_LIMITS["auth"]
+
+    def test_unknown_category_falls_back(self):
+        """Categorías desconocidas usan el límite público y el mensaje default"""
+        assert get_rate_limit("inexistente") == RATE_LIMITS["public"]
+        assert get_rate_limit_message("inexistente") == get_rate_limit_message("default")
+
+
+class TestCidrIndex:
+    """Tests para el índice de CIDRs de whitelist/blacklist"""
+
+    INDEX = _build_cidr_index([
+        "157.240.0.0/16",
+        "54.172.60.0/23",
+        "10.0.0.1",
+        "2001:db8::/32",
+    ])
+
+    def test_ipv4_inside_network(self):
+        """Debe encontrar IPs dentro de cualquier red configurada"""
+        assert _ip_in_index("157.240.3.4", self.INDEX)
+        assert _ip_in_index("54.172.61.9", self.INDEX)
+        assert _ip_in_index("10.0.0.1", self.INDEX)
+
+    def test_ipv4_outside_network(self):
+        """No debe coincidir con IPs fuera de las redes"""
+        assert not _ip_in_index("157.241.0.1", self.INDEX)
+        assert not _ip_in_index("54.172.62.1", self.INDEX)
+        assert not _ip_in_index("10.0.0.2", self.INDEX)
+
+    def test_ipv6(self):
+        """Debe soportar redes IPv6"""
+        assert _ip_in_index("2001:db8::1", self.INDEX)
+        assert not _ip_in_index("2001:db9::1", self.INDEX)
+
+    def test_invalid_ip(self):
+        """IPs inválidas no coinciden"""
+        assert not _ip_in_index("no-es-ip", self.INDEX)
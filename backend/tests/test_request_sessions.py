@@ -0,0 +1,49 @@
+"""
+Tests para las sesiones extra que abren algunos endpoints: deben usar el
+mismo engine que la sesión del request (y así respetar overrides de get_db).
+"""
+import orjson
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes import feedback
+from app.api.routes.recommendations import _call_with_own_session
+from app.db.session import get_db
+from app.models.mood import FeedbackRespuesta
+from tests.conftest import TestingSessionLocal, engine
+
+
+@pytest.fixture
+def client(db_session):
+    def override_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(feedback.router)
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+def test_export_streams_from_request_engine(client, db_session, test_usuario):
+    """El export lee con una sesión propia sobre el engine del request"""
+    db_session.add(FeedbackRespuesta(
+        usuario_id=test_usuario.id, mensaje_usuario="hola", respuesta_loki="¡hola!", ayudo=True
+    ))
+    db_session.commit()
+
+    response = client.get(f"/api/v1/feedback/{test_usuario.id}/export")
+
+    assert response.status_code == 200
+    rows = [orjson.loads(line) for line in response.content.splitlines()]
+    assert [row["mensaje"] for row in rows] == ["hola"]
+
+
+def test_call_with_own_session_uses_given_bind():
+    """Cada llamada abre una sesión nueva sobre el bind recibido"""
+    bind = _call_with_own_session(engine, lambda db: db.get_bind())
+    assert bind is engine
@@ -2,6 +2,7 @@
 Tests para el módulo de validación y sanitización de inputs.
 """
 import pytest
+from app.core import validation
 from app.core.validation import (
     sanitize_html,
     sanitize_phone_number,
@@ -151,6 +152,14 @@ class TestValidateNoXSS:
         assert validate_no_xss("Me siento feliz") is True
         assert validate_no_xss("Hoy es un buen día") is True
         assert validate_no_xss("") is True
+    
+    @pytest.mark.skipif(not validation.REGEX_AVAILABLE, reason="requiere el módulo regex")
+    def test_scan_timeout_counts_as_match(self, monkeypatch):
+        """Un escaneo que excede el timeout se trata como input sospechoso"""
+        monkeypatch.setattr(validation, "PATTERN_SCAN_TIMEOUT", 1e-6)
+        assert validate_no_xss("<script>" * 5000) is False
+        with pytest.raises(ValueError):
+            sanitize_user_input("<script>" * 5000)
 
 
 class TestSanitizeUserInput:
@@ -177,7 +186,12 @@ class TestSanitizeUserInput:
         input_text = "A" * 1000
         result = sanitize_user_input(input_text, max_length=100)
         assert len(result) <= 100
-    
+
+    def test_only_scans_up_to_max_length(self):
+        """Lo que excede max_length se descarta antes de validar"""
+        result = sanitize_user_input("Hola" + " " * 96 + "'; DROP TABLE usuarios; --", max_length=100)
+        assert result == "Hola"
+
     def test_allow_safe_text(self):
         """Debe permitir texto seguro sin modificar"""
         safe_text = "Me siento muy feliz hoy"
@@ -195,6 +209,21 @@ class TestSanitizeUserInput:
             allow_html=True
         )
         assert result is not None
+    
+    @pytest.mark.parametrize("text", [
+        "Me siento feliz",
+        "admin' OR '1'='1",
+        "<SCRIPT>\nalert(1)</script>",
+        "hola -- adiós",
+        "/* multi\nlinea */",
+        "onload = 1",
+        "x; DROP TABLE usuarios",
+    ])
+    def test_combined_scan_matches_individual_checks(self, text):
+        """El escaneo combinado debe coincidir con las validaciones separadas"""
+        from app.core.validation import _COMBINED_DANGEROUS
+        expected = not (validate_no_sql_injection(text) and validate_no_xss(text))
+        assert bool(_COMBINED_DANGEROUS.search(text)) is expected
 
 
 class TestValidateEmail:
@@ -0,0 +1,70 @@
+"""
+Tests para la persistencia de los mensajes de los webhooks.
+"""
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from app import crud, schemas
+from app.models.mood import ConversacionContexto, EstadoAnimo, Habito
+from app.services import webhook_persistence
+from tests.conftest import engine
+
+
+AI_RESPONSE = {
+    "respuesta": "¡Qué bueno que saliste a correr!",
+    "context_extracted": {"mood_level": 8, "habits_mentioned": ["correr"]},
+}
+
+
+def _save(usuario):
+    return webhook_persistence.save_webhook_exchange(
+        bind=engine,
+        usuario_id=usuario.id,
+        phone_number=usuario.telefono,
+        message_text="Hoy salí a correr",
+        ai_response=AI_RESPONSE,
+    )
+
+
+def test_saves_conversation_mood_and_habits(db_session, test_usuario):
+    """Debe guardar conversación, ánimo y hábitos en una transacción"""
+    assert _save(test_usuario) is True
+
+    assert db_session.query(ConversacionContexto).count() == 1
+    assert db_session.query(EstadoAnimo).count() == 1
+    assert [h.nombre_habito for h in db_session.query(Habito)] == ["Correr"]
+
+
+def test_habit_failure_keeps_conversation(db_session, test_usuario, monkeypatch):
+    """Si fallan los hábitos, la conversación y el ánimo se guardan igual"""
+    def failing_habits(db, usuario_id, habits_mentioned, commit):
+        crud.create_habito(
+            db, habito=schemas.HabitoCreate(nombre_habito="Parcial", categoria="otro"),
+            usuario_id=usuario_id, commit=False
+        )
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(webhook_persistence, "create_or_update_habits", failing_habits)
+
+    assert _save(test_usuario) is True
+
+    assert db_session.query(ConversacionContexto).count() == 1
+    assert db_session.query(EstadoAnimo).count() == 1
+    # Lo que los hábitos alcanzaron a escribir se revierte con el savepoint
+    assert db_session.query(Habito).count() == 0
+
+
+def test_habit_db_error_keeps_conversation(db_session, test_usuario):
+    """Un error de BD dentro de los hábitos no invalida la transacción principal"""
+    def fail_habit_insert(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO habitos"):
+            raise IntegrityError(statement, parameters, Exception("forzado"))
+
+    event.listen(engine, "before_cursor_execute", fail_habit_insert)
+    try:
+        assert _save(test_usuario) is True
+    finally:
+        event.remove(engine, "before_cursor_execute", fail_habit_insert)
+
+    assert db_session.query(ConversacionContexto).count() == 1
+    assert db_session.query(Habito).count() == 0
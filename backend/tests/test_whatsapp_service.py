@@ -0,0 +1,67 @@
+"""
+Tests for WhatsApp service webhook signature verification
+"""
+import hashlib
+import hmac
+
+import pytest
+from app.core.config import settings
+from app.services.whatsapp_service import WhatsAppService
+
+
+@pytest.fixture
+def service(monkeypatch) -> WhatsAppService:
+    monkeypatch.setattr(settings, "WHATSAPP_VERIFY_TOKEN", "test-token")
+    return WhatsAppService()
+
+
+def _sign(payload: bytes, key: str = "test-token") -> str:
+    return "sha256=" + hmac.new(key.encode(), payload, hashlib.sha256).hexdigest()
+
+
+def test_verify_webhook_signature_valid(service: WhatsAppService):
+    """Test that a correctly signed body is accepted, repeatedly"""
+    payload = b'{"entry": [{"id": "1"}]}'
+    assert service.verify_webhook_signature(payload, _sign(payload)) is True
+    # The prepared HMAC must not carry state between calls
+    assert service.verify_webhook_signature(payload, _sign(payload)) is True
+
+
+def test_verify_webhook_signature_invalid(service: WhatsAppService):
+    """Test that tampered bodies, wrong keys and missing signatures are rejected"""
+    payload = b'{"entry": [{"id": "1"}]}'
+    assert service.verify_webhook_signature(b'{"entry": []}', _sign(payload)) is False
+    assert service.verify_webhook_signature(payload, _sign(payload, key="otra")) is False
+    assert service.verify_webhook_signature(payload, "") is False
+
+
+def test_verify_webhook_signature_without_token(monkeypatch):
+    """Test that verification fails closed when no token is configured"""
+    monkeypatch.setattr(settings, "WHATSAPP_VERIFY_TOKEN", None)
+    service = WhatsAppService()
+    payload = b"{}"
+    assert service.verify_webhook_signature(payload, _sign(payload)) is False
+
+
+def test_parse_webhook_message(service: WhatsAppService):
+    """Test parsing text messages and ignoring status updates and malformed bodies"""
+    value = {
+        "contacts": [{"profile": {"name": "Ana"}}],
+        "messages": [{"from": "5491100000000", "id": "wamid.1", "timestamp": "1", "type": "text", "text": {"body": "hola"}}],
+    }
+    parsed = service.parse_webhook_message({"entry": [{"changes": [{"value": value}]}]})
+    assert parsed == {
+        "phone_number": "5491100000000",
+        "message_text": "hola",
+        "message_id": "wamid.1",
+        "timestamp": "1",
+        "profile_name": "Ana",
+    }
+
+    del value["contacts"]
+    assert service.parse_webhook_message({"entry": [{"changes": [{"value": value}]}]})["profile_name"] is None
+
+    status_update = {"entry": [{"changes": [{"value": {"statuses": [{"id": "wamid.1"}]}}]}]}
+    assert service.parse_webhook_message(status_update) is None
+    assert service.parse_webhook_message({"entry": []}) is None
+    assert service.parse_webhook_message({}) is None